@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Benchmark the throughput of the GFF3 feature formatter.
+
+The annotation is loaded into memory before timing, so that only the
+formatter's processing time is measured. For example, for the RefSeq human
+annotation:
+
+    python dev/bench-format-gff3.py --source refseq \\
+        GCF_000001405.33_GRCh38.p7_genomic.gff.gz
+"""
+
+from __future__ import print_function
+import argparse
+import gzip
+from timeit import default_timer as timer
+import genhub
+
+
+def get_parser():
+    desc = 'Benchmark the throughput of the GFF3 feature formatter'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--source', default='refseq', choices=genhub.sources,
+                        help='data source; default is "refseq"')
+    parser.add_argument('-r', '--repeat', type=int, default=1, metavar='N',
+                        help='process the annotation N times in a row; '
+                        'default is 1')
+    parser.add_argument('-t', '--trials', type=int, default=3, metavar='T',
+                        help='report the best of T trials; default is 3')
+    parser.add_argument('gff3', help='annotation file (optionally gzipped)')
+    return parser
+
+
+def main(args):
+    openfunc = gzip.open if args.gff3.endswith('.gz') else open
+    with openfunc(args.gff3, 'rt') as instream:
+        lines = instream.readlines()
+    lines = lines * args.repeat
+
+    best = None
+    for _ in range(args.trials):
+        start = timer()
+        numlines = 0
+        for line in genhub.gff3.FeatureFormatter(lines, args.source):
+            numlines += 1
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print('%d lines in, %d lines out, %.3f seconds, %.0f lines/second' % (
+        len(lines), numlines, best, len(lines) / best))
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
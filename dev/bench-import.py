@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Benchmark the cold-start latency of GenHub.
+
+Each statement is run in a fresh Python interpreter, with the given GenHub
+source tree(s) at the front of the module search path; the interpreter's own
+startup time is reported separately as a baseline. To compare with an earlier
+version, check it out in a separate work tree. For example:
+
+    git worktree add /tmp/genhub-old v0.1
+    python dev/bench-import.py . /tmp/genhub-old
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+
+statements = [
+    'pass',
+    'import genhub',
+    'import genhub; genhub.fasta',
+    'import genhub; genhub.test_registry.genome("Amel")',
+]
+
+
+def get_parser():
+    desc = 'Benchmark the cold-start latency of GenHub'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('-t', '--trials', type=int, default=10, metavar='T',
+                        help='report the best of T trials; default is 10')
+    parser.add_argument('-s', '--stmt', action='append', metavar='S',
+                        help='statement to time; can be specified multiple '
+                        'times; by default, a few representative statements '
+                        'are timed')
+    parser.add_argument('srcdir', nargs='*', default=['.'],
+                        help='GenHub source tree(s); default is the current '
+                        'directory')
+    return parser
+
+
+def best_time(stmt, srcdir, trials):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.abspath(srcdir)
+    cmd = [sys.executable, '-c', stmt]
+    best = None
+    for _ in range(trials):
+        start = timer()
+        subprocess.check_call(cmd, env=env, cwd=srcdir)
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(args):
+    stmts = args.stmt if args.stmt else statements
+    for srcdir in args.srcdir:
+        print('==>', srcdir)
+        for stmt in stmts:
+            elapsed = best_time(stmt, srcdir, args.trials)
+            print('%8.1f ms    %s' % (elapsed * 1000, stmt))
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
@@ -9,51 +9,33 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
-"""Package-wide configuration"""
+"""
+Package-wide configuration
+
+Submodules are imported on first access (for example, `genhub.fasta`) rather
+than when the package is imported, as are the `dbtype` table, the package
+`__version__`, and the registries used as unit test fixtures. On Python
+versions that do not support module-level `__getattr__` (PEP 562), all of
+these are loaded eagerly.
+"""
 
-# Package modules
 from __future__ import print_function
-from . import registry
-from . import download
-from . import fasta
-from . import cdhit
-from . import genomedb
-from . import refseq
-from . import crg
-from . import hymbase
-from . import tair
-from . import generic
-from . import iloci
-from . import proteins
-from . import mrnas
-from . import exons
-from . import stats
+import importlib
+import sys
 try:
     FileNotFoundError
 except NameError:  # pragma: no cover
     FileNotFoundError = IOError
 
-# Custom modules
-from . import am10
-from . import pdom
-
-# Versioneer
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
-
-
-# Unit test fixtures (can't figure out how to do package-scope global fixtures
-# with nose's setup and teardown mechanism).
-test_registry = registry.Registry()
-test_registry_supp = registry.Registry()
-try:
-    # This will only work when the current working directory is the GenHub
-    # root directory. Fine since it's only for development.
-    test_registry_supp.update('testdata/conf')
-except FileNotFoundError:  # pragma: no cover
-    pass
 
+submodules = [
+    'registry', 'checksum', 'compress', 'cache', 'download', 'fasta',
+    'composition', 'extract', 'gff3', 'cdhit', 'genomedb', 'refseq', 'crg',
+    'hymbase', 'tair', 'generic', 'iloci', 'proteins', 'mrnas', 'exons',
+    'stats', 'summary', 'build',
+    # Custom modules
+    'am10', 'pdom',
+]
 
 sources = {
     'refseq': 'NCBI RefSeq',
@@ -67,14 +49,76 @@ sources = {
     'local': 'user-supplied genome (local file system)'
 }
 
-dbtype = {
-    'refseq': refseq.RefSeqDB,
-    'genbank': refseq.GenbankDB,
-    'beebase': hymbase.BeeBaseDB,
-    'crg': crg.CrgDB,
-    'hymbase': hymbase.HymBaseDB,
-    'pdom': pdom.PdomDB,
-    'tair': tair.TairDB,
-    'am10': am10.Am10DB,
-    'local': generic.GenericDB,
+dbtypes = {
+    'refseq': ('refseq', 'RefSeqDB'),
+    'genbank': ('refseq', 'GenbankDB'),
+    'beebase': ('hymbase', 'BeeBaseDB'),
+    'crg': ('crg', 'CrgDB'),
+    'hymbase': ('hymbase', 'HymBaseDB'),
+    'pdom': ('pdom', 'PdomDB'),
+    'tair': ('tair', 'TairDB'),
+    'am10': ('am10', 'Am10DB'),
+    'local': ('generic', 'GenericDB'),
+}
+
+
+def load_dbtype():
+    """Map each data source to its `GenomeDB` subclass."""
+    dbtype = dict()
+    for source, (modname, classname) in dbtypes.items():
+        module = importlib.import_module('.' + modname, __name__)
+        dbtype[source] = getattr(module, classname)
+    return dbtype
+
+
+def load_version():
+    """Retrieve the package version from Versioneer."""
+    from ._version import get_versions
+    return get_versions()['version']
+
+
+def load_test_registry():
+    """Registry of the default genome configs, for unit testing."""
+    from . import registry
+    return registry.Registry()
+
+
+def load_test_registry_supp():
+    """Registry supplemented with the unit test genome configs."""
+    from . import registry
+    test_registry_supp = registry.Registry()
+    try:
+        # This will only work when the current working directory is the GenHub
+        # root directory. Fine since it's only for development.
+        test_registry_supp.update('testdata/conf')
+    except FileNotFoundError:  # pragma: no cover
+        pass
+    return test_registry_supp
+
+
+lazyattrs = {
+    'dbtype': load_dbtype,
+    '__version__': load_version,
+    'test_registry': load_test_registry,
+    'test_registry_supp': load_test_registry_supp,
 }
+
+
+def __getattr__(name):
+    """Import submodules and compute package attributes on first access."""
+    if name in submodules:
+        return importlib.import_module('.' + name, __name__)
+    if name in lazyattrs:
+        value = lazyattrs[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + submodules + list(lazyattrs))
+
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    for _name in submodules + list(lazyattrs):
+        globals()[_name] = __getattr__(_name)
@@ -14,7 +14,6 @@ from __future__ import print_function
 import filecmp
 import gzip
 import re
-import subprocess
 import sys
 import genhub
 
@@ -57,29 +56,14 @@ class Am10DB(genhub.genomedb.GenomeDB):
             print(line, end='', file=outstream)
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
-        cmds = list()
-        cmds.append('gunzip -c %s' % self.gff3path)
-        cmds.append('genhub-glean-to-gff3.py')
-        cmds.append('tidygff3')
-        cmds.append('genhub-format-gff3.py --source am10 -')
-        cmds.append('seq-reg.py - %s' % self.gdnafile)
-        cmds.append('gt gff3 -sort -tidy -o %s -force' % self.gff3file)
-
-        commands = ' | '.join(cmds)
-        if debug:  # pragma: no cover
-            print('DEBUG: running command: %s' % commands, file=logstream)
-        proc = subprocess.Popen(commands, shell=True, universal_newlines=True,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):  # pragma: no cover
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               'illegal uppercase attribute "Shift"' not in line and \
-               'has the wrong phase' not in line and \
-               line != '':
-                print(line, file=logstream)
-        assert proc.returncode == 0, \
-            'annot cleanup command failed: %s' % commands
+        pipeline = genhub.gff3.Pipeline()
+        pipeline.add('glean2gff3', genhub.gff3.glean_to_gff3)
+        pipeline.add_command('tidygff3', ['tidygff3'])
+        pipeline.add('format', genhub.gff3.format_features, 'am10', True)
+        pipeline.add('seq-reg', genhub.gff3.sequence_regions,
+                     self.sequence_lengths())
+        ignore = ['illegal uppercase attribute "Shift"', 'has the wrong phase']
+        self.run_gff3_pipeline(pipeline, ignore, logstream)
 
     def gff3_protids(self, instream):
         for line in instream:
@@ -89,40 +73,6 @@ class Am10DB(genhub.genomedb.GenomeDB):
             assert namematch, 'cannot parse mRNA name: ' + line
             yield namematch.group(1)
 
-    def protein_mapping(self, instream):
-        locusid2name = dict()
-        gene2loci = dict()
-        for line in instream:
-            fields = line.split('\t')
-            if len(fields) != 9:
-                continue
-            feattype = fields[2]
-            attrs = fields[8]
-
-            if feattype == 'locus':
-                idmatch = re.search('ID=([^;\n]+);.*Name=([^;\n]+)', attrs)
-                if idmatch:
-                    locusid = idmatch.group(1)
-                    locusname = idmatch.group(2)
-                    locusid2name[locusid] = locusname
-            elif feattype == 'gene':
-                idmatch = re.search('ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                assert idmatch, \
-                    'Unable to parse gene and iLocus IDs: %s' % attrs
-                geneid = idmatch.group(1)
-                ilocusid = idmatch.group(2)
-                gene2loci[geneid] = ilocusid
-            elif feattype == 'mRNA':
-                pattern = 'Parent=([^;\n]+);.*Name=([^;\n]+)'
-                idmatch = re.search(pattern, attrs)
-                assert idmatch, \
-                    'Unable to parse mRNA and gene IDs: %s' % attrs
-                protid = idmatch.group(2)
-                geneid = idmatch.group(1)
-                locusid = gene2loci[geneid]
-                locusname = locusid2name[locusid]
-                yield protid, locusname
-
 
 # -----------------------------------------------------------------------------
 # Unit tests
@@ -0,0 +1,673 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Incremental builds for genome databases.
+
+Each build task (`download`, `prep`, `iloci`, and so on) is broken down into a
+series of steps, each of which declares the files it reads and writes. When a
+step completes, the size, modification time, and SHA1 checksum of each of its
+input and output files is recorded in a build state file in the genome's
+working directory (along with a checksum of any parameters that affect the
+step's output). A step is skipped in subsequent builds if its parameters are
+unchanged and all of its input and output files are identical to the recorded
+versions.
+
+Files whose size and modification time match the recorded values are assumed
+to be unchanged, so checksums are only recomputed for files that have been
+touched. A step that re-creates a file with identical content does not trigger
+a rebuild of the steps that depend on that file.
+
+Steps are scheduled by their dependencies (a step depends on any earlier step
+that writes one of its input files), so that independent steps of the same
+genome can run concurrently. The steps of all genomes share a single pool of
+worker processes.
+"""
+
+from __future__ import print_function
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import genhub
+
+
+class BuildStep(object):
+    """
+    A single step in a build task.
+
+    A `final` step (such as cleanup) runs after all other steps of its genome,
+    and runs every time: its inputs and outputs are not tracked.
+    """
+
+    def __init__(self, name, func, inputs=None, outputs=None, params=None,
+                 final=False):
+        self.name = name
+        self.func = func
+        self.inputs = inputs if inputs is not None else list()
+        self.outputs = outputs if outputs is not None else list()
+        self.params = params if params is not None else dict()
+        self.final = final
+
+    @property
+    def paramsum(self):
+        """Checksum of the step's parameters."""
+        data = json.dumps(self.params, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def download(db):
+    """Download task wrapper; a module-level function can be pickled."""
+    db.download()
+
+
+def preprocess(db, datatype, strict=True):
+    """Prep task wrapper; a module-level function can be pickled."""
+    db.preprocess(datatype, strict=strict)
+
+
+def cleanup(db, keep=None, fullclean=False):
+    """Cleanup task wrapper; a module-level function can be pickled."""
+    db.cleanup(keep, fullclean)
+
+
+def task_steps(db, task, delta=500, ilcformat='{}ILC-%05lu', strict=True,
+               keep=None, fullclean=False):
+    """
+    Define the steps of the given build task for a genome database.
+
+    The steps are listed in the order in which they must be run.
+    """
+    def fp(suffix):
+        return db.file_path('%s.%s' % (db.label, suffix))
+
+    steps = list()
+    if task == 'download':
+        steps.append(BuildStep(
+            'download', functools.partial(download, db),
+            outputs=[db.gdnapath, db.gff3path, db.protpath],
+            params={'config': db.config}
+        ))
+    elif task == 'prep':
+        params = {'config': db.config}
+        if db.compress_processed:
+            params['compress'] = True
+        steps.append(BuildStep(
+            'prep.gdna',
+            functools.partial(preprocess, db, 'gdna', strict=strict),
+            inputs=[db.gdnapath], outputs=[db.gdnafile, db.seqlentable],
+            params=params
+        ))
+        steps.append(BuildStep(
+            'prep.gff3',
+            functools.partial(preprocess, db, 'gff3', strict=strict),
+            inputs=[db.gff3path, db.seqlentable], outputs=[db.gff3file],
+            params={'config': db.config}
+        ))
+        steps.append(BuildStep(
+            'prep.prot',
+            functools.partial(preprocess, db, 'prot', strict=strict),
+            inputs=[db.protpath], outputs=[db.protfile],
+            params={'config': db.config}
+        ))
+    elif task == 'iloci':
+        steps.append(BuildStep(
+            'iloci.intervals',
+            functools.partial(genhub.iloci.intervals, db, delta=delta,
+                              ilcformat=ilcformat),
+            inputs=[fp('gff3')],
+            outputs=[fp('iloci.gff3'), fp('miloci.gff3'),
+                     db.file_path('ilens.temp')],
+            params={'delta': delta, 'ilcformat': ilcformat}
+        ))
+        steps.append(BuildStep(
+            'iloci.simple', functools.partial(genhub.iloci.simple, db),
+            inputs=[fp('iloci.gff3')], outputs=[fp('simple-iloci.txt')]
+        ))
+        steps.append(BuildStep(
+            'iloci.representatives',
+            functools.partial(genhub.iloci.representatives, db),
+            inputs=[fp('iloci.gff3')],
+            outputs=[fp('ilocus.mrnas.gff3'), fp('ilocus.mrnas.tsv')]
+        ))
+        steps.append(BuildStep(
+            'iloci.sequences', functools.partial(genhub.iloci.sequences, db),
+            inputs=[fp('gdna.fa'), fp('iloci.gff3'), fp('miloci.gff3')],
+            outputs=[fp('iloci.fa'), fp('miloci.fa')]
+        ))
+        steps.append(BuildStep(
+            'iloci.ancillary', functools.partial(genhub.iloci.ancillary, db),
+            inputs=[db.file_path('ilens.temp'), fp('iloci.gff3'),
+                    fp('ilocus.mrnas.tsv')],
+            outputs=[fp('ilens.tsv'), fp('filens.tsv'), fp('mrnas.txt')]
+        ))
+    elif task == 'breakdown':
+        steps.append(BuildStep(
+            'proteins.ids', functools.partial(genhub.proteins.ids, db),
+            inputs=[fp('ilocus.mrnas.gff3')], outputs=[fp('protids.txt')]
+        ))
+        steps.append(BuildStep(
+            'proteins.sequences',
+            functools.partial(genhub.proteins.sequences, db),
+            inputs=[fp('protids.txt'), fp('all.prot.fa')],
+            outputs=[fp('prot.fa')]
+        ))
+        steps.append(BuildStep(
+            'proteins.mapping', functools.partial(genhub.proteins.mapping, db),
+            inputs=[fp('iloci.gff3')], outputs=[fp('protein2ilocus.tsv')]
+        ))
+        steps.append(BuildStep(
+            'proteins.mapping.repr',
+            functools.partial(genhub.proteins.mapping, db, only_reps=True),
+            inputs=[fp('iloci.gff3'), fp('protids.txt')],
+            outputs=[fp('protein2ilocus.repr.tsv')]
+        ))
+        steps.append(BuildStep(
+            'mrnas.mature_mrna_intervals',
+            functools.partial(genhub.mrnas.mature_mrna_intervals, db),
+            inputs=[fp('gff3'), fp('ilocus.mrnas.gff3')],
+            outputs=[fp('mrnas.temp'), fp('ilocus.mrnas.temp'),
+                     fp('all.mrnas.gff3'), fp('mrnas.gff3')]
+        ))
+        steps.append(BuildStep(
+            'mrnas.sequences', functools.partial(genhub.mrnas.sequences, db),
+            inputs=[fp('gdna.fa'), fp('gff3'), fp('all.mrnas.gff3'),
+                    fp('mrnas.txt')],
+            outputs=[fp('all.pre-mrnas.fa'), fp('all.mrnas.fa'),
+                     fp('pre-mrnas.fa'), fp('mrnas.fa')]
+        ))
+        steps.append(BuildStep(
+            'exons.feature_sequences',
+            functools.partial(genhub.exons.prepare, db),
+            inputs=[fp('gdna.fa'), fp('gff3'), fp('ilocus.mrnas.gff3')],
+            outputs=[fp('all.cds.fa'), fp('cds.fa'), fp('exons.fa'),
+                     fp('introns.fa')]
+        ))
+    elif task == 'stats':
+        for group in genhub.stats.section_groups():
+            names = [section[0] for section in group]
+            inputs = list()
+            for name, gff3suffix, fastasuffix, outsuffix in group:
+                for suffix in [gff3suffix, fastasuffix]:
+                    if fp(suffix) not in inputs:
+                        inputs.append(fp(suffix))
+            steps.append(BuildStep(
+                'stats.%s' % '+'.join(names),
+                functools.partial(genhub.stats.compute, db, names=names),
+                inputs=inputs, outputs=genhub.stats.outputs(db, names)
+            ))
+    elif task == 'cleanup':
+        steps.append(BuildStep(
+            'cleanup', functools.partial(cleanup, db, keep, fullclean),
+            final=True
+        ))
+    else:
+        raise ValueError('unsupported build task "%s"' % task)
+    return steps
+
+
+def file_signature(db, filename, known=None):
+    """
+    Compute the signature of the given file.
+
+    If the file's size and modification time match those of the `known`
+    signature, its checksum is re-used rather than recomputed. Returns `None`
+    if the file does not exist.
+    """
+    if not os.path.exists(filename):
+        return None
+    stat = os.stat(filename)
+    sig = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if known and known['size'] == sig['size'] and \
+            known['mtime'] == sig['mtime']:
+        sig['sha1'] = known['sha1']
+    else:
+        sig['sha1'] = db.file_sha1(filename)
+    return sig
+
+
+def step_signatures(db, step, known=None):
+    """Compute the signatures of a completed step's input and output files."""
+    if known is None:
+        known = dict()
+    signatures = dict()
+    for key, filenames in [('inputs', step.inputs),
+                           ('outputs', step.outputs)]:
+        signatures[key] = dict()
+        for filename in filenames:
+            sig = file_signature(db, filename, known.get(filename))
+            assert sig is not None, \
+                'step "%s": file "%s" not found' % (step.name, filename)
+            signatures[key][filename] = sig
+    return signatures
+
+
+def execute(db, step, known=None):
+    """
+    Run a build step and compute the signatures of its files.
+
+    This function is invoked in worker processes, and the signatures are
+    returned to the parent process for recording.
+    """
+    step.func()
+    return step_signatures(db, step, known)
+
+
+class BuildGraph(object):
+    """
+    Track the state of build steps for a genome database.
+
+    Set `force` to true to run every step regardless of its recorded state.
+    """
+
+    def __init__(self, db, statefile=None, force=False, logstream=sys.stderr):
+        self.db = db
+        self.force = force
+        self.logstream = logstream
+        self.statefile = statefile
+        if self.statefile is None:
+            self.statefile = db.file_path('%s.build.json' % db.label)
+        self.steps = dict()
+        if os.path.exists(self.statefile):
+            with open(self.statefile, 'r') as instream:
+                self.steps = json.load(instream)
+
+        # The most recent signature of each file, for re-using checksums
+        self.known = dict()
+        for record in self.steps.values():
+            self.known.update(record['inputs'])
+            self.known.update(record['outputs'])
+
+    def save(self):
+        """Write the build state to disk."""
+        statedir = os.path.dirname(os.path.abspath(self.statefile))
+        if not os.path.isdir(statedir):
+            os.makedirs(statedir)
+        tempstate = '%s.%d.tmp' % (self.statefile, os.getpid())
+        with open(tempstate, 'w') as outstream:
+            json.dump(self.steps, outstream, indent=2, sort_keys=True)
+        os.rename(tempstate, self.statefile)
+
+    def signature(self, filename):
+        sig = file_signature(self.db, filename, self.known.get(filename))
+        if sig is not None:
+            self.known[filename] = sig
+        return sig
+
+    def known_signatures(self, step):
+        """Known signatures of a step's files, for use in worker processes."""
+        known = dict()
+        for filename in step.inputs + step.outputs:
+            if filename in self.known:
+                known[filename] = self.known[filename]
+        return known
+
+    def uptodate(self, step):
+        """Determine whether a step can be skipped."""
+        if self.force or step.name not in self.steps:
+            return False
+        record = self.steps[step.name]
+        if record['params'] != step.paramsum:
+            return False
+        for key, filenames in [('inputs', step.inputs),
+                               ('outputs', step.outputs)]:
+            if sorted(record[key]) != sorted(filenames):
+                return False
+            for filename in filenames:
+                recorded = record[key][filename]
+                sig = self.signature(filename)
+                if sig is None or sig['sha1'] != recorded['sha1']:
+                    return False
+                recorded.update(sig)
+        return True
+
+    def skip(self, step):
+        """
+        Check whether a step is up-to-date, logging if so.
+
+        If the step is not up-to-date, its record is discarded in preparation
+        for running it.
+        """
+        if self.uptodate(step):
+            if self.logstream is not None:  # pragma: no cover
+                logmsg = '[GenHub: %s] ' % self.db.config['species']
+                logmsg += 'step "%s" is up-to-date, skipping' % step.name
+                print(logmsg, file=self.logstream)
+            self.save()
+            return True
+        if step.name in self.steps:
+            del self.steps[step.name]
+            self.save()
+        return False
+
+    def record(self, step, signatures=None):
+        """Record the state of a completed step."""
+        if signatures is None:
+            signatures = step_signatures(self.db, step,
+                                         self.known_signatures(step))
+        record = {'params': step.paramsum}
+        for key in ['inputs', 'outputs']:
+            record[key] = signatures[key]
+            self.known.update(signatures[key])
+        self.steps[step.name] = record
+        self.save()
+
+    def run(self, step):
+        """Run a step if it is not up-to-date; returns true if it ran."""
+        if step.final:
+            step.func()
+            return True
+        if self.skip(step):
+            return False
+        step.func()
+        self.record(step)
+        return True
+
+
+class BuildScheduler(object):
+    """
+    Run the build steps of one or more genome databases.
+
+    Each step is launched as soon as all of the steps that write its input
+    files have completed, so independent steps run concurrently. Final steps
+    (such as cleanup) are run in the current process as soon as all other
+    steps of their genome have completed. A single
+    pool of `numprocs` worker processes is shared by all genomes: when there
+    are many genomes, their steps are interleaved; when there is only one,
+    all processors are available to it. With `numprocs=1`, steps are run in
+    the current process.
+    """
+
+    def __init__(self, numprocs=1, poll=0.1):
+        self.numprocs = numprocs
+        self.poll = poll
+        self.jobs = list()
+
+    def add(self, graph, steps):
+        """Add the steps of a genome database to the schedule."""
+        first = len(self.jobs)
+        for step in steps:
+            deps = set()
+            for i in range(first, len(self.jobs)):
+                if step.final or \
+                        set(step.inputs) & set(self.jobs[i][1].outputs):
+                    deps.add(i)
+            self.jobs.append((graph, step, deps))
+
+    def ready(self, pending, done):
+        """Retrieve the next job whose dependencies have all completed."""
+        for i in pending:
+            if self.jobs[i][2] <= done:
+                return i
+        return None
+
+    def run(self):
+        pool = None
+        if self.numprocs > 1:
+            pool = multiprocessing.Pool(processes=self.numprocs)
+        pending = list(range(len(self.jobs)))
+        done = set()
+        running = dict()
+        failure = None
+        try:
+            while (failure is None and len(pending) > 0) or len(running) > 0:
+                while failure is None and len(running) < self.numprocs:
+                    i = self.ready(pending, done)
+                    if i is None:
+                        break
+                    pending.remove(i)
+                    graph, step, deps = self.jobs[i]
+                    if step.final:
+                        step.func()
+                        done.add(i)
+                    elif graph.skip(step):
+                        done.add(i)
+                    elif pool is None:
+                        step.func()
+                        graph.record(step)
+                        done.add(i)
+                    else:
+                        known = graph.known_signatures(step)
+                        running[i] = pool.apply_async(execute,
+                                                      (graph.db, step, known))
+
+                finished = [i for i in running if running[i].ready()]
+                if len(finished) == 0 and len(running) > 0:
+                    time.sleep(self.poll)
+                for i in finished:
+                    graph, step, deps = self.jobs[i]
+                    try:
+                        graph.record(step, running.pop(i).get())
+                        done.add(i)
+                    except Exception as e:
+                        if failure is None:
+                            failure = e
+            if failure is not None:
+                raise failure
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_incremental():
+    """Build: skip up-to-date steps"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        conf = {'gdna': None, 'gff3': None, 'prot': None, 'source': 'local',
+                'species': 'Test'}
+        db = genhub.generic.GenericDB('Test', conf, workdir=tempdir)
+        os.makedirs(db.dbdir)
+        infile = db.file_path('in.txt')
+        midfile = db.file_path('mid.txt')
+        outfile = db.file_path('out.txt')
+        with open(infile, 'w') as outstream:
+            print('Hello', file=outstream)
+
+        runs = list()
+
+        def upper():
+            runs.append('upper')
+            with open(infile, 'r') as instream, \
+                    open(midfile, 'w') as outstream:
+                outstream.write(instream.read().upper())
+
+        def count():
+            runs.append('count')
+            with open(midfile, 'r') as instream, \
+                    open(outfile, 'w') as outstream:
+                print(len(instream.read()), file=outstream)
+
+        def build(force=False):
+            graph = BuildGraph(db, force=force, logstream=None)
+            graph.run(BuildStep('upper', upper, [infile], [midfile]))
+            graph.run(BuildStep('count', count, [midfile], [outfile]))
+
+        build()
+        assert runs == ['upper', 'count']
+        statefile = db.file_path('Test.build.json')
+        assert os.stat(statefile).st_mode & 0o777 == \
+            os.stat(infile).st_mode & 0o777
+
+        runs = list()
+        build()
+        assert runs == []
+
+        # Re-writing a file with identical content
+        os.utime(infile, (0, 0))
+        runs = list()
+        build()
+        assert runs == []
+
+        # Changed content triggers a rebuild of downstream steps
+        with open(infile, 'w') as outstream:
+            print('Hello, World!', file=outstream)
+        runs = list()
+        build()
+        assert runs == ['upper', 'count']
+
+        # Changed content that produces identical output stops propagating
+        with open(infile, 'w') as outstream:
+            print('hello, world!', file=outstream)
+        runs = list()
+        build()
+        assert runs == ['upper']
+
+        # Missing or modified outputs
+        os.unlink(outfile)
+        runs = list()
+        build()
+        assert runs == ['count']
+        with open(midfile, 'a') as outstream:
+            print('Bogus', file=outstream)
+        runs = list()
+        build()
+        assert runs == ['upper']
+
+        # Changed parameters
+        runs = list()
+        graph = BuildGraph(db, logstream=None)
+        graph.run(BuildStep('upper', upper, [infile], [midfile],
+                            {'delta': 200}))
+        assert runs == ['upper']
+
+        runs = list()
+        build(force=True)
+        assert runs == ['upper', 'count']
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_task_steps():
+    """Build: task step definitions"""
+    db = genhub.test_registry.genome('Bdis', workdir='testdata/demo-workdir')
+    names = list()
+    for task in ['download', 'prep', 'iloci', 'breakdown', 'stats']:
+        names.extend([step.name for step in task_steps(db, task)])
+    assert names == [
+        'download', 'prep.gdna', 'prep.gff3', 'prep.prot', 'iloci.intervals',
+        'iloci.simple', 'iloci.representatives', 'iloci.sequences',
+        'iloci.ancillary', 'proteins.ids', 'proteins.sequences',
+        'proteins.mapping', 'proteins.mapping.repr',
+        'mrnas.mature_mrna_intervals', 'mrnas.sequences',
+        'exons.feature_sequences', 'stats.iloci', 'stats.miloci',
+        'stats.prnas+cds+exons+introns', 'stats.mrnas'
+    ], names
+
+    steps = task_steps(db, 'iloci', delta=300)
+    assert steps[0].inputs == ['testdata/demo-workdir/Bdis/Bdis.gff3']
+    assert steps[0].paramsum != task_steps(db, 'iloci')[0].paramsum
+    assert steps[1].paramsum == task_steps(db, 'iloci')[1].paramsum
+
+    steps = task_steps(db, 'cleanup', keep=['iloci'])
+    assert [step.name for step in steps] == ['cleanup']
+    assert steps[0].final and steps[0].inputs == []
+
+    checkfailed = False
+    try:
+        task_steps(db, 'cluster')
+    except ValueError as e:
+        checkfailed = True
+        assert 'unsupported build task "cluster"' in str(e)
+    assert checkfailed
+
+
+def test_scheduler():
+    """Build: schedule steps by dependencies"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        dbs = list()
+        for label in ['Alpha', 'Beta']:
+            conf = {'gdna': None, 'gff3': None, 'prot': None,
+                    'source': 'local', 'species': label}
+            db = genhub.generic.GenericDB(label, conf, workdir=tempdir)
+            os.makedirs(db.dbdir)
+            with open(db.file_path('a.txt'), 'w') as outstream:
+                print(label, file=outstream)
+            dbs.append(db)
+
+        def steps(db):
+            filenames = ['a.txt', 'b.txt', 'c.txt', 'd.txt']
+            a, b, c, d = [db.file_path(f) for f in filenames]
+            return [
+                BuildStep('b', functools.partial(shutil.copy, a, b), [a], [b]),
+                BuildStep('c', functools.partial(shutil.copy, a, c), [a], [c]),
+                BuildStep('d', functools.partial(shutil.copy, b, d), [b], [d]),
+            ]
+
+        scheduler = BuildScheduler(numprocs=2, poll=0.01)
+        for db in dbs:
+            scheduler.add(BuildGraph(db, logstream=None), steps(db))
+        assert [job[2] for job in scheduler.jobs] == [set(), set(), {0},
+                                                      set(), set(), {3}]
+        scheduler.run()
+        for db in dbs:
+            with open(db.file_path('d.txt'), 'r') as instream:
+                assert instream.read().strip() == db.label
+            graph = BuildGraph(db, logstream=None)
+            assert sorted(graph.steps) == ['b', 'c', 'd']
+            assert graph.uptodate(steps(db)[2])
+
+        # Serial run in the current process; only changed steps are re-run
+        with open(dbs[1].file_path('a.txt'), 'w') as outstream:
+            print('Gamma', file=outstream)
+        runs = list()
+        scheduler = BuildScheduler(numprocs=1)
+        for db in dbs:
+            graph = BuildGraph(db, logstream=None)
+            dbsteps = steps(db)
+            for step in dbsteps:
+                step.func = functools.partial(
+                    lambda f, n: runs.append(n) or f(), step.func,
+                    db.label + step.name
+                )
+            scheduler.add(graph, dbsteps)
+        scheduler.run()
+        assert runs == ['Betab', 'Betac', 'Betad'], runs
+        with open(dbs[1].file_path('d.txt'), 'r') as instream:
+            assert instream.read().strip() == 'Gamma'
+
+        # Final steps run after all other steps of their genome, every time
+        runs = list()
+        scheduler = BuildScheduler(numprocs=2, poll=0.01)
+        for db in dbs:
+            record = functools.partial(runs.append, db.label)
+            final = BuildStep('final', record, final=True)
+            scheduler.add(BuildGraph(db, logstream=None), steps(db) + [final])
+        assert scheduler.jobs[3][2] == {0, 1, 2}
+        assert scheduler.jobs[7][2] == {4, 5, 6}
+        scheduler.run()
+        assert runs == ['Alpha', 'Beta']
+        assert 'final' not in BuildGraph(dbs[0], logstream=None).steps
+
+        # Failed steps are not recorded, and their dependents are not run
+        os.unlink(dbs[0].file_path('a.txt'))
+        scheduler = BuildScheduler(numprocs=2, poll=0.01)
+        graph = BuildGraph(dbs[0], force=True, logstream=None)
+        scheduler.add(graph, steps(dbs[0]))
+        checkfailed = False
+        try:
+            scheduler.run()
+        except (IOError, OSError):
+            checkfailed = True
+        assert checkfailed
+        graph = BuildGraph(dbs[0], logstream=None)
+        assert sorted(graph.steps) == ['d']
+    finally:
+        shutil.rmtree(tempdir)
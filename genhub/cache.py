@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Content-addressed cache of downloaded data files.
+
+Each file in the cache is stored under its SHA1 checksum, and an index maps
+each download (URL(s) and compression setting) to the checksum of its
+contents. Files are hard linked from the cache into working directories rather
+than copied (falling back to a copy if the cache is on a different file
+system), so that any number of working directories on a host share a single
+copy of each file. Cached files are made read-only, since they may be linked
+into several places.
+
+The cache directory has the following layout.
+- `objects/ab/abcdef...`: file contents, by SHA1 checksum
+- `downloads/0123ab...`: checksum of the contents of each download, stored in
+  a file named by the SHA1 of the download's URL(s) and compression setting
+
+Cached downloads are not revalidated against the remote server: a download is
+retrieved from the cache for as long as it is indexed. To pick up remote
+changes, download the file again and `add` it, which re-points the index at
+the new contents (`fidibus --rebuild` does this for all data files).
+"""
+
+from __future__ import print_function
+import hashlib
+import json
+import os
+import shutil
+import stat
+import genhub
+
+
+def link_file(source, dest):
+    """
+    Hard link `source` to `dest`, replacing `dest` if it exists.
+
+    The file is copied if it cannot be linked. Returns True if the file was
+    linked, False if it was copied.
+    """
+    tempdest = '%s.%d.tmp' % (dest, os.getpid())
+    try:
+        os.link(source, tempdest)
+        linked = True
+    except OSError:
+        shutil.copy2(source, tempdest)
+        linked = False
+    os.rename(tempdest, dest)
+    return linked
+
+
+class DownloadCache(object):
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+    def object_path(self, sha1):
+        return '%s/objects/%s/%s' % (self.cachedir, sha1[:2], sha1)
+
+    def index_path(self, urldata, compress=False):
+        urls = urldata
+        if isinstance(urldata, str):
+            urls = [urldata]
+        key = json.dumps([urls, bool(compress)]).encode('utf-8')
+        keysha1 = hashlib.sha1(key).hexdigest()
+        return '%s/downloads/%s' % (self.cachedir, keysha1)
+
+    def lookup(self, urldata, compress=False):
+        """Return the checksum of a cached download, or None if not cached."""
+        indexfile = self.index_path(urldata, compress)
+        if not os.path.exists(indexfile):
+            return None
+        with open(indexfile, 'r') as instream:
+            sha1 = instream.read().strip()
+        if not os.path.exists(self.object_path(sha1)):
+            return None
+        return sha1
+
+    def retrieve(self, urldata, localpath, compress=False):
+        """
+        Link a cached download into place.
+
+        Returns True if the download was retrieved from the cache, False if it
+        is not cached.
+        """
+        sha1 = self.lookup(urldata, compress)
+        if sha1 is None:
+            return False
+        link_file(self.object_path(sha1), localpath)
+        genhub.checksum.write_manifest(localpath, sha1)
+        return True
+
+    def add(self, urldata, localpath, compress=False):
+        """
+        Add a downloaded file to the cache.
+
+        If the cache already contains a file with the same contents, the local
+        file is replaced with a link to the cached file.
+        """
+        sha1 = genhub.checksum.file_sha1(localpath, record=True)
+        objectfile = self.object_path(sha1)
+        if os.path.exists(objectfile):
+            if not os.path.samefile(objectfile, localpath):
+                link_file(objectfile, localpath)
+                genhub.checksum.write_manifest(localpath, sha1)
+        else:
+            objectdir = os.path.dirname(objectfile)
+            if not os.path.isdir(objectdir):
+                os.makedirs(objectdir)
+            tempobject = '%s.%d.tmp' % (objectfile, os.getpid())
+            link_file(localpath, tempobject)
+            os.chmod(tempobject, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.rename(tempobject, objectfile)
+
+        indexfile = self.index_path(urldata, compress)
+        indexdir = os.path.dirname(indexfile)
+        if not os.path.isdir(indexdir):
+            os.makedirs(indexdir)
+        tempindex = '%s.%d.tmp' % (indexfile, os.getpid())
+        with open(tempindex, 'w') as outstream:
+            print(sha1, file=outstream)
+        os.rename(tempindex, indexfile)
+        return sha1
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_cache():
+    """Cache: add and retrieve downloads"""
+    import tempfile
+    tempdir = tempfile.mkdtemp()
+    try:
+        cache = DownloadCache(tempdir + '/cache')
+        url = 'https://example.org/seqs.fa'
+        os.mkdir(tempdir + '/wd1')
+        os.mkdir(tempdir + '/wd2')
+        localpath1 = tempdir + '/wd1/seqs.fa'
+        localpath2 = tempdir + '/wd2/seqs.fa'
+        assert cache.lookup(url) is None
+        assert cache.retrieve(url, localpath1) is False
+
+        with open(localpath1, 'w') as outstream:
+            print('>seq1\nACGT', file=outstream)
+        sha1 = cache.add(url, localpath1)
+        assert sha1 == '062ed6891f3705a1fcd16273d832b2e5207687b9', sha1
+        assert cache.lookup(url) == sha1
+        assert cache.lookup(url, compress=True) is None
+        assert cache.lookup([url]) == sha1
+
+        assert cache.retrieve(url, localpath2) is True
+        assert os.path.samefile(localpath1, localpath2)
+        assert os.path.samefile(localpath2, cache.object_path(sha1))
+        assert genhub.checksum.read_manifest(localpath2) == sha1
+
+        # Same contents from a different download: shares the cached copy
+        localpath3 = tempdir + '/wd2/seqs.copy.fa'
+        shutil.copy(localpath1, localpath3)
+        assert not os.path.samefile(localpath1, localpath3)
+        assert cache.add(url + '.copy', localpath3) == sha1
+        assert os.path.samefile(localpath1, localpath3)
+        assert len(os.listdir(tempdir + '/cache/downloads')) == 2
+
+        # Refreshed download: index points to the new contents
+        newpath = tempdir + '/wd1/seqs.fa.part'
+        with open(newpath, 'w') as outstream:
+            print('>seq1\nACGTACGT', file=outstream)
+        os.rename(newpath, localpath1)
+        newsha1 = cache.add(url, localpath1)
+        assert newsha1 != sha1
+        assert cache.lookup(url) == newsha1
+        assert cache.retrieve(url, localpath2) is True
+        assert genhub.checksum.read_manifest(localpath2) == newsha1
+        with open(localpath2, 'r') as instream:
+            assert instream.read() == '>seq1\nACGTACGT\n'
+    finally:
+        shutil.rmtree(tempdir)
@@ -8,10 +8,18 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
-"""Module for handling cd-hit output."""
+"""Module for handling cd-hit input and output."""
 
 from __future__ import print_function
+import os
 import re
+import shutil
+import sqlite3
+import tempfile
+try:
+    from StringIO import StringIO
+except ImportError:  # pragma: no cover
+    from io import StringIO
 
 
 class ClusterSeq(object):
@@ -71,6 +79,63 @@ def parse_clusters(filehandle):
     yield clusterid, clusterseqs
 
 
+def aggregate(infiles, outfile, blocksize=1048576):
+    """Concatenate the given files with buffered block copies."""
+    with open(outfile, 'wb') as outstream:
+        for infile in infiles:
+            with open(infile, 'rb') as instream:
+                shutil.copyfileobj(instream, outstream, blocksize)
+
+
+def index_protmap(pairs, mapfile):
+    """
+    Store protein-->iLocus mappings in an on-disk index (an SQLite database).
+
+    The `pairs` are streamed into the index, so that the mappings of many
+    genomes need not be held in memory. If a protein ID occurs more than once,
+    the last mapping is kept.
+    """
+    conn = sqlite3.connect(mapfile)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('DROP TABLE IF EXISTS protmap')
+    conn.execute('CREATE TABLE protmap (protid TEXT PRIMARY KEY, locid TEXT)')
+    conn.executemany('INSERT OR REPLACE INTO protmap VALUES (?, ?)', pairs)
+    conn.commit()
+    conn.close()
+
+
+class ProteinMap(object):
+    """Read-only access to a protein-->iLocus index; see `index_protmap`."""
+
+    def __init__(self, mapfile):
+        self.conn = sqlite3.connect(mapfile)
+
+    def __getitem__(self, protid):
+        query = 'SELECT locid FROM protmap WHERE protid = ?'
+        row = self.conn.execute(query, (protid,)).fetchone()
+        if row is None:
+            raise KeyError(protid)
+        return row[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def resolve_clusters(instream, protmap, outstream):
+    """
+    Resolve the iLoci and species of each protein cluster.
+
+    Clusters are read from a CD-HIT output file and written one per line, with
+    the number of iLoci, the number of species, the iLoci, and the species.
+    """
+    for clusterid, clusterseqs in parse_clusters(instream):
+        iloci = [protmap[prot.accession] for prot in clusterseqs]
+        species = set([prot.species for prot in clusterseqs])
+        print(len(iloci), len(species), ','.join(iloci), ','.join(species),
+              sep='\t', file=outstream)
+
+
 # -----------------------------------------------------------------------------
 # Unit tests
 # -----------------------------------------------------------------------------
@@ -98,3 +163,45 @@ def test_parse_clusters():
     assert clusters[2][0].species == 'Amel'
     assert clusters[2][1].species == 'Bimp'
     assert clusters[2][2].species == 'Bter'
+
+
+def test_resolve_clusters():
+    """CD-HIT: aggregate proteins and resolve clusters with an on-disk map"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        outfile = os.path.join(tempdir, 'GenHub.prot.fa')
+        infiles = ['testdata/fasta/am10-prot-out.fa',
+                   'testdata/fasta/am32-prot-out.fa']
+        aggregate(infiles, outfile, blocksize=64)
+        with open(outfile, 'rb') as outstream:
+            data = outstream.read()
+        assert data == b''.join([open(f, 'rb').read() for f in infiles])
+
+        mapfile = os.path.join(tempdir, 'GenHub.protmap.db')
+        index_protmap(iter([('XP_008191512.1', 'TcasILC-00001'),
+                            ('NP_001260032.1', 'DmelILC-00001'),
+                            ('XP_006564376.1', 'AmelILC-00001'),
+                            ('XP_012246586.1', 'BimpILC-00001'),
+                            ('XP_012166070.1', 'BterILC-00007'),
+                            ('XP_012166070.1', 'BterILC-00001')]), mapfile)
+        protmap = ProteinMap(mapfile)
+        assert protmap['XP_006564376.1'] == 'AmelILC-00001'
+        try:
+            protmap['bogus']
+            checkfailed = False
+        except KeyError:
+            checkfailed = True
+        assert checkfailed
+
+        output = StringIO()
+        with open('testdata/misc/hymhub-head.clstr', 'r') as infile:
+            resolve_clusters(infile, protmap, output)
+        protmap.close()
+        lines = output.getvalue().strip().split('\n')
+        assert lines[0] == '1\t1\tTcasILC-00001\tTcas'
+        values = lines[2].split('\t')
+        assert values[:3] == ['3', '3', 'AmelILC-00001,BimpILC-00001,'
+                              'BterILC-00001']
+        assert sorted(values[3].split(',')) == ['Amel', 'Bimp', 'Bter']
+    finally:
+        shutil.rmtree(tempdir)
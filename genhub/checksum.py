@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Compute and record SHA1 checksums of data files.
+
+Data files are checksummed as they are written, using the `HashingWriter`
+wrapper. Each checksum is recorded in a sidecar manifest, a `.sha1` file in
+`sha1sum` format. A manifest is considered current as long as it is newer than
+the corresponding data file (as is done for Fasta `.fai` indexes), in which
+case the checksum is retrieved from the manifest without reading the data file.
+"""
+
+from __future__ import print_function
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+class HashingWriter(object):
+    """
+    Wrapper for a binary output stream, computing a checksum of the output.
+
+    Text written to the stream is encoded as UTF-8, so the wrapper can be used
+    with `print` and other functions that produce text. To append to a file
+    whose existing contents have already been checksummed, pass the `hashlib`
+    object used for that checksum as `sha`.
+    """
+
+    def __init__(self, outstream, sha=None):
+        self.outstream = outstream
+        self.sha = sha
+        if sha is None:
+            self.sha = hashlib.sha1()
+
+    @property
+    def name(self):
+        return self.outstream.name
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self.sha.update(data)
+        self.outstream.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self.outstream.flush()
+
+    def close(self):
+        self.outstream.close()
+
+    def hexdigest(self):
+        return self.sha.hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+
+def manifest_path(filepath):
+    return filepath + '.sha1'
+
+
+def write_manifest(filepath, sha1):
+    """Record the checksum of a data file in its sidecar manifest."""
+    manifest = manifest_path(filepath)
+    tempmanifest = '%s.%d.tmp' % (manifest, os.getpid())
+    with open(tempmanifest, 'w') as outstream:
+        print(sha1, os.path.basename(filepath), sep='  ', file=outstream)
+    os.rename(tempmanifest, manifest)
+
+
+def read_manifest(filepath):
+    """
+    Retrieve the checksum of a data file from its sidecar manifest.
+
+    Returns `None` if there is no manifest, or if the manifest is out of date.
+    """
+    manifest = manifest_path(filepath)
+    if not os.path.exists(manifest) or not os.path.exists(filepath):
+        return None
+    if os.path.getmtime(manifest) < os.path.getmtime(filepath):
+        return None
+    with open(manifest, 'r') as instream:
+        values = instream.read().split()
+    if len(values) != 2 or values[1] != os.path.basename(filepath):
+        return None
+    return values[0]
+
+
+def update_sha1(sha, filepath, blocksize=2**16):
+    """Update a `hashlib` object with the contents of a file."""
+    with open(filepath, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            sha.update(block)
+    return sha
+
+
+def file_sha1(filepath, record=False):
+    """
+    Compute the SHA1 checksum of a file, using its manifest if it is current.
+
+    If `record` is true, a newly computed checksum is recorded in a manifest.
+    Adapted from http://stackoverflow.com/a/19711609/459780.
+    """
+    sha1 = read_manifest(filepath)
+    if sha1 is not None:
+        return sha1
+
+    sha1 = update_sha1(hashlib.sha1(), filepath).hexdigest()
+    if record:
+        write_manifest(filepath, sha1)
+    return sha1
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_hashing_writer():
+    """Checksum: compute checksum while writing"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        outfile = os.path.join(tempdir, 'out.txt')
+        with HashingWriter(open(outfile, 'wb')) as outstream:
+            print('>seq1 Hello, World!', file=outstream)
+            outstream.write(b'ACGT\n')
+            outstream.writelines(['GATTACA', '\n'])
+        sha1 = outstream.hexdigest()
+        with open(outfile, 'rb') as instream:
+            assert hashlib.sha1(instream.read()).hexdigest() == sha1
+        assert file_sha1(outfile) == sha1
+
+        sha = update_sha1(hashlib.sha1(), outfile)
+        with HashingWriter(open(outfile, 'ab'), sha=sha) as outstream:
+            print('>seq2', file=outstream)
+        assert outstream.hexdigest() == file_sha1(outfile)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_manifest():
+    """Checksum: sidecar manifests"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        datafile = os.path.join(tempdir, 'data.txt')
+        with open(datafile, 'w') as outstream:
+            print('Hello, World!', file=outstream)
+        sha1 = '60fde9c2310b0d4cad4dab8d126b04387efba289'
+        assert read_manifest(datafile) is None
+        assert file_sha1(datafile) == sha1
+        assert not os.path.exists(datafile + '.sha1')
+        assert file_sha1(datafile, record=True) == sha1
+        with open(datafile + '.sha1', 'r') as instream:
+            assert instream.read() == sha1 + '  data.txt\n'
+        assert os.stat(datafile + '.sha1').st_mode & 0o777 == \
+            os.stat(datafile).st_mode & 0o777
+        assert sorted(os.listdir(tempdir)) == ['data.txt', 'data.txt.sha1']
+
+        # The manifest is used as long as it's current...
+        write_manifest(datafile, 'b0gU$h@sH')
+        assert file_sha1(datafile) == 'b0gU$h@sH'
+
+        # ...but not if the data file has been updated since
+        os.utime(datafile + '.sha1', (1, 1))
+        assert read_manifest(datafile) is None
+        assert file_sha1(datafile) == sha1
+    finally:
+        shutil.rmtree(tempdir)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Nucleotide composition of DNA sequences.
+
+Nucleotides are assigned to a handful of classes with a byte lookup table,
+rather than counting each upper- and lower-case nucleotide separately. When
+NumPy is available, `batch_composition` classifies and counts the nucleotides
+of many sequences with a single vectorized operation; otherwise it falls back
+to computing the composition of each sequence in turn.
+"""
+
+from __future__ import print_function
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+try:
+    maketrans = bytes.maketrans
+except AttributeError:  # pragma: no cover
+    from string import maketrans
+
+
+# Nucleotide classes: A, T, and W (A or T); G; C; S (G or C); N and X
+# (unknown); and all other (ambiguous) nucleotides
+AT, G, C, S, N, OTHER = range(6)
+numclasses = 6
+classes = [
+    (AT, 'ATWatw'),
+    (G, 'Gg'),
+    (C, 'Cc'),
+    (S, 'Ss'),
+    (N, 'NXnx'),
+]
+classcodes = [b'W', b'G', b'C', b'S', b'N']
+
+translation = maketrans(b''.join([n.encode('ascii') for c, n in classes]),
+                        b''.join([classcodes[c] * len(n) for c, n in classes]))
+
+if numpy is not None:
+    lookup = numpy.full(256, OTHER, dtype=numpy.uint8)
+    for c, nucleotides in classes:
+        for nucl in nucleotides:
+            lookup[ord(nucl)] = c
+
+
+def counts(dna):
+    """
+    Count the nucleotides of each class in a DNA sequence.
+
+    Returns a list of counts indexed by nucleotide class: `AT`, `G`, `C`, `S`,
+    `N`, and `OTHER`.
+    """
+    if not isinstance(dna, bytes):
+        dna = dna.encode('ascii')
+    classified = dna.translate(translation)
+    result = [classified.count(code) for code in classcodes]
+    result.append(len(dna) - sum(result))
+    return result
+
+
+def batch_counts(seqs):
+    """
+    Count the nucleotides of each class in many DNA sequences at once.
+
+    Returns a list of count lists, one for each sequence, as for `counts`.
+    Sequences may be text or bytes (such as those read by
+    `genhub.fasta.parse_bytes`).
+    """
+    seqs = list(seqs)
+    if numpy is None or len(seqs) == 0:
+        return [counts(dna) for dna in seqs]
+
+    lengths = numpy.array([len(dna) for dna in seqs], dtype=numpy.int64)
+    data = b''.join([dna if isinstance(dna, bytes) else dna.encode('ascii')
+                     for dna in seqs])
+    codes = lookup[numpy.frombuffer(data, dtype=numpy.uint8)]
+
+    # Offset the class code of each nucleotide by the index of its sequence,
+    # so that a single bincount tallies every class of every sequence
+    bins = numpy.repeat(numpy.arange(0, len(seqs) * numclasses, numclasses),
+                        lengths)
+    bins += codes
+    bins = numpy.bincount(bins, minlength=len(seqs) * numclasses)
+    return bins.reshape(len(seqs), numclasses).tolist()
+
+
+def gc_content(nuclcounts):
+    """
+    Calculate %GC content from nucleotide counts.
+
+    Ambiguous nucleotides are ignored, except for S (G or C) and W (A or T).
+    """
+    gccount = nuclcounts[G] + nuclcounts[C] + nuclcounts[S]
+    atcount = nuclcounts[AT]
+    if gccount + atcount == 0:
+        return 0.0
+    return float(gccount) / float(gccount + atcount)
+
+
+def gc_skew(nuclcounts):
+    """
+    Calculate GC skew from nucleotide counts.
+
+    s = (G - C) / (G + C)
+    """
+    gcount = nuclcounts[G]
+    ccount = nuclcounts[C]
+    if gcount + ccount == 0:
+        return 0.0
+    return float(gcount - ccount) / float(gcount + ccount)
+
+
+def n_content(nuclcounts):
+    """Calculate the proportion of unknown nucleotides from counts."""
+    ncount = nuclcounts[N]
+    if ncount == 0:
+        return 0.0
+    return float(ncount) / float(sum(nuclcounts))
+
+
+def composition(dna):
+    """Calculate %GC content, GC skew, and N content of a DNA sequence."""
+    nuclcounts = counts(dna)
+    return gc_content(nuclcounts), gc_skew(nuclcounts), n_content(nuclcounts)
+
+
+def batch_composition(seqs):
+    """
+    Calculate %GC content, GC skew, and N content of many DNA sequences.
+
+    Returns a list of `(gccontent, gcskew, ncontent)` tuples.
+    """
+    return [(gc_content(c), gc_skew(c), n_content(c))
+            for c in batch_counts(seqs)]
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_counts():
+    """Composition: nucleotide counts"""
+    assert counts('') == [0, 0, 0, 0, 0, 0]
+    assert counts('ACGT') == [2, 1, 1, 0, 0, 0]
+    assert counts('acgtNNxWSryK') == [3, 1, 1, 1, 3, 3]
+    assert counts(b'GGGCnnnn') == [0, 3, 1, 0, 4, 0]
+
+
+def test_composition():
+    """Composition: GC content, GC skew, and N content"""
+    assert composition('') == (0.0, 0.0, 0.0)
+    assert composition('NNNN') == (0.0, 0.0, 1.0)
+    assert composition('AATT') == (0.0, 0.0, 0.0)
+    assert composition('GGGC') == (1.0, 0.5, 0.0)
+    gccontent, gcskew, ncontent = composition('ACGTGGSWNNrY')
+    assert '%.3f %.3f %.3f' % (gccontent, gcskew, ncontent) == \
+        '0.625 0.500 0.167'
+
+
+def test_batch():
+    """Composition: batch calculations"""
+    seqs = ['', 'NNNN', 'ACGTGGSWNNrY', 'aattgc', 'GCGCGCGCA' * 50, 'ryk']
+    testcounts = [counts(dna) for dna in seqs]
+    assert batch_counts(seqs) == testcounts
+    assert batch_counts([dna.encode('ascii') for dna in seqs]) == testcounts
+    assert batch_counts([seqs[2].encode('ascii'), seqs[3]]) == testcounts[2:4]
+    assert batch_counts([]) == []
+    assert batch_composition(seqs) == [composition(dna) for dna in seqs]
+
+    global numpy
+    numpy_backup = numpy
+    numpy = None
+    try:
+        assert batch_counts(seqs) == testcounts
+    finally:
+        numpy = numpy_backup
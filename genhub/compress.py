@@ -0,0 +1,641 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Pluggable gzip compression and decompression.
+
+Gzip-compressed files are read and written with the fastest backend
+available, in the following order of preference.
+- `isal`: the python-isal package (Intel ISA-L)
+- `zlib-ng`: the python-zlib-ng package
+- `pigz` or `igzip`: an external program, running in a separate process
+- `bgzf`: the BGZF codec in this module, which splits the data into
+  independent blocks of at most 64 KiB that are (de)compressed concurrently by
+  a pool of threads (zlib releases the GIL); only BGZF files can be read with
+  this backend
+- `gzip`: the Python standard library
+
+BGZF files are valid gzip files, readable by any gzip implementation. A
+specific backend can be selected with the `GENHUB_GZIP` environment variable.
+
+BGZF files are also randomly accessible (see `BgzfFile`), using an index of
+the compressed and uncompressed offsets of each block. The index is stored in
+a `.gzi` file compatible with `bgzip` and `samtools faidx`.
+"""
+
+from __future__ import print_function
+import bisect
+from collections import deque
+import gzip
+import io
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import struct
+import subprocess
+import zlib
+
+
+backends = ['isal', 'zlib-ng', 'pigz', 'igzip', 'bgzf', 'gzip']
+programs = ['pigz', 'igzip']
+
+# Maximum uncompressed size of a BGZF block, as used by samtools/htslib
+bgzf_blocksize = 65280
+
+# Empty BGZF block marking the end of a file
+bgzf_eof = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02'
+            b'\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def which(program):
+    """Find an executable program on the PATH."""
+    for dirname in os.environ.get('PATH', '').split(os.pathsep):
+        filepath = os.path.join(dirname, program)
+        if os.path.isfile(filepath) and os.access(filepath, os.X_OK):
+            return filepath
+    return None
+
+
+def available(backend):
+    """Determine whether the given backend is available."""
+    assert backend in backends, 'unknown compression backend ' + backend
+    try:
+        if backend == 'isal':
+            from isal import igzip
+        elif backend == 'zlib-ng':
+            from zlib_ng import gzip_ng
+    except ImportError:
+        return False
+    if backend in programs:
+        return which(backend) is not None
+    return True
+
+
+def select_backend(filename=None, writing=False, program=True):
+    """
+    Select the backend for reading or writing a gzip file.
+
+    Set `program` to False to exclude backends that run an external program.
+    A backend requested with the `GENHUB_GZIP` environment variable is
+    preferred, if it is available and (for reading with `bgzf`) suitable for
+    the file; otherwise the default order of preference applies.
+    """
+    candidates = backends
+    forced = os.environ.get('GENHUB_GZIP')
+    if forced:
+        assert forced in backends, 'unknown compression backend ' + forced
+        candidates = [forced] + backends
+    for backend in candidates:
+        if backend in programs and not program:
+            continue
+        if backend == 'bgzf' and not writing and not is_bgzf(filename):
+            continue
+        if available(backend):
+            return backend
+
+
+def open_any(filename, mode='rt'):
+    """Open a file for reading, decompressing it if it is gzip-compressed."""
+    assert mode in ['rb', 'rt'], mode
+    with open(filename, 'rb') as instream:
+        compressed = instream.read(2) == b'\x1f\x8b'
+    if compressed:
+        return open_gzip(filename, mode)
+    return io.open(filename, mode)
+
+
+def open_gzip(filename, mode='rb', threads=None):
+    """
+    Open a gzip file with the selected backend.
+
+    As with `gzip.open`, the file is opened in binary mode unless `mode`
+    includes `t`. The `threads` argument applies to the `pigz` and `bgzf`
+    backends; the default is the number of CPUs.
+    """
+    assert mode in ['r', 'rb', 'rt', 'w', 'wb', 'wt'], mode
+    writing = mode.startswith('w')
+    backend = select_backend(filename, writing)
+    if backend == 'isal':
+        from isal import igzip
+        return igzip.open(filename, mode)
+    if backend == 'zlib-ng':
+        from zlib_ng import gzip_ng
+        return gzip_ng.open(filename, mode)
+
+    if backend in programs:
+        stream = ProgramFile(backend, filename, writing, threads)
+    elif backend == 'bgzf' and writing:
+        stream = BgzfWriter(io.open(filename, 'wb'), threads)
+    elif backend == 'bgzf':
+        stream = BgzfReader(io.open(filename, 'rb'), threads)
+    else:
+        stream = gzip.open(filename, mode[0] + 'b')
+    if backend != 'gzip':
+        if writing:
+            stream = io.BufferedWriter(stream, buffer_size=bgzf_blocksize)
+        else:
+            stream = io.BufferedReader(stream, buffer_size=bgzf_blocksize)
+    if 't' in mode:
+        stream = io.TextIOWrapper(stream)
+    return stream
+
+
+def gzip_writer(outstream, threads=None):
+    """
+    Compress data written to the returned stream onto an open binary stream.
+
+    Closing the returned stream does not close `outstream`.
+    """
+    backend = select_backend(writing=True, program=False)
+    if backend == 'isal':
+        from isal import igzip
+        return igzip.IGzipFile(fileobj=outstream, mode='wb')
+    if backend == 'zlib-ng':
+        from zlib_ng import gzip_ng
+        return gzip_ng.GzipNGFile(fileobj=outstream, mode='wb')
+    if backend == 'gzip':
+        return gzip.GzipFile(fileobj=outstream, mode='wb')
+    writer = BgzfWriter(outstream, threads, closefd=False)
+    return io.BufferedWriter(writer, buffer_size=bgzf_blocksize)
+
+
+class ProgramFile(io.RawIOBase):
+    """Gzip file read or written through an external program."""
+
+    def __init__(self, program, filename, writing=False, threads=None):
+        command = [program, '-c']
+        if program == 'pigz' and threads:
+            command.extend(['-p', str(threads)])
+        if writing:
+            self.outfile = open(filename, 'wb')
+            self.proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=self.outfile)
+            self.stream = self.proc.stdin
+        else:
+            self.outfile = None
+            self.proc = subprocess.Popen(command + ['-d', filename],
+                                         stdout=subprocess.PIPE)
+            self.stream = self.proc.stdout
+        self.program = program
+        self.writing = writing
+
+    def readable(self):
+        return not self.writing
+
+    def writable(self):
+        return self.writing
+
+    def readinto(self, b):
+        return self.stream.readinto(b)
+
+    def write(self, b):
+        self.stream.write(b)
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        self.stream.close()
+        returncode = self.proc.wait()
+        if self.outfile is not None:
+            self.outfile.close()
+        super(ProgramFile, self).close()
+        # A reader closed early may terminate the program with SIGPIPE
+        if returncode > 0 or (returncode < 0 and self.writing):
+            message = '%s failed with exit status %d' % (self.program,
+                                                         returncode)
+            raise IOError(message)
+
+
+# -----------------------------------------------------------------------------
+# BGZF codec
+# -----------------------------------------------------------------------------
+
+def is_bgzf(filename):
+    """Determine whether a file is BGZF-compressed."""
+    if filename is None or not os.path.isfile(filename):
+        return False
+    with open(filename, 'rb') as instream:
+        header = instream.read(18)
+    return len(header) == 18 and header[:4] == b'\x1f\x8b\x08\x04' and \
+        header[12:14] == b'BC'
+
+
+def compress_block(data, level=6):
+    """Compress data into a single BGZF block."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = struct.pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67,
+                         2, len(cdata) + 25)
+    trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+    return header + cdata + trailer
+
+
+def decompress_block(cdata, crc, size):
+    """Decompress the data of a single BGZF block, and verify it."""
+    data = zlib.decompress(cdata, -15)
+    if len(data) != size or zlib.crc32(data) & 0xffffffff != crc:
+        raise IOError('BGZF block failed integrity check')
+    return data
+
+
+def read_block(instream):
+    """
+    Read the next BGZF block from a binary stream.
+
+    Returns the offset of the block in the file, the compressed data, and the
+    CRC and size of the uncompressed data; or None at the end of the stream.
+    """
+    offset = instream.tell()
+    header = instream.read(12)
+    if len(header) == 0:
+        return None
+    if len(header) < 12 or header[:4] != b'\x1f\x8b\x08\x04':
+        raise IOError('invalid BGZF block at offset %d' % offset)
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = instream.read(xlen)
+    bsize = None
+    i = 0
+    while i + 4 <= len(extra):
+        slen = struct.unpack('<H', extra[i+2:i+4])[0]
+        if extra[i:i+2] == b'BC' and slen == 2:
+            bsize = struct.unpack('<H', extra[i+4:i+6])[0]
+        i += 4 + slen
+    if bsize is None:
+        raise IOError('invalid BGZF block at offset %d' % offset)
+    data = instream.read(bsize - xlen - 11)
+    if len(data) != bsize - xlen - 11:
+        raise IOError('truncated BGZF block at offset %d' % offset)
+    crc, size = struct.unpack('<II', data[-8:])
+    return offset, data[:-8], crc, size
+
+
+class BgzfWriter(io.RawIOBase):
+    """
+    Binary stream writing BGZF-compressed data.
+
+    Blocks are compressed concurrently by a pool of `threads` threads, and
+    written in order. The compressed and uncompressed offsets of each block
+    are recorded for a `.gzi` index (see `write_gzi`). Unless `closefd` is
+    false, closing the writer closes the underlying stream.
+    """
+
+    def __init__(self, outstream, threads=None, level=6, closefd=True):
+        self.outstream = outstream
+        self.threads = threads or multiprocessing.cpu_count()
+        self.level = level
+        self.closefd = closefd
+        self.pool = ThreadPool(self.threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+        self.index = list()
+        self.coffset = 0
+        self.uoffset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer += b
+        while len(self.buffer) >= bgzf_blocksize:
+            self.submit(bytes(self.buffer[:bgzf_blocksize]))
+            del self.buffer[:bgzf_blocksize]
+        return len(b)
+
+    def submit(self, data):
+        result = self.pool.apply_async(compress_block, (data, self.level))
+        self.pending.append((result, len(data)))
+        while len(self.pending) > 4 * self.threads:
+            self.write_block()
+
+    def write_block(self):
+        """Write the next compressed block, and record its end offsets."""
+        result, size = self.pending.popleft()
+        block = result.get()
+        self.outstream.write(block)
+        self.coffset += len(block)
+        self.uoffset += size
+        self.index.append((self.coffset, self.uoffset))
+
+    def close(self):
+        if self.closed:
+            return
+        if len(self.buffer) > 0:
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while len(self.pending) > 0:
+            self.write_block()
+        self.outstream.write(bgzf_eof)
+        self.pool.close()
+        self.pool.join()
+        if self.closefd:
+            self.outstream.close()
+        super(BgzfWriter, self).close()
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    Binary stream reading BGZF-compressed data.
+
+    Blocks are read ahead and decompressed concurrently by a pool of `threads`
+    threads.
+    """
+
+    def __init__(self, instream, threads=None, closefd=True):
+        self.instream = instream
+        self.threads = threads or multiprocessing.cpu_count()
+        self.closefd = closefd
+        self.pool = ThreadPool(self.threads)
+        self.pending = deque()
+        self.block = b''
+        self.offset = 0
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def fill(self):
+        """Load the next decompressed block; False at the end of the data."""
+        while not self.eof and len(self.pending) < 4 * self.threads:
+            block = read_block(self.instream)
+            if block is None:
+                self.eof = True
+                break
+            result = self.pool.apply_async(decompress_block, block[1:])
+            self.pending.append(result)
+        if len(self.pending) == 0:
+            return False
+        self.block = self.pending.popleft().get()
+        self.offset = 0
+        return True
+
+    def readinto(self, b):
+        while self.offset >= len(self.block):
+            if not self.fill():
+                return 0
+        size = min(len(b), len(self.block) - self.offset)
+        b[:size] = self.block[self.offset:self.offset+size]
+        self.offset += size
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        self.pool.terminate()
+        self.pool.join()
+        if self.closefd:
+            self.instream.close()
+        super(BgzfReader, self).close()
+
+
+def scan_blocks(filename):
+    """Build a `.gzi` index by scanning the blocks of a BGZF file."""
+    index = list()
+    coffset, uoffset = 0, 0
+    with open(filename, 'rb') as instream:
+        while True:
+            block = read_block(instream)
+            if block is None:
+                break
+            if coffset > 0:
+                index.append((coffset, uoffset))
+            coffset = instream.tell()
+            uoffset += block[3]
+    return index
+
+
+def write_gzi(index, filename):
+    """
+    Write a BGZF index in the `.gzi` format of `bgzip`.
+
+    The index is a list of (compressed offset, uncompressed offset) tuples for
+    the start of each block but the first.
+    """
+    with open(filename, 'wb') as outstream:
+        outstream.write(struct.pack('<Q', len(index)))
+        for coffset, uoffset in index:
+            outstream.write(struct.pack('<QQ', coffset, uoffset))
+
+
+def read_gzi(filename):
+    """Read a BGZF index from a `.gzi` file; see `write_gzi`."""
+    with open(filename, 'rb') as instream:
+        count = struct.unpack('<Q', instream.read(8))[0]
+        data = instream.read(16 * count)
+    values = struct.unpack('<%dQ' % (2 * count), data)
+    return list(zip(values[0::2], values[1::2]))
+
+
+class BgzfFile(object):
+    """
+    Random access to the uncompressed data of a BGZF file.
+
+    Offsets (for `seek` and `tell`) are uncompressed offsets. The index is
+    loaded from `<filename>.gzi` if it exists and is newer than the file;
+    otherwise it is built by scanning the file's blocks. Only the block
+    containing the current offset is held in memory.
+    """
+
+    def __init__(self, filename, gzifile=None):
+        if gzifile is None:
+            gzifile = filename + '.gzi'
+        if os.path.exists(gzifile) and \
+                os.path.getmtime(gzifile) >= os.path.getmtime(filename):
+            index = read_gzi(gzifile)
+        else:
+            index = scan_blocks(filename)
+        self.coffsets = [0] + [c for c, u in index]
+        self.uoffsets = [0] + [u for c, u in index]
+        self.filehandle = open(filename, 'rb')
+        self.position = 0
+        self.blocknum = None
+        self.block = b''
+
+    def seek(self, offset):
+        self.position = offset
+
+    def tell(self):
+        return self.position
+
+    def load(self, blocknum):
+        if blocknum != self.blocknum:
+            self.filehandle.seek(self.coffsets[blocknum])
+            block = read_block(self.filehandle)
+            self.block = b'' if block is None else decompress_block(*block[1:])
+            self.blocknum = blocknum
+
+    def read(self, size=-1):
+        chunks = list()
+        while size != 0:
+            blocknum = bisect.bisect_right(self.uoffsets, self.position) - 1
+            self.load(blocknum)
+            start = self.position - self.uoffsets[blocknum]
+            if start >= len(self.block):
+                break
+            end = len(self.block) if size < 0 else start + size
+            chunk = self.block[start:end]
+            chunks.append(chunk)
+            self.position += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        self.filehandle.close()
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_bgzf():
+    """Compression: BGZF codec"""
+    import shutil
+    import tempfile
+    data = b''.join([b'>seq%d\nACGTTGCA\n' % i for i in range(20000)])
+    tempdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempdir, 'test.fa.gz')
+        writer = BgzfWriter(open(filename, 'wb'), threads=2)
+        writer.write(data[:100])
+        writer.write(data[100:])
+        writer.close()
+        assert is_bgzf(filename)
+        with open(filename, 'rb') as instream:
+            assert instream.read()[-28:] == bgzf_eof
+            instream.seek(0)
+            blocks = list()
+            while True:
+                block = read_block(instream)
+                if block is None:
+                    break
+                blocks.append(block)
+        assert len(blocks) == len(data) // bgzf_blocksize + 2
+        assert blocks[1][0] > blocks[0][0]
+
+        with gzip.open(filename, 'rb') as instream:
+            assert instream.read() == data
+        reader = io.BufferedReader(BgzfReader(open(filename, 'rb'), 2))
+        assert reader.read(10) == data[:10]
+        assert reader.read() == data[10:]
+        reader.close()
+
+        plainfile = os.path.join(tempdir, 'test.txt.gz')
+        with gzip.open(plainfile, 'wb') as outstream:
+            outstream.write(data)
+        assert not is_bgzf(plainfile)
+        assert not is_bgzf(os.path.join(tempdir, 'bogus.gz'))
+
+        try:
+            BgzfReader(open(plainfile, 'rb')).read(10)
+            checkfailed = False
+        except IOError:
+            checkfailed = True
+        assert checkfailed
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_bgzf_index():
+    """Compression: BGZF block index and random access"""
+    import shutil
+    import tempfile
+    data = b''.join([b'>seq%d\nACGTTGCA\n' % i for i in range(30000)])
+    tempdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempdir, 'test.fa.gz')
+        writer = BgzfWriter(open(filename, 'wb'), threads=2)
+        writer.write(data)
+        writer.close()
+        index = scan_blocks(filename)
+        assert writer.index == index
+        assert len(index) == len(data) // bgzf_blocksize + 1
+        assert index[0][1] == bgzf_blocksize
+        assert index[-1][1] == len(data)
+
+        gzifile = filename + '.gzi'
+        write_gzi(index, gzifile)
+        assert os.path.getsize(gzifile) == 8 + 16 * len(index)
+        assert read_gzi(gzifile) == index
+
+        for gzi in [gzifile, os.path.join(tempdir, 'missing.gzi')]:
+            reader = BgzfFile(filename, gzifile=gzi)
+            assert reader.read(10) == data[:10]
+            for offset in [0, 65279, 65280, 65281, 150000, len(data) - 5]:
+                reader.seek(offset)
+                assert reader.read(100000) == data[offset:offset + 100000]
+                assert reader.tell() == min(offset + 100000, len(data))
+            reader.seek(len(data))
+            assert reader.read(10) == b''
+            reader.seek(1000)
+            assert reader.read() == data[1000:]
+            reader.close()
+
+        with open_any(filename, 'rb') as instream:
+            assert instream.read() == data
+        plainfile = os.path.join(tempdir, 'test.fa')
+        with open(plainfile, 'wb') as outstream:
+            outstream.write(data)
+        with open_any(plainfile) as instream:
+            assert instream.readline() == '>seq0\n'
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_backends():
+    """Compression: backend selection"""
+    import shutil
+    import tempfile
+    tempdir = tempfile.mkdtemp()
+    environ = dict(os.environ)
+    try:
+        os.environ['GENHUB_GZIP'] = 'bgzf'
+        filename = os.path.join(tempdir, 'test.txt.gz')
+        with open_gzip(filename, 'wt') as outstream:
+            print('line 1\nline 2', file=outstream)
+        assert is_bgzf(filename)
+        assert select_backend(filename) == 'bgzf'
+        with open_gzip(filename, 'rt') as instream:
+            assert instream.read() == 'line 1\nline 2\n'
+
+        os.environ['GENHUB_GZIP'] = 'gzip'
+        with open_gzip(filename, 'wt') as outstream:
+            print('line 3', file=outstream)
+        assert not is_bgzf(filename)
+        with open_gzip(filename, 'rt') as instream:
+            assert instream.read() == 'line 3\n'
+
+        # A forced backend is used only if it is available and suitable
+        os.environ['GENHUB_GZIP'] = 'bgzf'
+        assert select_backend(filename) != 'bgzf'
+        assert select_backend(filename, writing=True) == 'bgzf'
+        with open_gzip(filename, 'rt') as instream:
+            assert instream.read() == 'line 3\n'
+        for backend in ['isal', 'zlib-ng', 'pigz', 'igzip']:
+            os.environ['GENHUB_GZIP'] = backend
+            if not available(backend):
+                assert select_backend(filename) != backend
+
+        del os.environ['GENHUB_GZIP']
+        assert select_backend() in backends
+        assert select_backend(filename) != 'bgzf'
+        assert select_backend(writing=True, program=False) not in programs
+
+        bytestream = io.BytesIO()
+        os.environ['GENHUB_GZIP'] = 'pigz'
+        with gzip_writer(bytestream) as outstream:
+            outstream.write(b'line 4\n')
+        assert gzip.GzipFile(fileobj=io.BytesIO(bytestream.getvalue()),
+                             mode='rb').read() == b'line 4\n'
+        assert not bytestream.closed
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        shutil.rmtree(tempdir)
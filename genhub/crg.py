@@ -17,13 +17,15 @@ distribution site at the Centre de Regulacio Genomica.
 
 from __future__ import print_function
 import re
-import subprocess
 import sys
 import genhub
 
 
 class CrgDB(genhub.genomedb.GenomeDB):
 
+    protein_feature = 'CDS'
+    protein_patterns = [r'Target=(\S+)']
+
     def __init__(self, label, conf, workdir='.'):
         super(CrgDB, self).__init__(label, conf, workdir)
         assert self.config['source'] == 'crg'
@@ -62,28 +64,17 @@ class CrgDB(genhub.genomedb.GenomeDB):
             print(line, end='', file=outstream)
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
-        cmds = list()
-        cmds.append('gunzip -c %s' % self.gff3path)
-        cmds.append("sed 's/	transcript	/	mRNA	/'")
-        cmds.append("sed 's/scaffold_/%sScf_/'" % self.label)
-        cmds.append("sed 's/scaffold/%sScf_/'" % self.label)
-        cmds.append('genhub-format-gff3.py --source crg -')
-        cmds.append('seq-reg.py - %s' % self.gdnafile)
-        cmds.append('gt gff3 -sort -tidy -o %s -force' % self.gff3file)
-
-        commands = ' | '.join(cmds)
-        if debug:  # pragma: no cover
-            print('DEBUG: running command: %s' % commands, file=logstream)
-        proc = subprocess.Popen(commands, shell=True, universal_newlines=True,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):  # pragma: no cover
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               line != '':
-                print(line, file=logstream)
-        assert proc.returncode == 0, \
-            'annot cleanup command failed: %s' % commands
+        pipeline = genhub.gff3.Pipeline()
+        pipeline.add('transcript2mrna', genhub.gff3.substitute,
+                     '\ttranscript\t', '\tmRNA\t')
+        pipeline.add('rename1', genhub.gff3.substitute, 'scaffold_',
+                     '%sScf_' % self.label)
+        pipeline.add('rename2', genhub.gff3.substitute, 'scaffold',
+                     '%sScf_' % self.label)
+        pipeline.add('format', genhub.gff3.format_features, 'crg')
+        pipeline.add('seq-reg', genhub.gff3.sequence_regions,
+                     self.sequence_lengths())
+        self.run_gff3_pipeline(pipeline, logstream=logstream)
 
     def gff3_protids(self, instream):
         protids = dict()
@@ -97,51 +88,6 @@ class CrgDB(genhub.genomedb.GenomeDB):
                 protids[protid] = True
                 yield protid
 
-    def protein_mapping(self, instream):
-        locusid2name = dict()
-        gene2loci = dict()
-        mrna2gene = dict()
-        proteins = dict()
-        for line in instream:
-            fields = line.split('\t')
-            if len(fields) != 9:
-                continue
-            feattype = fields[2]
-            attrs = fields[8]
-
-            if feattype == 'locus':
-                idmatch = re.search(r'ID=([^;\n]+);.*Name=([^;\n]+)', attrs)
-                if idmatch:
-                    locusid = idmatch.group(1)
-                    locusname = idmatch.group(2)
-                    locusid2name[locusid] = locusname
-            elif feattype == 'gene':
-                idmatch = re.search(r'ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                assert idmatch, \
-                    'Unable to parse gene and iLocus IDs: %s' % attrs
-                geneid = idmatch.group(1)
-                ilocusid = idmatch.group(2)
-                gene2loci[geneid] = ilocusid
-            elif feattype == 'mRNA':
-                idmatch = re.search(r'ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                assert idmatch, \
-                    'Unable to parse mRNA and gene IDs: %s' % attrs
-                mrnaid = idmatch.group(1)
-                geneid = idmatch.group(2)
-                mrna2gene[mrnaid] = geneid
-            elif feattype == 'CDS':
-                idmatch = re.search(r'Parent=([^;\n]+).*Target=(\S+)', attrs)
-                assert idmatch, \
-                    'Unable to parse protein and mRNA IDs: %s' % attrs
-                mrnaid = idmatch.group(1)
-                proteinid = idmatch.group(2)
-                if proteinid not in proteins:
-                    geneid = mrna2gene[mrnaid]
-                    ilocusid = gene2loci[geneid]
-                    ilocusname = locusid2name[ilocusid]
-                    proteins[proteinid] = mrnaid
-                    yield proteinid, ilocusname
-
 
 # -----------------------------------------------------------------------------
 # Unit tests
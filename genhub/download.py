@@ -9,12 +9,252 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
-"""Simple module for downloading data with PycURL"""
+"""
+Module for downloading data with PycURL.
+
+Data are downloaded to `.part` files, which are moved into place only once
+complete. If a transfer is interrupted, it is resumed (with an HTTP Range
+request, or the FTP equivalent) from the end of the partial file, whether in a
+retry attempt or in a later invocation. Multiple files are downloaded
+concurrently with a `pycurl.CurlMulti` object, which also allows connections to
+be re-used for multiple files from the same server. Data are checksummed as
+they are written (see `genhub.checksum`).
+"""
 
 from __future__ import print_function
 import gzip
-import pycurl
+import hashlib
+import os
+import shutil
 import sys
+import pycurl
+import genhub
+
+
+# Errors indicating a transfer that might succeed if resumed or re-attempted.
+retry_errors = [
+    pycurl.E_COULDNT_CONNECT,
+    pycurl.E_PARTIAL_FILE,
+    pycurl.E_OPERATION_TIMEDOUT,
+    pycurl.E_GOT_NOTHING,
+    pycurl.E_SEND_ERROR,
+    pycurl.E_RECV_ERROR,
+]
+
+
+class Transfer(object):
+    """A single URL to be downloaded to a `.part` file."""
+
+    def __init__(self, url, partfile):
+        self.url = url
+        self.partfile = partfile
+        self.attempts = 0
+        self.outstream = None
+        self.complete = False
+        self.sha = None
+        self.hashed = 0
+
+    def open(self):
+        """
+        Open the `.part` file for writing and return the offset to resume from.
+
+        The data are checksummed as they are written. The existing contents of
+        a partial file are only read if they were not written by this object.
+        """
+        offset = 0
+        if os.path.exists(self.partfile):
+            offset = os.path.getsize(self.partfile)
+        if offset == 0:
+            self.sha = hashlib.sha1()
+        elif self.sha is None or self.hashed != offset:
+            self.sha = genhub.checksum.update_sha1(hashlib.sha1(),
+                                                   self.partfile)
+        outstream = open(self.partfile, 'ab' if offset else 'wb')
+        self.outstream = genhub.checksum.HashingWriter(outstream, self.sha)
+        return offset
+
+    def close(self):
+        self.outstream.close()
+        self.hashed = os.path.getsize(self.partfile)
+
+
+class Download(object):
+    """
+    One or more URLs to be downloaded to a single local file.
+
+    If multiple URLs are given, their contents are concatenated. If `compress`
+    is true, the file is gzip-compressed.
+    """
+
+    def __init__(self, urldata, localpath, compress=False):
+        urls = urldata
+        if isinstance(urldata, str):
+            urls = [urldata]
+        self.localpath = localpath
+        self.compress = compress
+        if len(urls) == 1:
+            partfiles = [localpath + '.part']
+        else:
+            partfiles = ['%s.%d.part' % (localpath, i)
+                         for i in range(len(urls))]
+        self.transfers = [Transfer(url, partfile)
+                          for url, partfile in zip(urls, partfiles)]
+
+    def finish(self):
+        """Move or concatenate completed `.part` files into place."""
+        if len(self.transfers) == 1 and not self.compress:
+            shutil.move(self.transfers[0].partfile, self.localpath)
+            sha1 = self.transfers[0].sha.hexdigest()
+            genhub.checksum.write_manifest(self.localpath, sha1)
+            return
+
+        # Write to a temporary file rather than overwriting the local file in
+        # place, since it may be linked to a cached file (see `genhub.cache`)
+        tempfile = self.localpath + '.tmp'
+        hashstream = genhub.checksum.HashingWriter(open(tempfile, 'wb'))
+        with hashstream:
+            outstream = hashstream
+            if self.compress:
+                outstream = genhub.compress.gzip_writer(hashstream)
+            for transfer in self.transfers:
+                with open(transfer.partfile, 'rb') as instream:
+                    shutil.copyfileobj(instream, outstream)
+            outstream.close()
+        shutil.move(tempfile, self.localpath)
+        genhub.checksum.write_manifest(self.localpath, hashstream.hexdigest())
+        for transfer in self.transfers:
+            os.unlink(transfer.partfile)
+
+
+class Downloader(object):
+    """
+    Download engine for concurrent, resumable transfers.
+
+    - maxconnections: maximum number of simultaneous transfers
+    - retries: number of times to resume a failed transfer
+    - follow: follow HTTP redirects
+    - lowspeed: abort (and retry) a transfer that has transferred less than 1
+      byte per second for this many seconds
+    """
+
+    def __init__(self, maxconnections=4, retries=3, follow=True,
+                 lowspeed=60, logstream=sys.stderr):
+        self.maxconnections = maxconnections
+        self.retries = retries
+        self.follow = follow
+        self.lowspeed = lowspeed
+        self.logstream = logstream
+        self.downloads = list()
+
+    def add(self, urldata, localpath, compress=False):
+        """Queue a download; see `Download` for arguments."""
+        self.downloads.append(Download(urldata, localpath, compress))
+
+    def start(self, handle, transfer):
+        """Configure a Curl handle for a transfer and open its `.part` file."""
+        offset = transfer.open()
+        transfer.attempts += 1
+
+        handle.reset()
+        handle.transfer = transfer
+        handle.setopt(pycurl.URL, transfer.url)
+        handle.setopt(pycurl.WRITEFUNCTION, transfer.outstream.write)
+        handle.setopt(pycurl.FAILONERROR, True)
+        handle.setopt(pycurl.LOW_SPEED_LIMIT, 1)
+        handle.setopt(pycurl.LOW_SPEED_TIME, self.lowspeed)
+        if self.follow:
+            handle.setopt(pycurl.FOLLOWLOCATION, True)
+        if offset > 0:
+            handle.setopt(pycurl.RESUME_FROM_LARGE, offset)
+
+    def run(self):
+        """
+        Perform all queued downloads.
+
+        Each interrupted transfer is resumed up to `retries` times. If a
+        transfer fails, the remaining transfers are completed before an
+        exception is raised, and the `.part` files of any failed transfers are
+        retained so that they can be resumed later.
+        """
+        queue = list()
+        for download in self.downloads:
+            queue.extend(download.transfers)
+        queue.reverse()
+
+        multi = pycurl.CurlMulti()
+        numhandles = min(self.maxconnections, len(queue))
+        handles = [pycurl.Curl() for _ in range(numhandles)]
+        freehandles = list(handles)
+        failure = None
+        active = 0
+        try:
+            while len(queue) > 0 or active > 0:
+                while len(queue) > 0 and len(freehandles) > 0:
+                    handle = freehandles.pop()
+                    self.start(handle, queue.pop())
+                    multi.add_handle(handle)
+                    active += 1
+
+                while True:
+                    status, _ = multi.perform()
+                    if status != pycurl.E_CALL_MULTI_PERFORM:
+                        break
+
+                while True:
+                    numqueued, succeeded, failed = multi.info_read()
+                    finished = [(h, 0, None) for h in succeeded] + failed
+                    for handle, errno, errmsg in finished:
+                        multi.remove_handle(handle)
+                        freehandles.append(handle)
+                        active -= 1
+                        transfer = handle.transfer
+                        transfer.close()
+                        error = self.finished(transfer, errno, errmsg)
+                        if error is None:
+                            continue
+                        if error is True:
+                            queue.append(transfer)
+                        elif failure is None:
+                            failure = error
+                    if numqueued == 0:
+                        break
+                if active > 0:
+                    multi.select(1.0)
+        finally:
+            for handle in handles:
+                handle.close()
+            multi.close()
+
+        if failure is not None:
+            raise failure
+        for download in self.downloads:
+            download.finish()
+        self.downloads = list()
+
+    def finished(self, transfer, errno, errmsg):
+        """
+        Handle a finished transfer.
+
+        Returns `None` if the transfer is complete, `True` if it should be
+        re-attempted, and an exception object otherwise.
+        """
+        if errno == 0:
+            transfer.complete = True
+            return None
+
+        if errno == pycurl.E_RANGE_ERROR:
+            # Server does not support resuming transfers, start over
+            os.unlink(transfer.partfile)
+            return True
+        if errno in retry_errors and transfer.attempts <= self.retries:
+            if self.logstream is not None:  # pragma: no cover
+                message = 'Warning: resuming download of URL:: %s (%s)' % (
+                    transfer.url, errmsg)
+                print(message, file=self.logstream)
+            return True
+
+        print('Error: unable to download URL::', transfer.url, file=sys.stderr)
+        return pycurl.error(errno, errmsg)
 
 
 def url_download(urldata, localpath, compress=False, follow=True):
@@ -25,24 +265,189 @@ def url_download(urldata, localpath, compress=False, follow=True):
     - localpath: path of the filename to which output will be written
     - compress: output compression
     """
-    urls = urldata
-    if isinstance(urldata, str):
-        urls = [urldata]
-
-    openfunc = open
-    if compress is True:
-        openfunc = gzip.open
-
-    with openfunc(localpath, 'wb') as out:
-        for url in urls:
-            try:
-                c = pycurl.Curl()
-                c.setopt(c.URL, url)
-                c.setopt(c.WRITEDATA, out)
-                if follow:
-                    c.setopt(c.FOLLOWLOCATION, True)
-                c.perform()
-                c.close()
-            except pycurl.error as e:
-                print('Error: unable to download URL::', url, file=sys.stderr)
-                raise e
+    downloader = Downloader(follow=follow)
+    downloader.add(urldata, localpath, compress=compress)
+    downloader.run()
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+class LocalServer(object):
+    """
+    Local HTTP server for testing.
+
+    Files are served from the `files` dictionary. Requests for paths beginning
+    with `/norange/` ignore the Range header, and requests for paths beginning
+    with `/drop/` are cut short (once) after half of the data is sent. The
+    Range header of each request is recorded.
+    """
+
+    def __init__(self, files):
+        import threading
+        try:
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+            from socketserver import ThreadingMixIn
+        except ImportError:  # pragma: no cover
+            from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+            from SocketServer import ThreadingMixIn
+
+        requests = list()
+        dropped = set()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                filename = self.path.split('/')[-1]
+                if filename not in files:
+                    self.send_error(404)
+                    return
+                data = files[filename]
+                byterange = self.headers.get('Range')
+                requests.append((self.path, byterange))
+                start = 0
+                if byterange and not self.path.startswith('/norange/'):
+                    start = int(byterange.split('=')[1].split('-')[0])
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                        start, len(data) - 1, len(data)))
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(data) - start))
+                self.end_headers()
+                if self.path.startswith('/drop/') and self.path not in dropped:
+                    dropped.add(self.path)
+                    self.wfile.write(data[start:len(data) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(data[start:])
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.requests = requests
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_download():
+    """Download: concurrent, compressed, and concatenated downloads"""
+    import tempfile
+    files = {
+        'a.txt': b'ACGT' * 10000,
+        'b.txt': b'Hello, World!\n',
+        'c.txt': b'>seq\nGATTACA\n',
+    }
+    server = LocalServer(files)
+    tempdir = tempfile.mkdtemp()
+    try:
+        downloader = Downloader(maxconnections=2, logstream=None)
+        for filename in files:
+            downloader.add(server.url + '/' + filename,
+                           os.path.join(tempdir, filename))
+        downloader.add([server.url + '/b.txt', server.url + '/c.txt'],
+                       os.path.join(tempdir, 'bc.txt.gz'), compress=True)
+        downloader.run()
+        for filename in files:
+            with open(os.path.join(tempdir, filename), 'rb') as instream:
+                assert instream.read() == files[filename]
+        with gzip.open(os.path.join(tempdir, 'bc.txt.gz'), 'rb') as instream:
+            assert instream.read() == files['b.txt'] + files['c.txt']
+        assert sorted(os.listdir(tempdir)) == [
+            'a.txt', 'a.txt.sha1', 'b.txt', 'b.txt.sha1', 'bc.txt.gz',
+            'bc.txt.gz.sha1', 'c.txt', 'c.txt.sha1'
+        ]
+        for filename in os.listdir(tempdir):
+            if filename.endswith('.sha1'):
+                continue
+            filepath = os.path.join(tempdir, filename)
+            sha = genhub.checksum.update_sha1(hashlib.sha1(), filepath)
+            assert genhub.checksum.read_manifest(filepath) == sha.hexdigest()
+
+        outfile = os.path.join(tempdir, 'missing.txt')
+        checkfailed = False
+        try:
+            url_download(server.url + '/missing.txt', outfile)
+        except pycurl.error as e:
+            checkfailed = True
+            assert e.args[0] == pycurl.E_HTTP_RETURNED_ERROR
+        assert checkfailed
+        assert not os.path.exists(outfile)
+    finally:
+        server.close()
+        shutil.rmtree(tempdir)
+
+
+def test_resume():
+    """Download: resume partial downloads"""
+    import tempfile
+    data = b'GATTACA' * 5000
+    sha1 = hashlib.sha1(data).hexdigest()
+    server = LocalServer({'seq.txt': data})
+    tempdir = tempfile.mkdtemp()
+    try:
+        # Partial file from a previous invocation
+        outfile = os.path.join(tempdir, 'seq.txt')
+        with open(outfile + '.part', 'wb') as outstream:
+            outstream.write(data[:1000])
+        url_download(server.url + '/seq.txt', outfile)
+        with open(outfile, 'rb') as instream:
+            assert instream.read() == data
+        assert genhub.checksum.read_manifest(outfile) == sha1
+        assert server.requests[-1] == ('/seq.txt', 'bytes=1000-')
+        assert not os.path.exists(outfile + '.part')
+
+        # Connection dropped part way through the transfer
+        os.unlink(outfile)
+        downloader = Downloader(logstream=None)
+        downloader.add(server.url + '/drop/seq.txt', outfile)
+        downloader.run()
+        with open(outfile, 'rb') as instream:
+            assert instream.read() == data
+        assert genhub.checksum.read_manifest(outfile) == sha1
+        assert server.requests[-2:] == [
+            ('/drop/seq.txt', None),
+            ('/drop/seq.txt', 'bytes=%d-' % (len(data) // 2))
+        ], server.requests
+
+        # Server does not support resuming
+        os.unlink(outfile)
+        with open(outfile + '.part', 'wb') as outstream:
+            outstream.write(data[:1000])
+        url_download(server.url + '/norange/seq.txt', outfile)
+        with open(outfile, 'rb') as instream:
+            assert instream.read() == data
+        assert genhub.checksum.read_manifest(outfile) == sha1
+        assert server.requests[-2:] == [
+            ('/norange/seq.txt', 'bytes=1000-'),
+            ('/norange/seq.txt', None),
+        ], server.requests
+
+        # Partial file that is already complete
+        os.unlink(outfile)
+        with open(outfile + '.part', 'wb') as outstream:
+            outstream.write(data)
+        url_download(server.url + '/seq.txt', outfile)
+        with open(outfile, 'rb') as instream:
+            assert instream.read() == data
+        assert genhub.checksum.read_manifest(outfile) == sha1
+    finally:
+        server.close()
+        shutil.rmtree(tempdir)
@@ -11,33 +11,46 @@
 from __future__ import print_function
 import filecmp
 import re
-import subprocess
 import sys
 import genhub
 
 
+def feature_sequences(db, types=('exon', 'intron', 'CDS'),
+                      logstream=sys.stderr):
+    """
+    Extract exon, intron, and/or coding sequences for iLocus representatives.
+
+    All requested feature types are extracted in a single pass over the
+    `.ilocus.mrnas.gff3` file. Coding sequences for all gene models (not just
+    iLocus representatives) are also extracted if `CDS` is requested.
+    """
+    specdir = '%s/%s' % (db.workdir, db.label)
+    suffixes = {'exon': 'exons', 'intron': 'introns', 'CDS': 'cds'}
+    fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
+    with genhub.fasta.IndexedFasta(fastainfile) as genome:
+        if 'CDS' in types:
+            gff3infile = '%s/%s.gff3' % (specdir, db.label)
+            outfile = '%s/%s.all.cds.fa' % (specdir, db.label)
+            genhub.extract.extract_files(gff3infile, genome, {'CDS': outfile})
+
+        gff3infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
+        outfiles = dict()
+        for ftype in types:
+            outfiles[ftype] = '%s/%s.%s.fa' % (specdir, db.label,
+                                               suffixes[ftype])
+        filterfunc = None
+        if 'intron' in types:
+            filterfunc = parse_intron_accessions
+        genhub.extract.extract_files(gff3infile, genome, outfiles,
+                                     filterfunc=filterfunc)
+
+
 def cds_sequences(db, logstream=sys.stderr):
     if logstream is not None:  # pragma: no cover
         logmsg = '[GenHub: %s] ' % db.config['species']
         logmsg += 'extracting coding sequences'
         print(logmsg, file=logstream)
-    specdir = '%s/%s' % (db.workdir, db.label)
-
-    gff3infile = '%s/%s.gff3' % (specdir, db.label)
-    fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
-    outfile = '%s/%s.all.cds.fa' % (specdir, db.label)
-    command = 'xtractore --type=CDS --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
-
-    gff3infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
-    fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
-    outfile = '%s/%s.cds.fa' % (specdir, db.label)
-    command = 'xtractore --type=CDS --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    feature_sequences(db, types=['CDS'], logstream=logstream)
 
 
 def exon_sequences(db, logstream=sys.stderr):
@@ -45,15 +58,7 @@ def exon_sequences(db, logstream=sys.stderr):
         logmsg = '[GenHub: %s] ' % db.config['species']
         logmsg += 'extracting exon sequences'
         print(logmsg, file=logstream)
-    specdir = '%s/%s' % (db.workdir, db.label)
-
-    gff3infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
-    fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
-    outfile = '%s/%s.exons.fa' % (specdir, db.label)
-    command = 'xtractore --type=exon --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    feature_sequences(db, types=['exon'], logstream=logstream)
 
 
 def parse_intron_accessions(instream):
@@ -86,27 +91,7 @@ def intron_sequences(db, logstream=sys.stderr):
         logmsg = '[GenHub: %s] ' % db.config['species']
         logmsg += 'extracting intron sequences'
         print(logmsg, file=logstream)
-    specdir = '%s/%s' % (db.workdir, db.label)
-
-    infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
-    outfile = '%s/%s.with-introns.gff3' % (specdir, db.label)
-    command = 'canon-gff3 --outfile=%s %s' % (outfile, infile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
-
-    infile = '%s/%s.ilocus.mrnas.gff3' % (specdir, db.label)
-    outfile = '%s/%s.with-introns.gff3' % (specdir, db.label)
-    with open(infile, 'r') as instream, open(outfile, 'w') as outstream:
-        for line in parse_intron_accessions(instream):
-            print(line, file=outstream)
-
-    gff3infile = '%s/%s.with-introns.gff3' % (specdir, db.label)
-    fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
-    outfile = '%s/%s.introns.fa' % (specdir, db.label)
-    command = 'xtractore --type=intron --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    feature_sequences(db, types=['intron'], logstream=logstream)
 
 
 # -----------------------------------------------------------------------------
@@ -115,9 +100,11 @@ def intron_sequences(db, logstream=sys.stderr):
 
 
 def prepare(db, logstream=sys.stderr):  # pragma: no cover
-    exon_sequences(db, logstream=logstream)
-    intron_sequences(db, logstream=logstream)
-    cds_sequences(db, logstream=logstream)
+    if logstream is not None:
+        logmsg = '[GenHub: %s] ' % db.config['species']
+        logmsg += 'extracting exon, intron, and coding sequences'
+        print(logmsg, file=logstream)
+    feature_sequences(db, logstream=logstream)
 
 
 # -----------------------------------------------------------------------------
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Extract feature sequences from an indexed genome sequence.
+
+This module replaces the `xtractore` program from the AEGeAn Toolkit. The
+genome sequence is accessed through a `genhub.fasta.IndexedFasta` object, so it
+is indexed only once and never loaded into memory in its entirety, and any
+number of feature types can be extracted from the annotation in a single pass.
+Output is formatted identically to `xtractore`'s.
+"""
+
+from __future__ import print_function
+import filecmp
+import os
+import re
+import shutil
+import tempfile
+import genhub
+try:
+    from string import maketrans
+except ImportError:  # pragma: no cover
+    maketrans = str.maketrans
+
+
+complement = maketrans('ACGTRYMKBDHVacgtrymkbdhv',
+                       'TGCAYRKMVHDBtgcayrkmvhdb')
+
+
+def reverse_complement(seq):
+    return seq.translate(complement)[::-1]
+
+
+def get_attribute(attributes, key):
+    match = re.search(r'(?:^|;)%s=([^;\n]+)' % key, attributes)
+    if match:
+        return match.group(1)
+    return None
+
+
+class Feature(object):
+    """
+    A (multi-)feature from a GFF3 file.
+
+    Segments of a multi-feature (such as the CDS segments of an mRNA, which
+    share a common ID) are collected into a single object.
+    """
+
+    def __init__(self, fields):
+        self.seqid = fields[0]
+        self.type = fields[2]
+        self.strand = fields[6]
+        self.attributes = fields[8]
+        self.segments = [(int(fields[3]), int(fields[4]))]
+
+    def add_segment(self, fields):
+        self.segments.append((int(fields[3]), int(fields[4])))
+
+    @property
+    def start(self):
+        return min([s[0] for s in self.segments])
+
+    @property
+    def end(self):
+        return max([s[1] for s in self.segments])
+
+    @property
+    def position(self):
+        return '%s_%d-%d%s' % (self.seqid, self.start, self.end, self.strand)
+
+    @property
+    def label(self):
+        """Label features by accession, Name, or ID, in that order."""
+        for key in ['accession', 'Name', 'ID']:
+            value = get_attribute(self.attributes, key)
+            if value is not None:
+                return value
+        return '%s:%s' % (self.type, self.position)
+
+    def sequence(self, genome):
+        segments = sorted(self.segments)
+        seq = ''.join([genome.fetch(self.seqid, start, end)
+                       for start, end in segments])
+        if self.strand == '-':
+            seq = reverse_complement(seq)
+        return seq
+
+
+def features(instream, types):
+    """
+    Collect features of the specified types from a GFF3 stream.
+
+    Features are yielded in the order in which they first appear. Segments of
+    multi-features are assembled by ID within each `###`-delimited block.
+    """
+    block = list()
+    featsbyid = dict()
+    for line in instream:
+        if line.startswith('###'):
+            for feature in block:
+                yield feature
+            block = list()
+            featsbyid = dict()
+            continue
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) != 9 or fields[2] not in types:
+            continue
+
+        featid = get_attribute(fields[8], 'ID')
+        if featid is not None:
+            key = (fields[2], featid)
+            if key in featsbyid:
+                featsbyid[key].add_segment(fields)
+                continue
+        feature = Feature(fields)
+        if featid is not None:
+            featsbyid[key] = feature
+        block.append(feature)
+    for feature in block:
+        yield feature
+
+
+def sequences(instream, genome, types):
+    """
+    Extract the sequence of each feature of the specified type(s).
+
+    Yields the feature type, a defline, and the sequence of each feature.
+    """
+    for feature in features(instream, types):
+        defline = '>%s %s' % (feature.label, feature.position)
+        yield feature.type, defline, feature.sequence(genome)
+
+
+def extract(instream, genome, outstreams, linewidth=80):
+    """
+    Write feature sequences in Fasta format.
+
+    The `outstreams` argument is a dictionary mapping each feature type to be
+    extracted to the stream to which its sequences will be written; all feature
+    types are extracted in a single pass over the input.
+    """
+    writers = dict()
+    for ftype in outstreams:
+        writers[ftype] = genhub.fasta.FastaWriter(outstreams[ftype],
+                                                  linewidth=linewidth)
+    for ftype, defline, seq in sequences(instream, genome, outstreams):
+        writers[ftype].write(defline, seq)
+    for ftype in writers:
+        writers[ftype].close()
+
+
+def extract_files(gff3file, genome, outfiles, filterfunc=None):
+    """
+    Extract feature sequences from a GFF3 file and write them to file(s).
+
+    The `outfiles` argument is a dictionary mapping feature types to output
+    file names. If specified, `filterfunc` is applied to the GFF3 stream before
+    extraction.
+    """
+    outstreams = dict()
+    try:
+        for ftype in outfiles:
+            outstreams[ftype] = open(outfiles[ftype], 'w')
+        with open(gff3file, 'r') as instream:
+            if filterfunc:
+                instream = filterfunc(instream)
+            extract(instream, genome, outstreams)
+    finally:
+        for outstream in outstreams.values():
+            outstream.close()
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_loci():
+    """Extract: iLocus and miLocus sequences"""
+    tempdir = tempfile.mkdtemp()
+    genome = genhub.fasta.IndexedFasta(
+        'testdata/demo-workdir/Bdis/Bdis.gdna.fa',
+        indexfile=os.path.join(tempdir, 'Bdis.gdna.fa.fai')
+    )
+    try:
+        for ltype in ['iloci', 'miloci']:
+            testfile = 'testdata/fasta/bdis-%s.fa' % ltype
+            gff3file = 'testdata/gff3/bdis-%s.gff3' % ltype
+            outfile = os.path.join(tempdir, '%s.fa' % ltype)
+            extract_files(gff3file, genome, {'locus': outfile})
+            assert filecmp.cmp(outfile, testfile), \
+                '%s sequence extraction failed' % ltype
+    finally:
+        genome.close()
+        shutil.rmtree(tempdir)
+
+
+def test_single_pass():
+    """Extract: multiple feature types in a single pass"""
+    tempdir = tempfile.mkdtemp()
+    genome = genhub.fasta.IndexedFasta(
+        'testdata/demo-workdir/Atha/Atha.gdna.fa',
+        indexfile=os.path.join(tempdir, 'Atha.gdna.fa.fai')
+    )
+    gff3file = 'testdata/demo-workdir/Atha/Atha.ilocus.mrnas.gff3'
+    try:
+        outfiles = dict()
+        for ftype, suffix in [('exon', 'exons'), ('intron', 'introns'),
+                              ('CDS', 'cds')]:
+            outfiles[ftype] = os.path.join(tempdir, suffix + '.fa')
+        extract_files(gff3file, genome, outfiles,
+                      filterfunc=genhub.exons.parse_intron_accessions)
+        for ftype, suffix in [('exon', 'exons'), ('intron', 'introns'),
+                              ('CDS', 'cds')]:
+            testfile = 'testdata/fasta/atha-%s.fa' % suffix
+            assert filecmp.cmp(outfiles[ftype], testfile), \
+                '%s sequence extraction failed' % ftype
+    finally:
+        genome.close()
+        shutil.rmtree(tempdir)
+
+
+def test_multifeature():
+    """Extract: multi-features on the reverse strand"""
+    genome = {'chr1': 'AAAACCCCGGGGTTTT'}
+
+    class Genome(object):
+        def fetch(self, seqid, start, end):
+            return genome[seqid][start-1:end]
+
+    gff3 = ['chr1\t.\tmRNA\t1\t4\t.\t-\t.\tID=m1;accession=AcC1\n',
+            'chr1\t.\tmRNA\t9\t10\t.\t-\t.\tID=m1;accession=AcC1\n',
+            'chr1\t.\tgene\t1\t16\t.\t-\t.\tID=g1\n',
+            '###\n',
+            'chr1\t.\tmRNA\t5\t8\t.\t+\t.\tID=m1\n',
+            'chr1\t.\tmRNA\t13\t16\t.\t.\t.\tParent=g2\n']
+    testseqs = list(sequences(gff3, Genome(), ['mRNA']))
+    assert testseqs == [
+        ('mRNA', '>AcC1 chr1_1-10-', 'CCTTTT'),
+        ('mRNA', '>m1 chr1_5-8+', 'CCCC'),
+        ('mRNA', '>mRNA:chr1_13-16. chr1_13-16.', 'TTTT'),
+    ], testseqs
+    assert reverse_complement('ACGTNRYacgtn') == 'nacgtRYNACGT'
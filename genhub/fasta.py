@@ -11,56 +11,309 @@
 """Simple module for reading, writing, subsetting, and comparing sequences."""
 
 from __future__ import print_function
+import os
+import re
+import shutil
 import sys
+import tempfile
+import genhub
 try:
     from StringIO import StringIO
 except ImportError:  # pragma: no cover
     from io import StringIO
 
 
-def parse(data):
+def records(data):
     """
-    Load sequences in Fasta format.
+    Load sequences in Fasta format, without joining the sequence lines.
 
-    This generator function yields a tuple containing a defline and a sequence
-    for each record in the Fasta data. Stolen shamelessly from
-    http://stackoverflow.com/a/7655072/459780.
+    This generator function yields a tuple containing a defline and a list of
+    the sequence's lines (with trailing whitespace removed) for each record in
+    the Fasta data.
     """
-    name, seq = None, []
+    name, lines = None, []
     for line in data:
         line = line.rstrip()
         if line.startswith('>'):
             if name:
-                yield (name, ''.join(seq))
-            name, seq = line, []
+                yield (name, lines)
+            name, lines = line, []
         else:
-            seq.append(line)
+            lines.append(line)
     if name:
-        yield (name, ''.join(seq))
+        yield (name, lines)
+
+
+def parse(data):
+    """
+    Load sequences in Fasta format.
+
+    This generator function yields a tuple containing a defline and a sequence
+    for each record in the Fasta data. Stolen shamelessly from
+    http://stackoverflow.com/a/7655072/459780.
+
+    A binary stream is parsed with `parse_bytes`, and the deflines and
+    sequences are decoded.
+    """
+    if bytes is not str and hasattr(data, 'read') and \
+            isinstance(data.read(0), bytes):
+        for name, seq in parse_bytes(data):
+            yield (name.decode('utf-8'), seq.decode('utf-8'))
+        return
+    for name, lines in records(data):
+        yield (name, ''.join(lines))
+
+
+def records_bytes(instream, blocksize=4194304):
+    """
+    Load Fasta records from a binary stream, without decoding them.
+
+    This generator function yields a tuple containing a defline and the raw
+    sequence data (including line breaks) for each record, both as bytes. The
+    stream is read in blocks of `blocksize` bytes, and record boundaries are
+    located with `bytes.find`; the data of each record is copied only once,
+    into a single object.
+    """
+    buf, pos = b'\n', 0  # As if the data were preceded by a line break
+    defline, chunks = None, list()
+    inheader, atstart, eof = False, False, False
+    while True:
+        if inheader:
+            end = buf.find(b'\n', pos)
+            if end >= 0 or eof:
+                if end < 0:
+                    end = len(buf)
+                defline = buf[pos:end].rstrip()
+                pos = end + 1
+                inheader, atstart = False, True
+                continue
+            leftover = buf[pos:]
+        else:
+            # Find the next defline: at the start of a line, but the line
+            # break before an empty sequence is the previous defline's
+            if atstart and buf[pos:pos+1] == b'>':
+                nextdef = pos
+            else:
+                nextdef = buf.find(b'\n>', pos)
+                if nextdef >= 0:
+                    nextdef += 1
+            if nextdef >= 0:
+                chunks.append(buf[pos:nextdef])
+                if defline is not None:
+                    yield defline, b''.join(chunks)
+                defline, chunks = None, list()
+                pos = nextdef
+                inheader = True
+                continue
+            if eof:
+                chunks.append(buf[pos:])
+                if defline is not None:
+                    yield defline, b''.join(chunks)
+                return
+            # Keep the last byte, in case it begins a '\n>' boundary
+            keep = max(pos, len(buf) - 1)
+            chunks.append(buf[pos:keep])
+            if keep > pos:
+                atstart = False
+            leftover = buf[keep:]
+
+        block = instream.read(blocksize)
+        if len(block) == 0:
+            eof = True
+        buf, pos = leftover + block, 0
+
+
+def parse_bytes(instream, blocksize=4194304):
+    """
+    Load sequences in Fasta format from a binary stream, without decoding.
+
+    Like `parse`, but the defline and sequence of each record are yielded as
+    bytes; see `records_bytes`.
+    """
+    for defline, raw in records_bytes(instream, blocksize):
+        yield defline, raw.translate(None, b' \t\r\n')
+
+
+def wrap(seq, linewidth=70):
+    """Wrap a sequence (str or bytes) into lines, each with a line break."""
+    newline = b'\n' if isinstance(seq, bytes) else '\n'
+    if linewidth == 0 or len(seq) <= linewidth:
+        return seq + newline
+    lines = [seq[i:i+linewidth] for i in range(0, len(seq), linewidth)]
+    lines.append(seq[:0])
+    return newline.join(lines)
 
 
 def format(seq, linewidth=70, outstream=sys.stdout):
     """Print a sequence in a readable format."""
-    if linewidth == 0 or len(seq) <= linewidth:
-        print(seq, file=outstream)
-        return
+    outstream.write(wrap(seq, linewidth))
+
+
+class FastaWriter(object):
+    """
+    Buffered writer for sequences in Fasta format.
+
+    Records are wrapped with `wrap` and accumulated in a buffer, which is
+    written to the output stream in blocks of at least `buffersize`
+    characters, rather than with one `print` per line. Records whose sequence
+    lines are already wrapped at the target width can be copied through as is
+    with `write_lines` (or, for raw bytes from `records_bytes`, with
+    `write_raw`). Records are written either all as str or all as bytes. The
+    buffer is written when the writer is flushed or closed, or at the end of a
+    `with` statement; the output stream itself is not closed.
+    """
+
+    def __init__(self, outstream, linewidth=70, buffersize=1048576):
+        self.outstream = outstream
+        self.linewidth = linewidth
+        self.buffersize = buffersize
+        self.buffer = list()
+        self.buffered = 0
+
+    def append(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.buffersize:
+            self.flush()
+
+    def write(self, defline, seq):
+        """Write a record; the defline includes the leading `>`."""
+        newline = b'\n' if isinstance(seq, bytes) else '\n'
+        self.append(defline + newline)
+        self.append(wrap(seq, self.linewidth))
+
+    def wrapped(self, lines):
+        """Determine whether sequence lines are wrapped at the target width."""
+        if len(lines) == 0 or len(lines[-1]) == 0:
+            return False
+        if self.linewidth == 0:
+            return len(lines) == 1
+        if len(lines[-1]) > self.linewidth:
+            return False
+        for i in range(len(lines) - 1):
+            if len(lines[i]) != self.linewidth:
+                return False
+        return True
+
+    def write_lines(self, defline, lines):
+        """
+        Write a record given its sequence lines, such as from `records`.
+
+        Lines already wrapped at the target width are copied through
+        unchanged; otherwise the sequence is re-wrapped.
+        """
+        if not self.wrapped(lines):
+            self.write(defline, ''.join(lines))
+            return
+        self.append(defline + '\n')
+        self.append('\n'.join(lines) + '\n')
+
+    def wrapped_raw(self, raw):
+        """
+        Determine whether raw sequence data is wrapped at the target width.
+
+        Each line (including the last) must end with a line break, and every
+        line but the last must have exactly the target width; this is checked
+        for all lines at once by slicing the line break positions.
+        """
+        width = self.linewidth
+        if len(raw) < 2 or not raw.endswith(b'\n'):
+            return False
+        if width == 0:
+            return raw.count(b'\n') == 1 and b'\r' not in raw
+        breaks = raw[width::width+1]
+        partial = len(raw) % (width + 1)
+        if partial == 1 or breaks != b'\n' * len(breaks):
+            return False
+        numlines = len(breaks) + (1 if partial else 0)
+        return raw.count(b'\n') == numlines and b'\r' not in raw
+
+    def write_raw(self, defline, raw):
+        """
+        Write a record given its raw sequence data, such as from
+        `records_bytes`.
 
-    i = 0
-    while i < len(seq):
-        print(seq[i:i+linewidth], file=outstream)
-        i += linewidth
+        Data already wrapped at the target width is copied through unchanged;
+        otherwise the sequence is re-wrapped.
+        """
+        if not self.wrapped_raw(raw):
+            self.write(defline, raw.translate(None, b' \t\r\n'))
+            return
+        self.append(defline + b'\n')
+        self.append(raw)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.outstream.write(self.buffer[0][:0].join(self.buffer))
+        self.buffer = list()
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_ids(idstream):
+    """Load a set of sequence IDs, one per line, ignoring blank lines."""
+    ids = set([line.strip() for line in idstream])
+    ids.discard('')
+    return ids
 
 
 def select(idstream, seqstream):
-    ids = dict()
-    for line in idstream:
-        seqid = line.rstrip()
-        ids[seqid] = True
+    """
+    Select sequences by ID.
+
+    The IDs are read from `idstream` (one per line), or `idstream` can be a
+    set of IDs. See `select_many` for details.
+    """
+    ids = idstream if isinstance(idstream, (set, frozenset)) else \
+        read_ids(idstream)
+    for keys, defline, seq in select_many({'ids': ids}, seqstream):
+        yield defline, seq
+
+
+def select_many(idsets, seqstream):
+    """
+    Select sequences for several sets of IDs in a single pass over Fasta data.
+
+    The `idsets` argument is a dictionary of ID sets, keyed by arbitrary
+    labels. This generator function yields a tuple containing the list of
+    labels of the sets that include the sequence's ID, the defline, and the
+    sequence for each selected record.
+
+    Records are selected by the first word of the defline, which is checked
+    before any sequence lines are collected, so rejected records are skipped
+    without being assembled. Only the first record for each ID is selected,
+    and the input is read only until every requested ID has been found.
+    """
+    wanted = dict()
+    for key, ids in idsets.items():
+        for seqid in ids:
+            wanted.setdefault(seqid, list()).append(key)
+    if len(wanted) == 0:
+        return
 
-    for defline, seq in parse(seqstream):
-        seqid = defline[1:].split()[0]
-        if seqid in ids:
-            yield defline, seq
+    keys, defline, lines = None, None, None
+    for line in seqstream:
+        if line.startswith('>'):
+            if keys is not None:
+                yield keys, defline, ''.join(lines)
+                if len(wanted) == 0:
+                    return
+            fields = line[1:].split(None, 1)
+            keys = wanted.pop(fields[0], None) if fields else None
+            if keys is not None:
+                defline, lines = line.rstrip(), list()
+        elif keys is not None:
+            lines.append(line.rstrip())
+    if keys is not None:
+        yield keys, defline, ''.join(lines)
 
 
 def compare(stream1, stream2):
@@ -73,6 +326,217 @@ def compare(stream1, stream2):
     return seqs1 == seqs2
 
 
+class IndexedFasta(object):
+    """
+    Random access to the sequences of a Fasta file.
+
+    Sequence offsets are stored in an index compatible with `samtools faidx`.
+    By default the index is loaded from `<filename>.fai` if it exists and is
+    newer than the Fasta file; otherwise it is built from the Fasta file and
+    written to that location. Subsequences are then read from disk on demand,
+    so only the requested sequence data is ever held in memory.
+
+    Sequences are keyed by the first word of the defline. A different key can
+    be selected with `keyfunc`, a function that is applied to each defline
+    (without the leading `>`); such custom indexes are kept in memory only.
+    As with `samtools faidx`, only the first of any duplicated keys is
+    indexed, unless `unique` is set: then duplicated keys are an error, and
+    the index is always built from the Fasta file (since an existing index
+    would not record any duplicates).
+
+    BGZF-compressed Fasta files are supported transparently; as with
+    `samtools faidx`, index offsets then refer to the uncompressed data.
+    """
+
+    def __init__(self, filename, keyfunc=None, indexfile=None, unique=False):
+        self.filename = filename
+        self.indexfile = indexfile
+        if indexfile is None:
+            self.indexfile = filename + '.fai'
+        self.keyfunc = keyfunc
+        self.unique = unique
+        self.compressed = genhub.compress.is_bgzf(filename)
+        self.seqids = list()
+        self.index = dict()
+        self._fh = None
+
+        if keyfunc is None and not unique and self.index_current():
+            self.read_index()
+        else:
+            self.build_index()
+            if keyfunc is None:
+                self.write_index()
+
+    def index_current(self):
+        """Determine whether the index file exists and is up to date."""
+        if not os.path.exists(self.indexfile):
+            return False
+        return os.path.getmtime(self.indexfile) >= \
+            os.path.getmtime(self.filename)
+
+    def read_index(self):
+        with open(self.indexfile, 'r') as instream:
+            for line in instream:
+                if line.strip() == '':  # pragma: no cover
+                    continue
+                values = line.rstrip('\n').split('\t')
+                seqid = values[0]
+                self.seqids.append(seqid)
+                self.index[seqid] = tuple([int(v) for v in values[1:5]])
+
+    def write_index(self):
+        """
+        Write the index to disk.
+
+        The index is written to a temporary file and then moved into place, so
+        that concurrent readers never see an incomplete index.
+        """
+        tempindex = '%s.%d.tmp' % (self.indexfile, os.getpid())
+        with open(tempindex, 'w') as outstream:
+            for seqid in self.seqids:
+                values = [seqid] + [str(v) for v in self.index[seqid]]
+                print(*values, sep='\t', file=outstream)
+        os.rename(tempindex, self.indexfile)
+
+    def build_index(self):
+        """
+        Scan the Fasta file and record the offset and layout of each sequence.
+
+        Each entry consists of the sequence length, the byte offset of the
+        first nucleotide, the number of nucleotides per line, and the number
+        of bytes per line (including line terminators).
+        """
+        seqid = None
+        length, offset, linebases, linewidth = 0, 0, 0, 0
+        lastline = False
+        position = 0
+        if self.compressed:
+            instream = genhub.compress.open_gzip(self.filename, 'rb')
+        else:
+            instream = open(self.filename, 'rb')
+        with instream:
+            for line in instream:
+                linelength = len(line)
+                if line.startswith(b'>'):
+                    if seqid is not None:
+                        self._add_entry(seqid, length, offset, linebases,
+                                        linewidth)
+                    defline = line[1:].decode('utf-8').rstrip()
+                    if self.keyfunc:
+                        seqid = self.keyfunc(defline)
+                    else:
+                        seqid = defline.split()[0]
+                    length, linebases, linewidth = 0, 0, 0
+                    offset = position + linelength
+                    lastline = False
+                else:
+                    bases = len(line.rstrip())
+                    if bases > 0:
+                        if linebases == 0:
+                            linebases, linewidth = bases, linelength
+                        if lastline or bases > linebases:
+                            message = 'different line length in sequence '
+                            message += '"%s"' % seqid
+                            raise ValueError(message)
+                        if bases < linebases or linelength != linewidth:
+                            lastline = True
+                        length += bases
+                    elif seqid is not None:
+                        lastline = True
+                position += linelength
+        if seqid is not None:
+            self._add_entry(seqid, length, offset, linebases, linewidth)
+
+    def _add_entry(self, seqid, length, offset, linebases, linewidth):
+        if seqid in self.index:
+            if self.unique:
+                raise ValueError('duplicate seqid: ' + seqid)
+            return
+        self.seqids.append(seqid)
+        self.index[seqid] = (length, offset, linebases, linewidth)
+
+    @property
+    def filehandle(self):
+        if self._fh is None:
+            if self.compressed:
+                self._fh = genhub.compress.BgzfFile(self.filename)
+            else:
+                self._fh = open(self.filename, 'rb')
+        return self._fh
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+    def __contains__(self, seqid):
+        return seqid in self.index
+
+    def __iter__(self):
+        return iter(self.seqids)
+
+    def __len__(self):
+        return len(self.seqids)
+
+    def __getitem__(self, key):
+        """Retrieve a complete sequence by ID or a subsequence by region."""
+        if key in self.index:
+            return self.fetch(key)
+        return self.fetch(*self.parse_region(key))
+
+    def length(self, seqid):
+        return self.index[seqid][0]
+
+    def parse_region(self, region):
+        """
+        Parse a region string in the format `seqid:start-end`.
+
+        Coordinates are 1-based and inclusive. If the region string contains
+        no coordinates (or the full string is a known sequence ID), the entire
+        sequence is implied.
+        """
+        if region in self.index:
+            return region, None, None
+        seqid, _, coords = region.rpartition(':')
+        posmatch = re.match(r'^(\d+)-(\d+)$', coords.replace(',', ''))
+        if seqid == '' or not posmatch:
+            raise KeyError(region)
+        return seqid, int(posmatch.group(1)), int(posmatch.group(2))
+
+    def fetch(self, seqid, start=None, end=None):
+        """
+        Retrieve a (sub)sequence.
+
+        Coordinates are 1-based and inclusive; `end` is truncated to the
+        length of the sequence.
+        """
+        length, offset, linebases, linewidth = self.index[seqid]
+        if start is None:
+            start = 1
+        if end is None or end > length:
+            end = length
+        if start < 1 or start > end + 1:
+            raise ValueError('invalid region %s:%r-%r' % (seqid, start, end))
+        if start == end + 1:
+            return ''
+
+        first = start - 1
+        firstbyte = offset + (first // linebases) * linewidth + \
+            first % linebases
+        lastbyte = offset + ((end - 1) // linebases) * linewidth + \
+            (end - 1) % linebases
+        self.filehandle.seek(firstbyte)
+        data = self.filehandle.read(lastbyte - firstbyte + 1)
+        seq = data.replace(b'\n', b'').replace(b'\r', b'')
+        return seq.decode('utf-8')
+
+
 def test_parse():
     """Fasta: parsing"""
     data = ('>seq1\n'
@@ -133,6 +597,67 @@ def test_format_seq():
     sio.close()
 
 
+def test_parse_bytes():
+    """Fasta: parsing binary data"""
+    from io import BytesIO
+    data = (b'\n>seq1 first\nACGT\nAC\n>seq2\n>seq3\r\nGGGG\r\nTT\r\n\n'
+            b'>seq4\nNNNN')
+    for blocksize in [1, 3, 4096]:
+        records = list(records_bytes(BytesIO(data), blocksize=blocksize))
+        assert records == [(b'>seq1 first', b'ACGT\nAC\n'), (b'>seq2', b''),
+                           (b'>seq3', b'GGGG\r\nTT\r\n\n'),
+                           (b'>seq4', b'NNNN')]
+        seqs = list(parse_bytes(BytesIO(data), blocksize=blocksize))
+        assert seqs == [(b'>seq1 first', b'ACGTAC'), (b'>seq2', b''),
+                        (b'>seq3', b'GGGGTT'), (b'>seq4', b'NNNN')]
+    if bytes is not str:
+        assert list(parse(BytesIO(data)))[0] == ('>seq1 first', 'ACGTAC')
+
+    out = BytesIO()
+    with FastaWriter(out, linewidth=4) as writer:
+        for defline, raw in records_bytes(BytesIO(data)):
+            writer.write_raw(defline, raw)
+    assert out.getvalue() == (b'>seq1 first\nACGT\nAC\n>seq2\n\n'
+                              b'>seq3\nGGGG\nTT\n>seq4\nNNNN\n')
+
+    writer = FastaWriter(None, linewidth=4)
+    assert writer.wrapped_raw(b'ACGT\nAC\n')
+    assert writer.wrapped_raw(b'ACGT\nACGT\n')
+    assert not writer.wrapped_raw(b'ACG\nTAC\n')
+    assert not writer.wrapped_raw(b'ACGT\nAC')
+    assert not writer.wrapped_raw(b'ACGT\n\n')
+    assert not writer.wrapped_raw(b'ACGT\r\nAC\r\n')
+
+
+def test_writer():
+    """Fasta: buffered writer"""
+    seq = 'ACGTACGTAC' * 5
+    sio = StringIO()
+    with FastaWriter(sio, linewidth=20, buffersize=50) as writer:
+        writer.write('>seq2', 'ACGT')
+        assert sio.getvalue() == ''
+        writer.write('>seq1', seq)
+    wrapped = seq[:20] + '\n' + seq[20:40] + '\n' + seq[40:] + '\n'
+    assert sio.getvalue() == '>seq2\nACGT\n>seq1\n' + wrapped
+
+    writer = FastaWriter(None, linewidth=20)
+    assert writer.wrapped([seq[:20], seq[20:40], seq[40:]])
+    assert writer.wrapped(['ACGT'])
+    assert not writer.wrapped([seq[:30], seq[30:]])
+    assert not writer.wrapped([seq[:10], seq[10:30], seq[30:]])
+    assert not writer.wrapped([seq[:20], seq[20:40], seq[40:], ''])
+    assert not writer.wrapped([])
+
+    data = ('>seq1\n' + seq[:30] + '\n' + seq[30:] + '\n'
+            '>seq2 already wrapped\n' + wrapped)
+    sio = StringIO()
+    with FastaWriter(sio, linewidth=20) as writer:
+        for defline, lines in records(data.splitlines()):
+            writer.write_lines(defline, lines)
+    assert sio.getvalue() == ('>seq1\n' + wrapped +
+                              '>seq2 already wrapped\n' + wrapped)
+
+
 def test_select():
     """Fasta: sequence extraction"""
     data = ('>seq1\n'
@@ -148,6 +673,39 @@ def test_select():
         'extracted sequence mismatch: %r %r' % (seqs, testseqs)
 
 
+def test_select_many():
+    """Fasta: sequence extraction for multiple ID sets"""
+    data = ('>seq1 first\n'
+            'ACGT\n'
+            '>seq2\n'
+            'ACGTACGTACGTACGT\n'
+            'ACGT\n'
+            '>seq3\n'
+            '\n'
+            '>seq1 duplicate\n'
+            'TTTT\n'
+            '>seq4\n'
+            'GGGG\n')
+    idsets = {'a': set(['seq1', 'seq3']), 'b': set(['seq3', 'seq4'])}
+    selected = [(sorted(keys), defline, seq) for keys, defline, seq
+                in select_many(idsets, data.split('\n'))]
+    assert selected == [(['a'], '>seq1 first', 'ACGT'),
+                        (['a', 'b'], '>seq3', ''),
+                        (['b'], '>seq4', 'GGGG')], selected
+
+    # Reading stops as soon as all IDs have been found
+    lines = iter(data.split('\n'))
+    selected = list(select(set(['seq2']), lines))
+    assert selected == [('>seq2', 'ACGTACGTACGTACGTACGT')]
+    assert next(lines) == ''
+    assert next(lines) == '>seq1 duplicate'
+
+    idstream = ['seq2\n', '\n', 'seq1\n']
+    selected = list(select(idstream, data.split('\n')))
+    assert [defline for defline, seq in selected] == ['>seq1 first', '>seq2']
+    assert list(select([], data.split('\n'))) == []
+
+
 def test_compare():
     """Fasta: order-independent sequence comparison"""
     data1 = ('>seq1\n'
@@ -163,3 +721,104 @@ def test_compare():
 
     assert compare(data1.split('\n'), data2.split('\n')), \
         'sequence comparison failed'
+
+
+def test_indexed_fasta():
+    """Fasta: indexed random access"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        fastafile = os.path.join(tempdir, 'bdis-iloci.fa')
+        shutil.copy('testdata/fasta/bdis-iloci.fa', fastafile)
+        with open(fastafile, 'r') as instream:
+            seqs = dict()
+            for defline, seq in parse(instream):
+                seqs[defline[1:].split()[0]] = seq
+
+        index = IndexedFasta(fastafile)
+        umask = os.umask(0)
+        os.umask(umask)
+        assert os.stat(fastafile + '.fai').st_mode & 0o777 == 0o666 & ~umask
+        assert len(index) == len(seqs) == 6
+        assert sorted(index) == sorted(seqs)
+        for seqid in seqs:
+            assert index[seqid] == seqs[seqid]
+            assert index.length(seqid) == len(seqs[seqid])
+        index.close()
+
+        with IndexedFasta(fastafile) as index:
+            seq = seqs['BdisILC-00002']
+            assert index.fetch('BdisILC-00002', 1, 10) == seq[:10]
+            assert index.fetch('BdisILC-00002', 75, 165) == seq[74:165]
+            assert index['BdisILC-00002:81-160'] == seq[80:160]
+            assert index['BdisILC-00002:1000-1,000,000'] == seq[999:]
+            assert 'BdisILC-00002' in index
+            assert 'BdisILC-00002:1-10' not in index
+
+            for badregion in ['BogusSeq', 'BdisILC-00002:abc']:
+                try:
+                    seq = index[badregion]
+                    assert False, 'bad region %s passed' % badregion
+                except KeyError:
+                    pass
+            try:
+                seq = index.fetch('BdisILC-00002', 10, 5)
+                assert False, 'invalid coordinates passed'
+            except ValueError:
+                pass
+
+        index = IndexedFasta(fastafile, keyfunc=lambda d: d.split()[1])
+        assert index['NW_014576703.1_2843-23566.'] == seqs['BdisILC-00002']
+        index.close()
+
+        dupfile = os.path.join(tempdir, 'dup.fa')
+        with open(dupfile, 'w') as outstream:
+            print('>seq1\nACGT\n>seq2\nGG\n>seq1\nTTTT', file=outstream)
+        with IndexedFasta(dupfile) as index:
+            assert list(index) == ['seq1', 'seq2']
+            assert index['seq1'] == 'ACGT'
+        try:
+            index = IndexedFasta(dupfile, unique=True)
+            assert False, 'duplicate seqid passed'
+        except ValueError as e:
+            assert 'duplicate seqid: seq1' in str(e)
+
+        badfile = os.path.join(tempdir, 'bad.fa')
+        with open(badfile, 'w') as outstream:
+            print('>seq1\nACGT\nAC\nACGT', file=outstream)
+        try:
+            index = IndexedFasta(badfile)
+            assert False, 'inconsistent line lengths passed'
+        except ValueError as e:
+            assert 'different line length' in str(e)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def test_indexed_fasta_bgzf():
+    """Fasta: indexed random access, BGZF-compressed"""
+    tempdir = tempfile.mkdtemp()
+    try:
+        fastafile = os.path.join(tempdir, 'bdis-iloci.fa.gz')
+        with open('testdata/fasta/bdis-iloci.fa', 'rb') as instream:
+            data = instream.read()
+        with open(fastafile, 'wb') as outstream:
+            writer = genhub.compress.BgzfWriter(outstream, closefd=False)
+            writer.write(data)
+            writer.close()
+        plainfile = os.path.join(tempdir, 'bdis-iloci.fa')
+        shutil.copy('testdata/fasta/bdis-iloci.fa', plainfile)
+
+        with IndexedFasta(fastafile) as index, \
+                IndexedFasta(plainfile) as plainindex:
+            assert index.compressed and not plainindex.compressed
+            assert list(index) == list(plainindex)
+            assert index.index == plainindex.index
+            for seqid in plainindex:
+                assert index[seqid] == plainindex[seqid]
+            assert index['BdisILC-00002:75-165'] == \
+                plainindex['BdisILC-00002:75-165']
+        with open(fastafile + '.fai', 'r') as fai1, \
+                open(plainfile + '.fai', 'r') as fai2:
+            assert fai1.read() == fai2.read()
+    finally:
+        shutil.rmtree(tempdir)
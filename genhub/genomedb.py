@@ -21,9 +21,8 @@ specifics for managing data from a particular source.
 
 from __future__ import print_function
 import glob
-import gzip
-import hashlib
 import os
+import re
 import subprocess
 import sys
 import tempfile
@@ -36,10 +35,25 @@ except NameError:  # pragma: no cover
 
 class GenomeDB(object):
 
+    # Protein-->iLocus mapping (see `protein_mapping`): the type of the
+    # features that carry protein IDs, regular expressions for parsing the
+    # protein ID from their attributes (the first match wins), and a string
+    # marking features to be skipped.
+    protein_feature = 'mRNA'
+    protein_patterns = [r'Name=([^;\n]+)']
+    protein_exclude = None
+
+    # Subclasses whose `format_gdna` and `format_prot` methods read the input
+    # data as bytes (see `genhub.fasta.records_bytes`) rather than text.
+    binary_fasta = False
+
     def __init__(self, label, conf, workdir='.'):
         self.label = label
         self.config = conf
         self.workdir = workdir
+        self.cachedir = None
+        self.refresh_cache = False
+        self.compress_processed = False
         assert 'source' in conf, 'data source unconfigured'
 
     # ----------
@@ -143,6 +157,11 @@ class GenomeDB(object):
         filename = '%s.pre-mrnas.tsv' % self.label
         return self.file_path(filename)
 
+    @property
+    def seqlentable(self):
+        filename = '%s.seqlens.tsv' % self.label
+        return self.file_path(filename)
+
     # ----------
     # Determine whether raw data files need to be compressed during download.
     # ----------
@@ -214,11 +233,46 @@ class GenomeDB(object):
                                      compress=self.compress_prot)
 
     def download(self, logstream=sys.stderr):  # pragma: no cover
-        """Run download task."""
+        """
+        Run download task, retrieving all data files concurrently.
+
+        If `cachedir` is set, data files are retrieved from the download cache
+        (see `genhub.cache`) if possible, and newly downloaded files are added
+        to the cache. The cache does not check whether the remote files have
+        changed since they were cached; if `refresh_cache` is set, all files
+        are downloaded again and the cache is updated with the new contents.
+        """
         subprocess.call(['mkdir', '-p', self.dbdir])
-        self.download_gdna(logstream)
-        self.download_gff3(logstream)
-        self.download_prot(logstream)
+        if logstream is not None:
+            logmsg = '[GenHub: %s] ' % self.config['species']
+            logmsg += 'download genome sequence, annotation, and protein '
+            logmsg += 'sequences from %r' % self
+            print(logmsg, file=logstream)
+        downloads = [(self.gdnaurl, self.gdnapath, self.compress_gdna),
+                     (self.gff3url, self.gff3path, self.compress_gff3),
+                     (self.proturl, self.protpath, self.compress_prot)]
+        cache = None
+        if self.cachedir is not None:
+            cache = genhub.cache.DownloadCache(self.cachedir)
+        if cache is not None and not self.refresh_cache:
+            uncached = list()
+            for urldata, localpath, compress in downloads:
+                if cache.retrieve(urldata, localpath, compress):
+                    if logstream is not None:
+                        logmsg = '[GenHub: %s] ' % self.config['species']
+                        logmsg += 'retrieved %s from cache' % localpath
+                        print(logmsg, file=logstream)
+                else:
+                    uncached.append((urldata, localpath, compress))
+            downloads = uncached
+
+        downloader = genhub.download.Downloader(logstream=logstream)
+        for urldata, localpath, compress in downloads:
+            downloader.add(urldata, localpath, compress=compress)
+        downloader.run()
+        if cache is not None:
+            for urldata, localpath, compress in downloads:
+                cache.add(urldata, localpath, compress)
 
     def prep(self, logstream=sys.stderr, verify=True,
              strict=True):  # pragma: no cover
@@ -235,6 +289,12 @@ class GenomeDB(object):
         Set `verify` to False to skip shasum checks for pre-processed data. Set
         `strict` to False to proceed in case of failed verification.
 
+        If `compress_processed` is set, the genome sequence file is written
+        BGZF-compressed, with a `.gzi` block index (see `genhub.compress`).
+        The file name is unchanged, and it is read transparently by
+        `genhub.fasta.IndexedFasta`. Verification is always based on the
+        checksum of the uncompressed data.
+
         Note that this is a wrapper function: each subclass must implement 3
         methods (`format_gdna`, `format_gff3`, and `format_prot`) to do the
         actual formatting.
@@ -256,11 +316,18 @@ class GenomeDB(object):
                    'gff3': self.gff3file,
                    'prot': self.protfile}[datatype]
         if datatype != 'gff3':
+            mode, gzmode = ('rb', 'rb') if self.binary_fasta else ('r', 'rt')
             if infile.endswith('.gz'):
-                instream = gzip.open(infile, 'rt')
+                instream = genhub.compress.open_gzip(infile, gzmode)
             else:
-                instream = open(infile, 'r')
-            outstream = open(outfile, 'w')
+                instream = open(infile, mode)
+            filestream = genhub.checksum.HashingWriter(open(outfile, 'wb'))
+            outstream = filestream
+            compress = datatype == 'gdna' and self.compress_processed
+            if compress:
+                bgzfstream = genhub.compress.BgzfWriter(filestream,
+                                                        closefd=False)
+                outstream = genhub.checksum.HashingWriter(bgzfstream)
 
         if datatype == 'gdna':
             self.format_gdna(instream, outstream, logstream)
@@ -269,16 +336,28 @@ class GenomeDB(object):
         else:
             self.format_gff3(logstream)
 
+        # The sequence files are checksummed as they are written; the
+        # annotation is written by an external pipeline and must be read back.
         if datatype != 'gff3':
             instream.close()
             outstream.close()
+            testsha1 = outstream.hexdigest()
+            if compress:
+                filestream.close()
+                genhub.compress.write_gzi(bgzfstream.index, outfile + '.gzi')
+            elif os.path.exists(outfile + '.gzi'):
+                os.unlink(outfile + '.gzi')
+            genhub.checksum.write_manifest(outfile, filestream.hexdigest())
+            if datatype == 'gdna':
+                self.index_sequence_lengths()
+        else:
+            testsha1 = genhub.checksum.file_sha1(outfile, record=True)
 
         if verify is False:
             return
 
         if 'checksums' in self.config and datatype in self.config['checksums']:
             sha1 = self.config['checksums'][datatype]
-            testsha1 = self.file_sha1(outfile)
             passed = testsha1 == sha1
             if not passed:
                 message = '{} {} integrity check failed\n{}\n{}'.format(
@@ -307,40 +386,34 @@ class GenomeDB(object):
     def preprocess_prot(self, logstream=sys.stderr, verify=True, strict=True):
         self.preprocess('prot', logstream, verify, strict)
 
-    def filter_file(self):
+    def run_gff3_pipeline(self, pipeline, ignore=None,
+                          logstream=sys.stderr):
         """
-        Write exclusion filter to a temporary file and return.
-
-        Data configurations may include an optional `annotfilter` with patterns
-        to discard from the input annotation a la `grep -v`. This function
-        retrieves the pattern(s) from the genome configuration and writes them
-        to a temporary file that can be used in a `grep -vf` command. The
-        calling function is responsible for unlinking the temporary file from
-        the operating system.
+        Run an annotation pre-processing pipeline (see `genhub.gff3`).
+
+        Error messages containing any of the strings in `ignore` are not
+        reported.
         """
-        if 'annotfilter' not in self.config:
-            return None
-        excludefile = tempfile.NamedTemporaryFile(mode='wt', delete=False)
-        if isinstance(self.config['annotfilter'], str):
-            print(self.config['annotfilter'], file=excludefile)
-        else:
-            for exclusion in self.config['annotfilter']:
-                print(exclusion, file=excludefile)
-        excludefile.close()
-        return excludefile
+        messages = ['has not been previously introduced',
+                    'does not begin with "##gff-version"']
+        if ignore:
+            messages += ignore
+        pipeline.run(self.gff3path, self.gff3file, messages, logstream)
+        if logstream is not None:  # pragma: no cover
+            logmsg = '[GenHub: %s] ' % self.config['species']
+            logmsg += 'annotation pre-processing time: %s' % pipeline.summary()
+            print(logmsg, file=logstream)
 
-    def file_sha1(self, filepath):
+    def file_sha1(self, filepath, record=False):
         """
-        Stolen shamelessly from http://stackoverflow.com/a/19711609/459780.
+        Compute the SHA1 checksum of a data file.
+
+        The checksum is taken from the file's manifest (see `genhub.checksum`)
+        if it is current; the file is only read if the manifest is missing or
+        out of date. Set `record` to True to write a manifest for a newly
+        computed checksum.
         """
-        sha = hashlib.sha1()
-        with open(filepath, 'rb') as f:
-            while True:
-                block = f.read(2**10)
-                if not block:
-                    break
-                sha.update(block)
-            return sha.hexdigest()
+        return genhub.checksum.file_sha1(filepath, record=record)
 
     def cleanup(self, patterns_to_keep=None, fullclean=False, dryrun=False):
         """
@@ -351,8 +424,12 @@ class GenomeDB(object):
         - *.iloci.gff3
         - *.miloci.gff3
         - *.tsv
+        - *.parquet and *.npz (columnar statistics tables; see `genhub.stats`)
+        - *.build.json (the build state file; see `genhub.build`)
         - original (downloaded) data files
-        All other files are deleted.
+        All other files are deleted. Checksum manifests (`.sha1`) and Fasta
+        indexes (`.fai`, `.gzi`) are kept or deleted along with the
+        corresponding data file, and are not reported separately.
 
         If `fullclean` is true, the original data files are deleted as well.
         If `patterns_to_keep` is declared, each file to be deleted is checked
@@ -363,8 +440,13 @@ class GenomeDB(object):
         """
         dbfiles = glob.glob(self.dbdir + '/*')
         files_deleted = list()
-        suffixes = ['.iloci.fa', '.iloci.gff3', '.miloci.gff3', '.tsv']
+        suffixes = ['.iloci.fa', '.iloci.gff3', '.miloci.gff3', '.tsv',
+                    '.parquet', '.npz', '.build.json']
+        sidecars = ['.sha1', '.fai', '.gzi']
         for dbfile in dbfiles:
+            datafile, ext = os.path.splitext(dbfile)
+            if ext in sidecars and datafile in dbfiles:
+                continue
             tokeep = False
             for suffix in suffixes:
                 if dbfile.endswith(suffix):
@@ -386,8 +468,119 @@ class GenomeDB(object):
             files_deleted.append(dbfile)
             if not dryrun:  # pragma: no cover
                 os.unlink(dbfile)
+                for sidecar in sidecars:
+                    if dbfile + sidecar in dbfiles:
+                        os.unlink(dbfile + sidecar)
         return files_deleted
 
+    def protein_accession(self, protid):
+        """Convert a protein ID parsed from the annotation, if needed."""
+        return protid
+
+    def protein_mapping(self, instream):
+        """
+        Map protein IDs to iLocus names.
+
+        The input is the iLocus GFF3 file, in which each iLocus is followed by
+        its descendant features and then a `###` directive. The IDs of the
+        current iLocus and its genes and mRNAs are discarded at each `###`
+        directive, so apart from the set of protein IDs already reported,
+        memory usage is bounded by the largest iLocus rather than the size of
+        the annotation. Each protein is reported only once, for the first
+        iLocus in which it occurs, even if it is declared on several features
+        (such as one CDS feature per exon) or in several iLoci (such as genes
+        in the pseudoautosomal regions of X and Y).
+        """
+        locusnames = dict()
+        parents = dict()
+        proteins = set()
+        for line in instream:
+            if line.startswith('###'):
+                locusnames.clear()
+                parents.clear()
+                continue
+            record = genhub.gff3.Record(line.rstrip('\n'))
+            if record.fields is None:
+                continue
+
+            if record.ftype == 'locus':
+                locusid = record.get('ID')
+                locusname = record.get('Name')
+                if locusid and locusname:
+                    locusnames[locusid] = locusname
+            elif record.ftype == self.protein_feature:
+                attrs = record.attrstring
+                if self.protein_exclude and self.protein_exclude in attrs:
+                    continue
+                parentid = record.get('Parent')
+                protid = None
+                for pattern in self.protein_patterns:
+                    protmatch = re.search(pattern, attrs)
+                    if protmatch:
+                        protid = self.protein_accession(protmatch.group(1))
+                        break
+                assert parentid and protid, \
+                    'Unable to parse protein and parent IDs: %s' % attrs
+                if protid in proteins:
+                    continue
+                proteins.add(protid)
+                while parentid not in locusnames:
+                    parentid = parents[parentid]
+                yield protid, locusnames[parentid]
+            elif record.ftype in ['gene', 'mRNA']:
+                featureid = record.get('ID')
+                parentid = record.get('Parent')
+                if featureid and parentid:
+                    parents[featureid] = parentid
+                else:  # pragma: no cover
+                    print('Unable to parse %s and parent IDs: %s' %
+                          (record.ftype, record.attrstring), file=sys.stderr)
+
+    def index_sequence_lengths(self):
+        """
+        Build an index of the ID and length of each genomic sequence.
+
+        The index is a small tab-delimited sidecar of the pre-processed genome
+        sequence file, written when the sequences are pre-processed.
+        Sequences are not retained in memory, so the cost is a single pass
+        over the file.
+        """
+        indexfile = self.seqlentable
+        tempindex = '%s.%d.tmp' % (indexfile, os.getpid())
+        with genhub.compress.open_any(self.gdnafile) as instream, \
+                open(tempindex, 'w') as outstream:
+            print('SeqID', 'Length', sep='\t', file=outstream)
+            seqid, length = None, 0
+            for line in instream:
+                if line.startswith('>'):
+                    if seqid is not None:
+                        print(seqid, length, sep='\t', file=outstream)
+                    seqid, length = line[1:].split()[0], 0
+                else:
+                    length += len(line.rstrip())
+            if seqid is not None:
+                print(seqid, length, sep='\t', file=outstream)
+        os.rename(tempindex, indexfile)
+
+    def sequence_lengths(self):
+        """
+        Retrieve the ID and length of each genomic sequence.
+
+        Lengths are looked up in the index built by `index_sequence_lengths`;
+        the index is (re)built first if it is missing or older than the
+        pre-processed genome sequence file.
+        """
+        indexfile = self.seqlentable
+        if not os.path.exists(indexfile) or \
+                os.path.getmtime(indexfile) < os.path.getmtime(self.gdnafile):
+            self.index_sequence_lengths()
+
+        with open(indexfile, 'r') as instream:
+            next(instream)
+            for line in instream:
+                seqid, length = line.rstrip('\n').split('\t')
+                yield seqid, int(length)
+
     def get_prot_map(self):
         mapfile = '%s/%s.protein2ilocus.tsv' % (self.dbdir, self.label)
         with open(mapfile, 'r') as instream:
@@ -443,19 +636,6 @@ def test_props():
     assert db.source == 'crg'
 
 
-def test_filter_file():
-    """GenomeDB: filter file"""
-    db = genhub.test_registry.genome('Lalb')
-    assert db.filter_file() is None
-
-    db = genhub.test_registry.genome('Drer')
-    ff = db.filter_file()
-    with open(ff.name, 'r') as infile:
-        excludestr = infile.read()
-        assert excludestr.strip() == 'NC_002333.2'
-    os.unlink(ff.name)
-
-
 def test_compress():
     """GenomeDB: download compression"""
     db = genhub.test_registry.genome('Emex')
@@ -467,3 +647,115 @@ def test_compress():
     assert db.compress_gdna is True
     assert db.compress_gff3 is True
     assert db.compress_prot is True
+
+
+def test_cleanup_sidecars():
+    """GenomeDB: cleanup of checksum manifests and indexes"""
+    import shutil
+    workdir = tempfile.mkdtemp()
+    try:
+        db = genhub.test_registry.genome('Bdis', workdir=workdir)
+        os.mkdir(db.dbdir)
+        for suffix in ['gdna.fa', 'gdna.fa.fai', 'gdna.fa.sha1', 'iloci.fa',
+                       'iloci.fa.sha1', 'stray.sha1']:
+            open('%s/%s.%s' % (db.dbdir, db.label, suffix), 'w').close()
+        testfiles = sorted(db.cleanup())
+        assert testfiles == [db.gdnafile, db.dbdir + '/Bdis.stray.sha1']
+        assert sorted(os.listdir(db.dbdir)) == ['Bdis.iloci.fa',
+                                                'Bdis.iloci.fa.sha1']
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_protmap_blocks():
+    """GenomeDB: protein mapping discards IDs at the end of each iLocus"""
+    db = genhub.test_registry.genome('Emex')
+    gff3 = ['chr\tAEGeAn\tlocus\t1\t900\t.\t.\t.\tID=locus1;Name=Loc1',
+            'chr\tsrc\tgene\t1\t900\t.\t+\t.\tID=gene1;Parent=locus1',
+            'chr\tsrc\tmRNA\t1\t900\t.\t+\t.\tID=rna1;Parent=gene1;Name=P1',
+            '###',
+            'chr\tAEGeAn\tlocus\t901\t2000\t.\t.\t.\tID=locus2;Name=Loc2',
+            'chr\tsrc\tgene\t901\t2000\t.\t+\t.\tID=gene2;Parent=locus2',
+            'chr\tsrc\tmRNA\t901\t2000\t.\t+\t.\tID=rna2;Parent=gene2;Name=P2',
+            'chr\tsrc\tmRNA\t901\t1900\t.\t+\t.\tID=rna3;Parent=gene2;Name=P2',
+            '###']
+    assert list(db.protein_mapping(gff3)) == [('P1', 'Loc1'), ('P2', 'Loc2')]
+
+    # A protein in several iLoci is reported for the first only
+    gff3dup = [line.replace('locus2', 'locus3').replace('Loc2', 'Loc3')
+               .replace('gene2', 'gene3').replace('rna2', 'rna4')
+               .replace('rna3', 'rna5') for line in gff3[4:]]
+    assert list(db.protein_mapping(gff3 + gff3dup)) == [('P1', 'Loc1'),
+                                                        ('P2', 'Loc2')]
+
+    # gene1 is forgotten once its iLocus ends
+    orphan = 'chr\tsrc\tmRNA\t1\t800\t.\t+\t.\tID=rna4;Parent=gene1;Name=P4'
+    checkfailed = False
+    try:
+        list(db.protein_mapping(gff3[:4] + [orphan]))
+    except KeyError:
+        checkfailed = True
+    assert checkfailed
+
+
+def test_sequence_lengths():
+    """GenomeDB: sequence length index"""
+    import shutil
+    workdir = tempfile.mkdtemp()
+    try:
+        db = genhub.test_registry.genome('Bdis', workdir=workdir)
+        os.mkdir(db.dbdir)
+        with open(db.gdnafile, 'w') as outstream:
+            print('>chr1 chromosome 1', 'ACGT' * 15, 'ACG', sep='\n',
+                  file=outstream)
+            print('>chr2\n' + 'N' * 20, file=outstream)
+        assert list(db.sequence_lengths()) == [('chr1', 63), ('chr2', 20)]
+        assert os.path.exists(db.seqlentable)
+
+        # The index is used as long as it is up-to-date...
+        with open(db.seqlentable, 'a') as outstream:
+            print('chr3', '300', sep='\t', file=outstream)
+        assert len(list(db.sequence_lengths())) == 3
+
+        # ...and rebuilt otherwise
+        mtime = os.path.getmtime(db.seqlentable)
+        os.utime(db.gdnafile, (mtime + 10, mtime + 10))
+        assert list(db.sequence_lengths()) == [('chr1', 63), ('chr2', 20)]
+    finally:
+        shutil.rmtree(workdir)
+
+
+def test_compress_processed():
+    """GenomeDB: BGZF-compressed genome sequence"""
+    import shutil
+    workdir = tempfile.mkdtemp()
+    try:
+        config = {'gdna': 'testdata/fasta/generic.gdna.fa.gz',
+                  'gff3': 'testdata/gff3/generic.gff3',
+                  'prot': 'testdata/fasta/generic.prot.fa',
+                  'source': 'local', 'species': 'Gnrc'}
+        db = genhub.generic.GenericDB('Gnrc', config, workdir=workdir)
+        db.download(logstream=None)
+        db.preprocess_gdna(logstream=None, verify=False)
+        lengths = list(db.sequence_lengths())
+        plainfile = db.gdnafile + '.plain'
+        shutil.move(db.gdnafile, plainfile)
+
+        db.compress_processed = True
+        db.preprocess_gdna(logstream=None, verify=False)
+        assert genhub.compress.is_bgzf(db.gdnafile)
+        assert os.path.exists(db.gdnafile + '.gzi')
+        assert genhub.checksum.read_manifest(db.gdnafile) == \
+            genhub.checksum.file_sha1(db.gdnafile)
+        assert list(db.sequence_lengths()) == lengths
+        with genhub.fasta.IndexedFasta(db.gdnafile) as genome, \
+                genhub.fasta.IndexedFasta(plainfile) as plaingenome:
+            for seqid in plaingenome:
+                assert genome[seqid] == plaingenome[seqid]
+
+        db.compress_processed = False
+        db.preprocess_gdna(logstream=None, verify=False)
+        assert not genhub.compress.is_bgzf(db.gdnafile)
+        assert not os.path.exists(db.gdnafile + '.gzi')
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,764 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2015-2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2015-2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+In-process GFF3 normalization pipeline.
+
+Annotations are pre-processed by a chain of stages, each of which is a
+generator function that takes an iterable of lines (without trailing newlines)
+as its first argument and yields processed lines. Stages run in the same
+process, so lines are passed from one stage to the next without any text
+serialization. Tools that are not implemented in GenHub (such as AEGeAn's
+`tidygff3`) can be included with the `command` stage. The final sort is always
+done by GenomeTools (`gt gff3 -sort -tidy`).
+
+The time spent in each stage is recorded, and can be reported with the
+`Pipeline.summary` method. Since external commands run concurrently with the
+rest of the pipeline, the time recorded for an external command is the time
+spent waiting for its output.
+"""
+
+from __future__ import print_function
+import errno
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from timeit import default_timer as timer
+import genhub
+
+
+geneid_pattern = re.compile(r'GeneID:([^;,\n]+)')
+
+transcript_types = set([
+    'mRNA', 'tRNA', 'rRNA', 'transcript', 'primary_transcript', 'ncRNA',
+    'miRNA', 'snRNA', 'snoRNA', 'lnc_RNA', 'scRNA', 'SRP_RNA', 'antisense_RNA',
+    'RNase_P_RNA', 'telomerase_RNA', 'piRNA', 'RNase_MRP_RNA', 'guide_RNA',
+])
+vdj_types = set(['V_gene_segment', 'D_gene_segment', 'J_gene_segment',
+                 'C_gene_segment'])
+subfeature_types = set(['exon', 'intron', 'CDS'])
+
+
+class Record(object):
+    """
+    A single line of GFF3.
+
+    Feature lines are split into their 9 fields once; the attributes (9th
+    field) are only parsed into a dictionary if and when they are needed.
+    Lines that are not features (directives, comments, and malformed lines)
+    have no fields.
+    """
+
+    __slots__ = ['line', 'fields', 'ftype', '_attributes']
+
+    def __init__(self, line):
+        self.line = line
+        self.fields = line.split('\t')
+        self.ftype = None
+        if len(self.fields) == 9:
+            self.ftype = self.fields[2]
+        else:
+            self.fields = None
+        self._attributes = None
+
+    @property
+    def source(self):
+        return self.fields[1]
+
+    @property
+    def attrstring(self):
+        return self.fields[8]
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = dict()
+            for keyvalue in self.fields[8].split(';'):
+                if '=' not in keyvalue:
+                    continue
+                key, value = keyvalue.split('=', 1)
+                key = key.strip()
+                if key not in self._attributes:
+                    self._attributes[key] = value
+        return self._attributes
+
+    def get(self, key):
+        """Get the value of an attribute, or None if it is missing or empty."""
+        if self._attributes is None:
+            self.attributes
+        return self._attributes.get(key) or None
+
+    def add_attribute(self, key, value):
+        self.line += ';%s=%s' % (key, value)
+        self.fields[8] += ';%s=%s' % (key, value)
+        if self._attributes is not None and key not in self._attributes:
+            self._attributes[key] = value
+
+
+class IDRegistry(object):
+    """
+    Compact map of feature IDs to feature types and accessions.
+
+    Feature types are interned as small integer codes, so that the type of
+    each feature is not stored as a separate string. The `clear` method
+    discards all IDs (but not the type codes), so that the registry can be
+    emptied whenever all forward references have been resolved.
+    """
+
+    def __init__(self):
+        self.typecodes = dict()
+        self.typenames = list()
+        self.types = dict()
+        self.accessions = dict()
+
+    def __len__(self):
+        return len(self.types) + len(self.accessions)
+
+    def typecode(self, ftype):
+        code = self.typecodes.get(ftype)
+        if code is None:
+            code = len(self.typenames)
+            self.typecodes[ftype] = code
+            self.typenames.append(ftype)
+        return code
+
+    def set_type(self, featureid, ftype):
+        self.types[featureid] = self.typecode(ftype)
+
+    def get_type(self, featureid):
+        return self.typenames[self.types[featureid]]
+
+    def set_accession(self, featureid, accession):
+        self.accessions[featureid] = accession
+
+    def get_accession(self, featureid):
+        return self.accessions[featureid]
+
+    def has_accession(self, featureid):
+        return featureid in self.accessions
+
+    def clear(self):
+        self.types.clear()
+        self.accessions.clear()
+
+
+class FeatureFormatter(object):
+    """
+    Load features from GFF3, parse and (re-)attach accession numbers.
+
+    If `evict` is true, the IDs of all features are discarded at each `###`
+    directive, which by definition cannot be followed by references to any
+    preceding features. Memory usage is then bounded by the largest gene
+    rather than by the entire annotation.
+    """
+
+    def __init__(self, instream, source, evict=False):
+        self.instream = instream
+        self.source = source
+
+        self.evict = evict
+        self.ids = IDRegistry()
+        self.filters = ['\tregion\t', '\tmatch\t', '\tcDNA_match\t',
+                        '##species']
+
+        # Each feature type is handled by (at most) one of the parsers
+        self.parsers = {'gene': self.parse_gene}
+        for ftype in transcript_types:
+            self.parsers[ftype] = self.parse_transcript
+        for ftype in vdj_types:
+            self.parsers[ftype] = self.parse_vdj
+        for ftype in subfeature_types:
+            self.parsers[ftype] = self.parse_feature
+
+    def __iter__(self):
+        for line in self.instream:
+            record = Record(line.rstrip())
+            if self.match_filter(record):
+                continue
+            if record.fields is None:
+                if self.evict and record.line == '###':
+                    self.ids.clear()
+                yield record.line
+                continue
+            if self.pseudogenic_cds(record):
+                continue
+
+            self.parse_type(record)
+            parser = self.parsers.get(record.ftype)
+            if parser:
+                parser(record)
+
+            yield record.line
+
+    def parse_type(self, record):
+        featureid = record.get('ID')
+        if featureid:
+            self.ids.set_type(featureid, record.ftype)
+
+    def match_filter(self, record):
+        for filt in self.filters:
+            if filt in record.line:
+                return True
+        return False
+
+    def pseudogenic_cds(self, record):
+        """
+        Test whether the given entry is a pseudogene-associated CDS.
+
+        We want to ignore these!
+        """
+        if self.source == 'tair':
+            return False
+        if record.ftype != 'CDS':
+            return False
+
+        parentid = record.get('Parent')
+        assert parentid, record.attrstring
+        if self.ids.get_type(parentid) == 'pseudogene':
+            return True
+        return False
+
+    def parse_gene(self, record):
+        """Parse accession for gene features."""
+        if record.ftype != 'gene' or record.source == 'AEGeAn::tidygff3':
+            return
+
+        accession = None
+        if self.source == 'refseq':
+            accmatch = geneid_pattern.search(record.attrstring)
+            if accmatch:
+                accession = accmatch.group(1)
+        elif self.source == 'crg':
+            accession = record.get('ID')
+        elif self.source in ['genbank', 'pdom', 'tair', 'beebase']:
+            accession = record.get('Name')
+        elif self.source == 'local':
+            accession = record.get('accession')
+            if not accession:
+                accession = record.get('Name')
+        else:
+            pass
+        assert accession, 'unable to parse gene accession: %s' % record.line
+
+        geneid = record.get('ID')
+        if geneid:
+            self.ids.set_accession(geneid, accession)
+        else:
+            print('Warning: gene has no ID: %s' % record.attrstring,
+                  file=sys.stderr)
+
+        if 'accession' in record.attributes:
+            return
+        record.add_attribute('accession', accession)
+
+    def parse_transcript(self, record):
+        """Parse accession for transcript features."""
+        ftype = record.ftype
+        if ftype not in transcript_types:
+            return
+
+        accession = None
+        geneid = None
+        parentaccession = None
+        if self.source == 'refseq':
+            accession = record.get('transcript_id')
+            idmatch = geneid_pattern.search(record.attrstring)
+            if idmatch:
+                geneid = idmatch.group(1)
+        elif self.source == 'genbank':
+            parentaccession = self.ids.get_accession(record.get('Parent'))
+        elif self.source in ['crg', 'pdom']:
+            accession = record.get('ID')
+        elif self.source in ['beebase', 'tair', 'am10']:
+            accession = record.get('Name')
+        elif self.source == 'local':
+            accession = record.get('protein_id')
+            if not accession:
+                accession = record.get('accession')
+            if not accession:
+                accession = record.get('Name')
+        else:
+            pass
+        assert accession or geneid or parentaccession, \
+            'unable to parse transcript accession: %s' % record.line
+        if accession:
+            pass
+        elif parentaccession:
+            accession = '{}.{}'.format(parentaccession, ftype)
+        else:
+            accession = '%s:%s' % (geneid, ftype)
+
+        rnaid = record.get('ID')
+        if rnaid:
+            self.ids.set_accession(rnaid, accession)
+        else:
+            print('Warning: RNA has no ID: %s' % record.attrstring,
+                  file=sys.stderr)
+
+        if 'accession' in record.attributes:
+            return
+        record.add_attribute('accession', accession)
+
+    def parse_vdj(self, record):
+        """Parse accessions for features of V(D)J genes."""
+        if record.ftype not in vdj_types:
+            return
+
+        vdjid = record.get('ID')
+        accession = geneid_pattern.search(record.attrstring).group(1)
+        self.ids.set_accession(vdjid, accession)
+        record.add_attribute('accession', accession)
+
+    def parse_feature(self, record):
+        """Parse accession for exons, introns, and coding sequences"""
+        if record.ftype not in subfeature_types:
+            return
+        if 'accession' in record.attributes:
+            return
+
+        parentid = record.get('Parent')
+        if self.source == 'tair':
+            for pid in parentid.split(','):
+                if 'RNA' in pid:
+                    parentid = pid
+        assert ',' not in parentid, parentid
+        assert self.ids.has_accession(parentid), parentid
+        accession = self.ids.get_accession(parentid)
+        record.add_attribute('accession', accession)
+
+
+# -----------------------------------------------------------------------------
+# Pipeline stages
+# -----------------------------------------------------------------------------
+
+def exclude(lines, patterns):
+    """Discard lines matching any of the given patterns, a la `grep -v`."""
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    regex = re.compile('|'.join(['(?:%s)' % p for p in patterns]))
+    for line in lines:
+        if regex.search(line):
+            continue
+        yield line
+
+
+def substitute(lines, pattern, replacement):
+    """Replace the first match of a pattern in each line, a la `sed s///`."""
+    regex = re.compile(pattern)
+    for line in lines:
+        yield regex.sub(replacement, line, count=1)
+
+
+def uniq(lines):
+    """Discard duplicate lines, keeping the first occurrence."""
+    observed = set()
+    for line in lines:
+        if line in observed:
+            continue
+        observed.add(line)
+        yield line
+
+
+def namedup(lines):
+    """Copy the `ID` attribute to the `Name` attribute of unnamed features."""
+    for line in lines:
+        line = line.rstrip()
+        idmatch = re.search(r'ID=([^;\n]+)', line)
+        namematch = re.search(r'Name=([^;\n]+)', line)
+        if idmatch and not namematch:
+            line += ';Name=%s' % idmatch.group(1)
+        yield line
+
+
+def glean_to_gff3(lines):
+    """Convert GLEAN mRNA and CDS predictions to GFF3."""
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        assert len(fields) == 9
+        ftype = fields[2]
+        assert ftype in ['mRNA', 'CDS']
+
+        attrstring = fields[8]
+        protmatch = re.search(r'GenePrediction (\S+)', attrstring)
+        assert protmatch, line
+        protid = protmatch.group(1)
+        featid = protid
+        if ftype == 'CDS':
+            featid += '-CDS'
+        attrs = list()
+        attrs.append('ID=%s' % featid)
+        if ftype == 'CDS':
+            attrs.append('Parent=%s' % protid)
+        attrs.append('Name=%s' % protid)
+        fields[8] = ';'.join(attrs)
+        yield '\t'.join(fields)
+
+
+def sequence_regions(lines, seqlens):
+    """
+    Correct the end coordinate of each `##sequence-region` pragma.
+
+    The `seqlens` argument is a dictionary (or an iterable of pairs) of
+    sequence lengths, such as `GenomeDB.sequence_lengths()`; it is not
+    consumed until the first line is processed. Pragmas for sequences not in
+    `seqlens` are left unchanged.
+    """
+    seqlens = dict(seqlens)
+    regex = re.compile(r'^(##sequence-region\s+(\S+)\s+\d+\s+)(\d+)')
+    for line in lines:
+        if line.startswith('##sequence-region'):
+            seqreg = regex.match(line)
+            assert seqreg, 'cannot parse sequence-region pragma: ' + line
+            seqid = seqreg.group(2)
+            if seqid in seqlens:
+                line = '%s%d%s' % (seqreg.group(1), seqlens[seqid],
+                                   line[seqreg.end():])
+        yield line
+
+
+def format_features(lines, source, evict=False):
+    """Filter features and parse accession values; see `FeatureFormatter`."""
+    for line in FeatureFormatter(lines, source, evict):
+        yield line
+
+
+def command(lines, cmd, errstream=None):
+    """
+    Process lines with an external command.
+
+    The command reads lines on its standard input (fed by a separate thread)
+    and its output is yielded line by line. The command's error output is
+    written to `errstream`, if provided. If the generator is closed before
+    the command's output is exhausted, the command is terminated.
+    """
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=errstream,
+                            universal_newlines=True)
+    feed_errors = list()
+
+    def feed():
+        try:
+            for line in lines:
+                proc.stdin.write(line + '\n')
+        except Exception as e:  # pragma: no cover
+            feed_errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except IOError:  # pragma: no cover
+                pass
+
+    feeder = threading.Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+    finished = False
+    try:
+        for line in proc.stdout:
+            yield line.rstrip('\n')
+        finished = True
+    finally:
+        proc.stdout.close()
+        if not finished and proc.poll() is None:
+            proc.terminate()
+        proc.wait()
+        feeder.join()
+    if len(feed_errors) > 0:  # pragma: no cover
+        raise feed_errors[0]
+    assert proc.returncode == 0, \
+        'command failed: %s' % ' '.join(cmd)
+
+
+class Pipeline(object):
+    """
+    A chain of GFF3 processing stages.
+
+    Each stage is declared with a name, a generator function, and any
+    arguments to pass to the function after the input lines. For example,
+    the following is equivalent to `gunzip -c $infile | grep -v pattern |
+    genhub-uniq.py | gt gff3 -sort -tidy -o $outfile -force`.
+
+        pipeline = Pipeline()
+        pipeline.add('filter', exclude, 'pattern')
+        pipeline.add('uniq', uniq)
+        pipeline.run(infile, outfile)
+    """
+
+    def __init__(self):
+        self.stages = list()
+        self.timings = list()
+        self.errstream = tempfile.TemporaryFile(mode='w+')
+
+    def add(self, name, stage, *args):
+        self.stages.append((name, stage, args))
+
+    def add_command(self, name, cmd):
+        """Add an external command as a stage."""
+        self.add(name, command, cmd, self.errstream)
+
+    def timed(self, lines, index):
+        """Record the time spent retrieving lines from a stage."""
+        lines = iter(lines)
+        while True:
+            start = timer()
+            try:
+                line = next(lines)
+            except StopIteration:
+                self.timings[index][1] += timer() - start
+                return
+            self.timings[index][1] += timer() - start
+            yield line
+
+    def lines(self, infile):
+        """Read the input (optionally gzip-compressed) and run all stages."""
+        self.timings = [['read', 0.0]]
+        if infile.endswith('.gz'):
+            instream = genhub.compress.open_gzip(infile, 'rt')
+        else:
+            instream = open(infile, 'r')
+        generators = list()
+        with instream:
+            try:
+                lines = self.timed((ln.rstrip('\n') for ln in instream), 0)
+                generators.append(lines)
+                for name, stage, args in self.stages:
+                    self.timings.append([name, 0.0])
+                    stagelines = stage(lines, *args)
+                    lines = self.timed(stagelines, len(self.timings) - 1)
+                    generators.extend([stagelines, lines])
+                for line in lines:
+                    yield line
+            finally:
+                # Shut down all stages (such as external commands), from
+                # downstream to upstream, if the output is not exhausted
+                for gen in reversed(generators):
+                    if hasattr(gen, 'close'):
+                        gen.close()
+
+        # Each stage's time includes the time spent in upstream stages
+        for i in range(len(self.timings) - 1, 0, -1):
+            self.timings[i][1] -= self.timings[i - 1][1]
+
+    def run(self, infile, outfile, ignore=None, logstream=sys.stderr):
+        """
+        Run the pipeline, and sort the output with GenomeTools.
+
+        Error output of the external commands is printed to `logstream`,
+        except for lines containing any of the strings in `ignore`.
+        """
+        start = timer()
+        sortcmd = ['gt', 'gff3', '-sort', '-tidy', '-o', outfile, '-force']
+        proc = subprocess.Popen(sortcmd, stdin=subprocess.PIPE,
+                                stderr=self.errstream,
+                                universal_newlines=True)
+        lines = self.lines(infile)
+        try:
+            for line in lines:
+                proc.stdin.write(line + '\n')
+        except IOError as e:
+            # If the sort command exits early, its exit status is checked below
+            if e.errno != errno.EPIPE:
+                raise
+        finally:
+            lines.close()
+            try:
+                proc.stdin.close()
+            except IOError:  # pragma: no cover
+                pass
+            proc.wait()
+            self.print_errors(ignore, logstream)
+        elapsed = timer() - start
+        self.timings.append(['sort', elapsed - sum([t[1] for t in
+                                                    self.timings])])
+        assert proc.returncode == 0, \
+            'annot cleanup command failed: %s' % ' '.join(sortcmd)
+
+    def print_errors(self, ignore=None, logstream=sys.stderr):
+        self.errstream.seek(0)
+        errors = self.errstream.read()
+        self.errstream.close()
+        if logstream is None:
+            return
+        for line in errors.split('\n'):  # pragma: no cover
+            if line == '':
+                continue
+            if ignore and any([message in line for message in ignore]):
+                continue
+            print(line, file=logstream)
+
+    def summary(self):
+        """Summarize the time spent in each stage."""
+        return ', '.join(['%s %.2fs' % (n, t) for n, t in self.timings])
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_stages():
+    """GFF3: in-process pipeline stages"""
+    lines = ['chr1\tNCBI\tregion\t1\t1000\t.\t+\t.\tID=chr1',
+             'chr1\tNCBI\tgene\t100\t500\t.\t+\t.\tID=gene1',
+             'chr1\tNCBI\tgene\t100\t500\t.\t+\t.\tID=gene1',
+             'scaffold_2\tNCBI\ttranscript\t200\t400\t.\t-\t.\tID=t1;Name=t1']
+    assert list(exclude(lines, '\tregion\t')) == lines[1:]
+    assert list(exclude(lines, ['^scaf', 'region'])) == lines[1:3]
+    assert list(uniq(lines)) == [lines[0], lines[1], lines[3]]
+    assert list(namedup(lines[1:2])) == [lines[1] + ';Name=gene1']
+    assert list(namedup(lines[3:])) == lines[3:]
+
+    newlines = substitute(lines[3:], '\ttranscript\t', '\tmRNA\t')
+    newlines = substitute(newlines, 'scaffold_', 'BdisScf_')
+    assert list(newlines) == [
+        'BdisScf_2\tNCBI\tmRNA\t200\t400\t.\t-\t.\tID=t1;Name=t1'
+    ]
+
+    glean = ['Scf1\tGLEAN\tmRNA\t1\t9\t.\t+\t.\tGenePrediction GB1\n',
+             'Scf1\tGLEAN\tCDS\t1\t9\t.\t+\t0\tGenePrediction GB1\n']
+    assert list(glean_to_gff3(glean)) == [
+        'Scf1\tGLEAN\tmRNA\t1\t9\t.\t+\t.\tID=GB1;Name=GB1',
+        'Scf1\tGLEAN\tCDS\t1\t9\t.\t+\t0\tID=GB1-CDS;Parent=GB1;Name=GB1',
+    ]
+
+    assert list(command(lines, ['grep', 'gene'])) == lines[1:3]
+
+    # Closing the output early shuts down the command and its feeder thread
+    def endless():
+        while True:
+            yield lines[1]
+    threads = threading.active_count()
+    output = command(endless(), ['cat'])
+    assert next(output) == lines[1]
+    output.close()
+    assert threading.active_count() == threads
+
+    checkfailed = False
+    try:
+        list(command(lines, ['grep', 'bogus']))
+    except AssertionError as e:
+        checkfailed = 'command failed' in str(e)
+    assert checkfailed
+
+    pragmas = ['##gff-version   3\n',
+               '##sequence-region   chr1 164 900\n',
+               '##sequence-region   chr2 1 2000\n']
+    lengths = iter([('chr1', 5000), ('chr3', 300)])
+    assert list(sequence_regions(pragmas + lines, lengths)) == [
+        pragmas[0], '##sequence-region   chr1 164 5000\n', pragmas[2]
+    ] + lines
+
+
+def test_record():
+    """GFF3: feature records"""
+    record = Record('##gff-version   3')
+    assert record.fields is None and record.ftype is None
+
+    line = 'chr1\tNCBI\tmRNA\t100\t500\t.\t+\t.\tID=rna1;Parent=gene1;Name='
+    record = Record(line)
+    assert record.ftype == 'mRNA'
+    assert record.source == 'NCBI'
+    assert record._attributes is None
+    assert record.get('ID') == 'rna1'
+    assert record.get('Name') is None
+    assert record.get('accession') is None
+    assert record.attributes == {'ID': 'rna1', 'Parent': 'gene1', 'Name': ''}
+    record.add_attribute('accession', 'NM_001.1')
+    assert record.line == line + ';accession=NM_001.1'
+    assert record.attrstring.endswith('Name=;accession=NM_001.1')
+    assert record.get('accession') == 'NM_001.1'
+
+
+def test_formatter():
+    """GFF3: attach accessions to features"""
+    lines = [
+        '##gff-version   3',
+        'chr1\tNCBI\tregion\t1\t1000\t.\t+\t.\tID=chr1',
+        'chr1\tNCBI\tgene\t100\t500\t.\t+\t.\tID=gene1;Name=Gene1',
+        'chr1\tNCBI\tmRNA\t100\t500\t.\t+\t.\tID=rna1;Parent=gene1;Name=R1',
+        'chr1\tNCBI\texon\t100\t500\t.\t+\t.\tParent=rna1',
+    ]
+    assert list(format_features(lines, 'beebase')) == [
+        '##gff-version   3',
+        'chr1\tNCBI\tgene\t100\t500\t.\t+\t.\tID=gene1;Name=Gene1;'
+        'accession=Gene1',
+        'chr1\tNCBI\tmRNA\t100\t500\t.\t+\t.\tID=rna1;Parent=gene1;Name=R1;'
+        'accession=R1',
+        'chr1\tNCBI\texon\t100\t500\t.\t+\t.\tParent=rna1;accession=R1',
+    ]
+
+
+def test_registry():
+    """GFF3: compact feature ID registry"""
+    ids = IDRegistry()
+    ids.set_type('gene1', 'gene')
+    ids.set_type('rna1', 'mRNA')
+    ids.set_type('gene2', 'gene')
+    ids.set_accession('rna1', 'NM_001.1')
+    assert ids.get_type('gene2') == 'gene'
+    assert ids.types == {'gene1': 0, 'rna1': 1, 'gene2': 0}
+    assert ids.has_accession('rna1') and not ids.has_accession('gene1')
+    assert ids.get_accession('rna1') == 'NM_001.1'
+    assert len(ids) == 4
+    ids.clear()
+    assert len(ids) == 0
+    assert ids.typecode('mRNA') == 1
+
+
+def test_evict():
+    """GFF3: discard feature IDs at ### directives"""
+    lines = [
+        'chr1\tNCBI\tgene\t100\t500\t.\t+\t.\tID=gene1;Name=Gene1',
+        'chr1\tNCBI\tmRNA\t100\t500\t.\t+\t.\tID=rna1;Parent=gene1;Name=R1',
+        'chr1\tNCBI\texon\t100\t500\t.\t+\t.\tParent=rna1',
+        '###',
+        'chr1\tNCBI\tgene\t700\t900\t.\t+\t.\tID=gene2;Name=Gene2',
+    ]
+    formatter = FeatureFormatter(lines, 'beebase', evict=True)
+    sizes = [len(formatter.ids) for line in formatter]
+    assert sizes == [2, 4, 4, 0, 2]
+    formatter = FeatureFormatter(lines, 'beebase')
+    sizes = [len(formatter.ids) for line in formatter]
+    assert sizes == [2, 4, 4, 4, 6]
+
+    # Forward references across ### are not allowed
+    lines.append('chr1\tNCBI\texon\t100\t500\t.\t+\t.\tParent=rna1')
+    checkfailed = False
+    try:
+        list(FeatureFormatter(lines, 'beebase', evict=True))
+    except AssertionError as e:
+        checkfailed = True
+        assert 'rna1' in str(e)
+    assert checkfailed
+
+
+def test_timings():
+    """GFF3: pipeline stage timings"""
+    pipeline = Pipeline()
+    pipeline.add('filter', exclude, '^#')
+    pipeline.add('uniq', uniq)
+    pipeline.add('format', format_features, 'local')
+    lines = list(pipeline.lines('testdata/gff3/generic.gff3'))
+    assert len(lines) > 0
+    assert [name for name, _ in pipeline.timings] == ['read', 'filter',
+                                                      'uniq', 'format']
+    for name, elapsed in pipeline.timings:
+        assert elapsed >= 0.0
+    assert pipeline.summary().startswith('read ')
+
+    # Closing the output early shuts down external commands
+    threads = threading.active_count()
+    pipeline = Pipeline()
+    pipeline.add_command('cat', ['cat'])
+    pipeline.add('uniq', uniq)
+    output = pipeline.lines('testdata/gff3/generic.gff3')
+    assert next(output).startswith('##gff-version')
+    output.close()
+    assert threading.active_count() == threads
@@ -19,7 +19,6 @@ from __future__ import print_function
 import filecmp
 import gzip
 import re
-import subprocess
 import sys
 import genhub
 
@@ -67,33 +66,18 @@ class HymBaseDB(genhub.genomedb.GenomeDB):
             print(line, end='', file=outstream)
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
-        cmds = list()
-        cmds.append('gunzip -c %s' % self.gff3path)
+        pipeline = genhub.gff3.Pipeline()
         if 'annotfilter' in self.config:
-            excludefile = self.filter_file()
-            cmds.append('grep -vf %s' % excludefile.name)
-        cmds.append("grep -v '\tregion\t'")
-        cmds.append('genhub-uniq.py')
-        cmds.append('genhub-namedup.py')
-        cmds.append('tidygff3')
-        cmds.append('genhub-format-gff3.py --source beebase -')
-        cmds.append('seq-reg.py - %s' % self.gdnafile)
-        cmds.append('gt gff3 -sort -tidy -o %s -force' % self.gff3file)
-
-        commands = 'bash -o pipefail -c "%s"' % ' | '.join(cmds)
-        if debug:  # pragma: no cover
-            print('DEBUG: running command: %s' % commands, file=logstream)
-        proc = subprocess.Popen(commands, shell=True, universal_newlines=True,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):  # pragma: no cover
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               'has the wrong phase' not in line and \
-               line != '':
-                print(line, file=logstream)
-        assert proc.returncode == 0, \
-            'annot cleanup command failed: %s' % commands
+            pipeline.add('annotfilter', genhub.gff3.exclude,
+                         self.config['annotfilter'])
+        pipeline.add('noregion', genhub.gff3.exclude, '\tregion\t')
+        pipeline.add('uniq', genhub.gff3.uniq)
+        pipeline.add('namedup', genhub.gff3.namedup)
+        pipeline.add_command('tidygff3', ['tidygff3'])
+        pipeline.add('format', genhub.gff3.format_features, 'beebase', True)
+        pipeline.add('seq-reg', genhub.gff3.sequence_regions,
+                     self.sequence_lengths())
+        self.run_gff3_pipeline(pipeline, ['has the wrong phase'], logstream)
 
     def gff3_protids(self, instream):
         for line in instream:
@@ -101,42 +85,10 @@ class HymBaseDB(genhub.genomedb.GenomeDB):
                 continue
             namematch = re.search(r'Name=([^;\n]+)', line)
             assert namematch, 'cannot parse mRNA name: ' + line
-            protid = namematch.group(1).replace('-RA', '-PA')
-            yield protid
+            yield self.protein_accession(namematch.group(1))
 
-    def protein_mapping(self, instream):
-        locusid2name = dict()
-        gene2loci = dict()
-        for line in instream:
-            fields = line.split('\t')
-            if len(fields) != 9:
-                continue
-            feattype = fields[2]
-            attrs = fields[8]
-
-            if feattype == 'locus':
-                idmatch = re.search(r'ID=([^;\n]+);.*Name=([^;\n]+)', attrs)
-                if idmatch:
-                    locusid = idmatch.group(1)
-                    locusname = idmatch.group(2)
-                    locusid2name[locusid] = locusname
-            elif feattype == 'gene':
-                idmatch = re.search(r'ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                assert idmatch, \
-                    'Unable to parse gene and iLocus IDs: %s' % attrs
-                geneid = idmatch.group(1)
-                ilocusid = idmatch.group(2)
-                gene2loci[geneid] = ilocusid
-            elif feattype == 'mRNA':
-                pattern = 'Parent=([^;\n]+);.*Name=([^;\n]+)'
-                idmatch = re.search(pattern, attrs)
-                assert idmatch, \
-                    'Unable to parse mRNA and gene IDs: %s' % attrs
-                protid = idmatch.group(2).replace('-RA', '-PA')
-                geneid = idmatch.group(1)
-                locusid = gene2loci[geneid]
-                locusname = locusid2name[locusid]
-                yield protid, locusname
+    def protein_accession(self, protid):
+        return protid.replace('-RA', '-PA')
 
 
 class BeeBaseDB(HymBaseDB):
@@ -170,31 +122,18 @@ class BeeBaseDB(HymBaseDB):
             print(line, end='', file=outstream)
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
-        cmds = list()
-        cmds.append('gunzip -c %s' % self.gff3path)
-        cmds.append('genhub-namedup.py')
-        cmds.append("sed 's/scaffold/%sScf_/'" % self.label)
-        cmds.append("sed 's/Group/%sGroup/'" % self.label)
-        cmds.append('tidygff3')
-        cmds.append('genhub-format-gff3.py --source beebase -')
-        cmds.append('seq-reg.py - %s' % self.gdnafile)
-        cmds.append('gt gff3 -sort -tidy -o %s -force' % self.gff3file)
-
-        commands = 'bash -o pipefail -c "%s"' % ' | '.join(cmds)
-        if debug:  # pragma: no cover
-            print('DEBUG: running command: %s' % commands, file=logstream)
-        proc = subprocess.Popen(commands, shell=True, universal_newlines=True,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):  # pragma: no cover
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               'illegal uppercase attribute "Shift"' not in line and \
-               'has the wrong phase' not in line and \
-               line != '':
-                print(line, file=logstream)
-        assert proc.returncode == 0, \
-            'annot cleanup command failed: %s' % commands
+        pipeline = genhub.gff3.Pipeline()
+        pipeline.add('namedup', genhub.gff3.namedup)
+        pipeline.add('rename1', genhub.gff3.substitute, 'scaffold',
+                     '%sScf_' % self.label)
+        pipeline.add('rename2', genhub.gff3.substitute, 'Group',
+                     '%sGroup' % self.label)
+        pipeline.add_command('tidygff3', ['tidygff3'])
+        pipeline.add('format', genhub.gff3.format_features, 'beebase', True)
+        pipeline.add('seq-reg', genhub.gff3.sequence_regions,
+                     self.sequence_lengths())
+        ignore = ['illegal uppercase attribute "Shift"', 'has the wrong phase']
+        self.run_gff3_pipeline(pipeline, ignore, logstream)
 
 
 # -----------------------------------------------------------------------------
@@ -101,21 +101,11 @@ def sequences(db, logstream=sys.stderr):
 
     specdir = '%s/%s' % (db.workdir, db.label)
     fastain = '%s/%s.gdna.fa' % (specdir, db.label)
-    for ltype in ['iloci', 'miloci']:
-        outfile = '%s/%s.%s.fa' % (specdir, db.label, ltype)
-        gff3in = '%s/%s.%s.gff3' % (specdir, db.label, ltype)
-        command = 'xtractore --type=locus '
-        command += '--outfile=%s %s %s' % (outfile, gff3in, fastain)
-        cmd = command.split(' ')
-        proc = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                universal_newlines=True)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               line != '':  # pragma: no cover
-                print(line, file=logstream)
-        assert proc.returncode == 0, 'command failed: ' + command
+    with genhub.fasta.IndexedFasta(fastain) as genome:
+        for ltype in ['iloci', 'miloci']:
+            outfile = '%s/%s.%s.fa' % (specdir, db.label, ltype)
+            gff3in = '%s/%s.%s.gff3' % (specdir, db.label, ltype)
+            genhub.extract.extract_files(gff3in, genome, {'locus': outfile})
 
 
 def ancillary(db, logstream=sys.stderr):
@@ -70,7 +70,7 @@ def mature_mrna_intervals(db, logstream=sys.stderr):
     Extracting the sequence of a pre-mRNA is trivial, but extracting the
     sequence of a mature mRNA (sans introns) requires some additional work.
     This function creates a new GFF3 file containing mRNA multi-features,
-    enabling sequence extraction via xtractore.
+    enabling sequence extraction with the `genhub.extract` module.
     """
     if logstream is not None:  # pragma: no cover
         logmsg = '[GenHub: %s] ' % db.config['species']
@@ -117,45 +117,30 @@ def sequences(db, logstream=sys.stderr):
         print(logmsg, file=logstream)
     specdir = '%s/%s' % (db.workdir, db.label)
 
-    # All pre-mRNA sequences
-    gff3infile = '%s/%s.gff3' % (specdir, db.label)
     fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
-    outfile = '%s/%s.all.pre-mrnas.fa' % (specdir, db.label)
-    command = 'xtractore --type=mRNA --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
-
-    # All mature mRNA sequences
-    gff3infile = '%s/%s.all.mrnas.gff3' % (specdir, db.label)
-    fastainfile = '%s/%s.gdna.fa' % (specdir, db.label)
-    outfile = '%s/%s.all.mrnas.fa' % (specdir, db.label)
-    command = 'xtractore --type=mRNA --outfile=%s ' % outfile
-    command += '%s %s' % (gff3infile, fastainfile)
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
-
-    # Representative pre-mRNA sequences
-    idfile = '%s/%s.mrnas.txt' % (specdir, db.label)
-    seqfile = '%s/%s.all.pre-mrnas.fa' % (specdir, db.label)
-    outfile = '%s/%s.pre-mrnas.fa' % (specdir, db.label)
-    with open(idfile, 'r') as idstream, \
-            open(seqfile, 'r') as seqstream, \
-            open(outfile, 'w') as outstream:
-        for defline, seq in genhub.fasta.select(idstream, seqstream):
-            print(defline, file=outstream)
-            genhub.fasta.format(seq, outstream=outstream)
-
-    # Representative mature mRNA sequences
+    with genhub.fasta.IndexedFasta(fastainfile) as genome:
+        # All pre-mRNA sequences
+        gff3infile = '%s/%s.gff3' % (specdir, db.label)
+        outfile = '%s/%s.all.pre-mrnas.fa' % (specdir, db.label)
+        genhub.extract.extract_files(gff3infile, genome, {'mRNA': outfile})
+
+        # All mature mRNA sequences
+        gff3infile = '%s/%s.all.mrnas.gff3' % (specdir, db.label)
+        outfile = '%s/%s.all.mrnas.fa' % (specdir, db.label)
+        genhub.extract.extract_files(gff3infile, genome, {'mRNA': outfile})
+
+    # Representative pre-mRNA and mature mRNA sequences
     idfile = '%s/%s.mrnas.txt' % (specdir, db.label)
-    seqfile = '%s/%s.all.mrnas.fa' % (specdir, db.label)
-    outfile = '%s/%s.mrnas.fa' % (specdir, db.label)
-    with open(idfile, 'r') as idstream, \
-            open(seqfile, 'r') as seqstream, \
-            open(outfile, 'w') as outstream:
-        for defline, seq in genhub.fasta.select(idstream, seqstream):
-            print(defline, file=outstream)
-            genhub.fasta.format(seq, outstream=outstream)
+    with open(idfile, 'r') as idstream:
+        ids = genhub.fasta.read_ids(idstream)
+    for ftype in ['pre-mrnas', 'mrnas']:
+        seqfile = '%s/%s.all.%s.fa' % (specdir, db.label, ftype)
+        outfile = '%s/%s.%s.fa' % (specdir, db.label, ftype)
+        with open(seqfile, 'r') as seqstream, \
+                open(outfile, 'w') as outstream, \
+                genhub.fasta.FastaWriter(outstream) as writer:
+            for defline, seq in genhub.fasta.select(ids, seqstream):
+                writer.write(defline, seq)
 
 
 # -----------------------------------------------------------------------------
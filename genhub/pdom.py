@@ -20,7 +20,6 @@ from __future__ import print_function
 import filecmp
 import gzip
 import re
-import subprocess
 import sys
 import genhub
 
@@ -59,9 +58,10 @@ class PdomDB(genhub.genomedb.GenomeDB):
             print(line, end='', file=outstream)
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
-        command = ['genhub-format-gff3.py', '--source', 'pdom', '--outfile',
-                   self.gff3file, self.gff3path]
-        subprocess.check_call(command)
+        with open(self.gff3path, 'r') as instream, \
+                open(self.gff3file, 'w') as outstream:
+            for line in genhub.gff3.format_features(instream, 'pdom'):
+                print(line, file=outstream)
 
     def gff3_protids(self, instream):
         for line in instream:
@@ -71,40 +71,6 @@ class PdomDB(genhub.genomedb.GenomeDB):
             assert namematch, 'cannot parse mRNA name: ' + line
             yield namematch.group(1)
 
-    def protein_mapping(self, instream):
-        locusid2name = dict()
-        gene2loci = dict()
-        for line in instream:
-            fields = line.split('\t')
-            if len(fields) != 9:
-                continue
-            feattype = fields[2]
-            attrs = fields[8]
-
-            if feattype == 'locus':
-                idmatch = re.search('ID=([^;\n]+);.*Name=([^;\n]+)', attrs)
-                if idmatch:
-                    locusid = idmatch.group(1)
-                    locusname = idmatch.group(2)
-                    locusid2name[locusid] = locusname
-            elif feattype == 'gene':
-                idmatch = re.search('ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                assert idmatch, \
-                    'Unable to parse gene and iLocus IDs: %s' % attrs
-                geneid = idmatch.group(1)
-                ilocusid = idmatch.group(2)
-                gene2loci[geneid] = ilocusid
-            elif feattype == 'mRNA':
-                pattern = 'Parent=([^;\n]+);.*Name=([^;\n]+)'
-                idmatch = re.search(pattern, attrs)
-                assert idmatch, \
-                    'Unable to parse mRNA and gene IDs: %s' % attrs
-                protid = idmatch.group(2)
-                geneid = idmatch.group(1)
-                locusid = gene2loci[geneid]
-                locusname = locusid2name[locusid]
-                yield protid, locusname
-
 
 # -----------------------------------------------------------------------------
 # Unit tests
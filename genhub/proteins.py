@@ -47,11 +47,11 @@ def sequences(db, logstream=sys.stderr):
     outfile = '%s/%s.prot.fa' % (specdir, db.label)
     with open(idfile, 'r') as idstream, \
             open(seqfile, 'r') as seqstream, \
-            open(outfile, 'w') as outstream:
+            open(outfile, 'w') as outstream, \
+            genhub.fasta.FastaWriter(outstream) as writer:
         for defline, seq in genhub.fasta.select(idstream, seqstream):
             defline = '>gnl|%s|%s' % (db.label, defline[1:])
-            print(defline, file=outstream)
-            genhub.fasta.format(seq, outstream=outstream)
+            writer.write(defline, seq)
 
 
 def mapping(db, only_reps=False, logstream=sys.stderr):
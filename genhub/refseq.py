@@ -17,7 +17,6 @@ GenomeDB implementation for data residing in NCBI's RefSeq database.
 from __future__ import print_function
 import filecmp
 import gzip
-import os
 import re
 import subprocess
 import sys
@@ -26,6 +25,11 @@ import genhub
 
 class RefSeqDB(genhub.genomedb.GenomeDB):
 
+    protein_feature = 'CDS'
+    protein_patterns = [r'protein_id=([^;\n]+)']
+    protein_exclude = 'exception=rearrangement required for product'
+    binary_fasta = True
+
     @classmethod
     def base(self):
         return 'https://ftp.ncbi.nlm.nih.gov/genomes/refseq'
@@ -79,59 +83,58 @@ class RefSeqDB(genhub.genomedb.GenomeDB):
         return '%s_protein.faa.gz' % self.urlbase
 
     def download(self, localpath=None, logstream=sys.stderr):  # pragma: no cover  # noqa
-        """Override the download task to enable connection to local mirrors."""
+        """
+        Override the download task to enable connection to local mirrors.
+
+        If `localpath` is given, it is the root of a local mirror of the NCBI
+        genomes FTP directory, from which the data files are linked (or copied
+        if linking is not possible).
+        """
         if localpath is None:
             super(RefSeqDB, self).download(logstream=logstream)
         else:
             subprocess.call(['mkdir', '-p', self.dbdir])
-            asmblpath = '/'.join(localpath, specbase, '_genomic.fna.gz')
-            annotpath = '/'.join(localpath, specbase, '_genomic.gff.gz')
-            protpath = '/'.join(localpath, specbase, '_protein.faa.gz')
-            copy_file(asmblpath, self.gdnafilename)
-            copy_file(annotpath, self.gff3filename)
-            copy_file(protpath, self.protfilename)
+            if logstream is not None:
+                logmsg = '[GenHub: %s] ' % self.config['species']
+                logmsg += 'retrieve data files from local mirror %s' % (
+                    localpath)
+                print(logmsg, file=logstream)
+            prefix = '%s/%s' % (localpath, self.specbase)
+            asmblpath = prefix + '_genomic.fna.gz'
+            annotpath = prefix + '_genomic.gff.gz'
+            protpath = prefix + '_protein.faa.gz'
+            genhub.cache.link_file(asmblpath, self.gdnapath)
+            genhub.cache.link_file(annotpath, self.gff3path)
+            genhub.cache.link_file(protpath, self.protpath)
 
     def format_fasta(self, instream, outstream, logstream=sys.stderr):
-        for defline, sequence in genhub.fasta.parse(instream):
-            if 'seqfilter' in self.config:
+        seqfilter = list()
+        if 'seqfilter' in self.config:
+            seqfilter = [p.encode('utf-8') for p in self.config['seqfilter']]
+        with genhub.fasta.FastaWriter(outstream, linewidth=80) as writer:
+            for defline, raw in genhub.fasta.records_bytes(instream):
                 discard = False
-                for pattern in self.config['seqfilter']:
+                for pattern in seqfilter:
                     if pattern in defline:
                         discard = True
                         break
                 if discard:
                     continue
-            print(defline, file=outstream)
-            genhub.fasta.format(sequence, linewidth=80, outstream=outstream)
+                writer.write_raw(defline, raw)
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
-        cmds = list()
-        cmds.append('gunzip -c %s' % self.gff3path)
+        pipeline = genhub.gff3.Pipeline()
         if 'annotfilter' in self.config:
-            excludefile = self.filter_file()
-            cmds.append('grep -vf %s' % excludefile.name)
-        cmds.append('tidygff3')
-        cmds.append('genhub-format-gff3.py --source %s -' % str(self).lower())
+            pipeline.add('annotfilter', genhub.gff3.exclude,
+                         self.config['annotfilter'])
+        pipeline.add_command('tidygff3', ['tidygff3'])
+        pipeline.add('format', genhub.gff3.format_features, str(self).lower(),
+                     True)
         if 'fixseqreg' in self.config and self.config['fixseqreg'] is True:
-            cmds.append('seq-reg.py - %s' % self.gdnafile)  # pragma: no cover
-        cmds.append('gt gff3 -sort -tidy -o %s -force' % self.gff3file)
-
-        commands = 'bash -o pipefail -c "%s"' % ' | '.join(cmds)
-        if debug:  # pragma: no cover
-            print('DEBUG: running command: %s' % commands, file=logstream)
-        proc = subprocess.Popen(commands, shell=True, universal_newlines=True,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):  # pragma: no cover
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               'more than one pseudogene attribute' not in line and \
-               line != '':
-                print(line, file=logstream)
-        assert proc.returncode == 0, \
-            'annot cleanup command failed: %s' % commands
-        if 'annotfilter' in self.config:
-            os.unlink(excludefile.name)
+            pipeline.add('seq-reg', genhub.gff3.sequence_regions,
+                         self.sequence_lengths())
+        ignore = ['more than one pseudogene attribute']
+        self.run_gff3_pipeline(pipeline, ignore, logstream)
 
     def gff3_protids(self, instream):
         protids = dict()
@@ -145,57 +148,6 @@ class RefSeqDB(genhub.genomedb.GenomeDB):
                 protids[protid] = True
                 yield protid
 
-    def protein_mapping(self, instream):
-        locusid2name = dict()
-        gene2loci = dict()
-        mrna2gene = dict()
-        proteins = dict()
-        protdups = dict()
-        for line in instream:
-            fields = line.split('\t')
-            if len(fields) != 9:
-                continue
-            feattype = fields[2]
-            attrs = fields[8]
-
-            if feattype == 'locus':
-                idmatch = re.search('ID=([^;\n]+);.*Name=([^;\n]+)', attrs)
-                if idmatch:
-                    locusid = idmatch.group(1)
-                    locusname = idmatch.group(2)
-                    locusid2name[locusid] = locusname
-            elif feattype == 'gene':
-                idmatch = re.search('ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                if idmatch:
-                    geneid = idmatch.group(1)
-                    ilocusid = idmatch.group(2)
-                    gene2loci[geneid] = ilocusid
-                else:  # pragma: no cover
-                    print('Unable to parse gene and iLocus IDs: %s' % attrs,
-                          file=sys.stderr)
-            elif feattype == 'mRNA':
-                idmatch = re.search('ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                assert idmatch, \
-                    'Unable to parse mRNA and gene IDs: %s' % attrs.rstrip()
-                mrnaid = idmatch.group(1)
-                geneid = idmatch.group(2)
-                mrna2gene[mrnaid] = geneid
-            elif feattype == 'CDS':
-                if 'exception=rearrangement required for product' in attrs:
-                    continue
-                idmatch = re.search('Parent=([^;\n]+).*protein_id=([^;\n]+)',
-                                    attrs)
-                assert idmatch, \
-                    'Unable to parse protein and mRNA IDs: %s' % attrs
-                mrnaid = idmatch.group(1)
-                proteinid = idmatch.group(2)
-                if proteinid not in proteins:
-                    geneid = mrna2gene[mrnaid]
-                    proteins[proteinid] = mrnaid
-                    ilocusid = gene2loci[geneid]
-                    ilocusname = locusid2name[ilocusid]
-                    yield proteinid, ilocusname
-
 
 class GenbankDB(RefSeqDB):
 
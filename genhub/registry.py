@@ -8,13 +8,24 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
-"""Module implementing a registry for handling genome configuration files."""
+"""
+Module implementing a registry for handling genome configuration files.
+
+Parsing the YAML configuration files is slow relative to the rest of GenHub's
+startup, so the configs of each directory are serialized to a single cache
+file, which is used as long as the modification times of the directory and
+its config files are unchanged. The registry reads its directories only when
+a config is first needed, and each genome config is decoded only when it is
+first accessed.
+"""
 
 from __future__ import print_function
 import glob
+import hashlib
 import os
-import pkg_resources
-import yaml
+import pickle
+import shutil
+import tempfile
 import genhub
 try:
     FileNotFoundError
@@ -22,11 +33,42 @@ except NameError:  # pragma: no cover
     FileNotFoundError = IOError
 
 
+def default_cachedir():
+    """Default location of the registry cache: $XDG_CACHE_HOME/genhub."""
+    cachehome = os.environ.get('XDG_CACHE_HOME')
+    if not cachehome:
+        cachehome = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cachehome, 'genhub')
+
+
+def directory_signature(path):
+    """
+    Modification times of a config directory and of the configs therein.
+
+    The directory mtime changes when configs are added, removed, or renamed,
+    and the file mtimes when configs are edited in place.
+    """
+    signature = [['.', os.path.getmtime(path)]]
+    for filepath in sorted(glob.glob(path + '/*.yml') +
+                           glob.glob(path + '/*.txt')):
+        filename = os.path.basename(filepath)
+        signature.append([filename, os.path.getmtime(filepath)])
+    return signature
+
+
 class Registry(object):
 
-    def __init__(self):
-        """Initialize the registry with the default GenHub configs."""
-        genhubdir = pkg_resources.resource_filename('genhub', 'genomes')
+    def __init__(self, cachedir=None):
+        """
+        Initialize the registry with the default GenHub configs.
+
+        Set `cachedir` to override the location of the config cache (see
+        `default_cachedir`), or to False to disable the cache.
+        """
+        if cachedir is None:
+            cachedir = default_cachedir()
+        self.cachedir = cachedir
+        genhubdir = os.path.join(os.path.dirname(__file__), 'genomes')
         self.update(genhubdir, clear=True)
 
     def update(self, path, clear=False):
@@ -36,51 +78,129 @@ class Registry(object):
         The registry will attempt to load all .yml files as genome configs and
         .txt files as batch configs. If `clear` is true, any previous entries
         in the registry will be cleared before loading new entries.
+
+        Configs are not loaded until they are needed, but the directory must
+        exist.
         """
         if clear:
-            self.genome_configs = dict()
-            self.batch_configs = dict()
+            self.pending = list()
+            self.rawconfigs = dict()
+            self.configs = dict()
+            self.batches = dict()
 
         if not os.path.exists(path):
             message = 'config directory "%s" does not exist' % path
             raise FileNotFoundError(message)
+        self.pending.append(path)
+
+    def load(self):
+        """Load the configs of any directories not yet loaded."""
+        while len(self.pending) > 0:
+            path = self.pending.pop(0)
+            rawconfigs, batches = self.load_directory(path)
+            for label in rawconfigs:
+                self.rawconfigs[label] = rawconfigs[label]
+                self.configs.pop(label, None)
+            self.batches.update(batches)
+
+    def load_directory(self, path):
+        """
+        Load the configs of a directory from the cache, or parse them.
 
-        for filepath in glob.glob(path + '/*.yml'):
+        Genome configs are returned serialized (pickled, which preserves all
+        YAML types, such as dates and integer keys), to be decoded on first
+        access. Failing to write the cache is not an error.
+        """
+        signature = directory_signature(path)
+        cachefile = self.cache_path(path)
+        if cachefile and os.path.exists(cachefile):
+            try:
+                with open(cachefile, 'rb') as instream:
+                    cache = pickle.load(instream)
+                if cache['signature'] == signature:
+                    return cache['genomes'], cache['batches']
+            except Exception:  # pragma: no cover
+                pass
+
+        rawconfigs = dict()
+        for filepath in sorted(glob.glob(path + '/*.yml')):
             configs = self.parse_genome_config(filepath)
-            self.genome_configs.update(configs)
+            for label in configs:
+                rawconfigs[label] = pickle.dumps(configs[label], protocol=2)
 
-        for filepath in glob.glob(path + '/*.txt'):
+        batches = dict()
+        for filepath in sorted(glob.glob(path + '/*.txt')):
             batch = self.parse_batch_config(filepath)
             filename = os.path.basename(filepath)
             batch_label = os.path.splitext(filename)[0]
-            self.batch_configs[batch_label] = batch
+            batches[batch_label] = batch
+
+        if cachefile:
+            cache = {'path': os.path.abspath(path), 'signature': signature,
+                     'genomes': rawconfigs, 'batches': batches}
+            try:
+                if not os.path.isdir(self.cachedir):
+                    os.makedirs(self.cachedir)
+                fd, tempcache = tempfile.mkstemp(dir=self.cachedir)
+                with os.fdopen(fd, 'wb') as outstream:
+                    pickle.dump(cache, outstream, protocol=2)
+                shutil.move(tempcache, cachefile)
+            except (IOError, OSError):  # pragma: no cover
+                pass
+
+        return rawconfigs, batches
+
+    def cache_path(self, path):
+        """Cache file for the given config directory, if caching is enabled."""
+        if not self.cachedir:
+            return None
+        abspath = os.path.abspath(path).encode('utf-8')
+        digest = hashlib.sha1(abspath).hexdigest()
+        return os.path.join(self.cachedir, 'registry-%s.pickle' % digest)
+
+    @property
+    def genome_configs(self):
+        """All genome configs, by label."""
+        self.load()
+        return dict([(label, self.config(label)) for label in self.rawconfigs])
+
+    @property
+    def batch_configs(self):
+        """All batch configs, by label."""
+        self.load()
+        return self.batches
 
     def check(self, genomes=None, batches=None):
+        self.load()
         if genomes:
             for label in genomes:
-                assert label in self.genome_configs, 'unknown genome ' + label
+                assert label in self.rawconfigs, 'unknown genome ' + label
         if batches:
             for label in batches:
-                assert label in self.batch_configs, 'unknown batch ' + label
+                assert label in self.batches, 'unknown batch ' + label
 
     def config(self, label):
-        if label not in self.genome_configs:
+        self.load()
+        if label not in self.rawconfigs:
             return None
-        return self.genome_configs[label]
+        if label not in self.configs:
+            self.configs[label] = pickle.loads(self.rawconfigs[label])
+        return self.configs[label]
 
     def genome(self, label, workdir='.'):
-        if label not in self.genome_configs:
+        config = self.config(label)
+        if config is None:
             return None
-        config = self.genome_configs[label]
         constructor = genhub.dbtype[config['source']]
         db = constructor(label, config, workdir=workdir)
         return db
 
     def batch(self, batch_label):
         """Retrieve a batch of genome configs from the registry."""
-        if batch_label not in self.batch_configs:
+        self.load()
+        if batch_label not in self.batches:
             return None
-        return list(self.batch_configs[batch_label])
+        return list(self.batches[batch_label])
 
     def parse_genome_config(self, config):
         """
@@ -89,8 +209,10 @@ class Registry(object):
         If `config` is a string it is treated as a filename, otherwise as a
         file handle or similar object.
         """
+        import yaml
         if isinstance(config, str):
-            config = open(config, 'r')
+            with open(config, 'r') as instream:
+                return yaml.safe_load(instream)
         return yaml.safe_load(config)
 
     def parse_batch_config(self, config):
@@ -109,12 +231,14 @@ class Registry(object):
         return batch
 
     def list_genomes(self):
-        for label in sorted(self.genome_configs):
-            yield label, self.genome_configs[label]
+        self.load()
+        for label in sorted(self.rawconfigs):
+            yield label, self.config(label)
 
     def list_batches(self):
-        for label in sorted(self.batch_configs):
-            yield label, self.batch_configs[label]
+        self.load()
+        for label in sorted(self.batches):
+            yield label, self.batches[label]
 
     def list(self, outstream=None):  # pragma: no cover
         print('===== Reference genomes =====', file=outstream)
@@ -214,3 +338,58 @@ def test_parse_genome_config():
     assert len(config) == 1
     assert 'Hlab' in config
     assert config['Hlab']['common'] == 'blueberry bee'
+
+
+def test_cache():
+    """Registry: config cache"""
+    import datetime
+    cachedir = tempfile.mkdtemp()
+    confdir = tempfile.mkdtemp()
+    try:
+        shutil.copy('testdata/conf/Bvul.yml', confdir)
+        shutil.copy('testdata/conf/mythical.txt', confdir)
+        registry = Registry(cachedir=cachedir)
+        registry.update(confdir, clear=True)
+        assert registry.pending == [confdir]
+        assert os.listdir(cachedir) == []
+        assert registry.batch('mythical') == ['Bvul']
+        assert registry.configs == dict()
+        assert registry.config('Bvul')['species'] == 'Basiliscus vulgaris'
+        assert os.listdir(cachedir) == [
+            os.path.basename(registry.cache_path(confdir))
+        ]
+
+        # Configs are loaded from the cache while it is up-to-date...
+        registry = Registry(cachedir=cachedir)
+        registry.update(confdir, clear=True)
+        registry.parse_genome_config = None
+        assert registry.config('Bvul')['species'] == 'Basiliscus vulgaris'
+
+        # ...and re-parsed otherwise
+        with open(os.path.join(confdir, 'Bvul.yml'), 'a') as outstream:
+            print('\n    common: beet', file=outstream)
+        mtime = os.path.getmtime(registry.cache_path(confdir))
+        os.utime(os.path.join(confdir, 'Bvul.yml'), (mtime + 10, mtime + 10))
+        registry = Registry(cachedir=cachedir)
+        registry.update(confdir, clear=True)
+        assert registry.config('Bvul')['common'] == 'beet'
+
+        # YAML types that JSON lacks are preserved, with or without the cache
+        with open(os.path.join(confdir, 'Bvul.yml'), 'a') as outstream:
+            print('    released: 2016-05-01', file=outstream)
+            print('    chroms: {1: chr1, 2: chr2}', file=outstream)
+        os.utime(os.path.join(confdir, 'Bvul.yml'), (mtime + 20, mtime + 20))
+        for cache in [False, cachedir, cachedir]:
+            registry = Registry(cachedir=cache)
+            registry.update(confdir)
+            config = registry.config('Bvul')
+            assert config['released'] == datetime.date(2016, 5, 1)
+            assert config['chroms'] == {1: 'chr1', 2: 'chr2'}
+
+        registry = Registry(cachedir=False)
+        assert registry.cache_path(confdir) is None
+        assert registry.config('Bvul') is None
+        assert registry.config('Pbar')['species'] == 'Pogonomyrmex barbatus'
+    finally:
+        shutil.rmtree(cachedir)
+        shutil.rmtree(confdir)
@@ -8,31 +8,358 @@
 # licensed under the BSD 3-clause license: see LICENSE.txt.
 # -----------------------------------------------------------------------------
 
+"""
+Feature statistics tables.
+
+Statistics are computed by `genhub-stats.py` and written to tab-delimited
+tables. The iLocus, merged iLocus, and pre-mRNA tables (loaded by the summary
+scripts) are also stored in a typed columnar format: Parquet if PyArrow is
+installed, otherwise a NumPy `.npz` archive. Low-cardinality string columns
+such as `LocusClass` are stored as categoricals. The `load_table` function
+loads only the requested columns from the columnar file, falling back to the
+tab-delimited table if the columnar file is missing or out of date.
+"""
+
 from __future__ import print_function
+import os
 import subprocess
 import sys
+import genhub
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+# Each section of the statistics is computed by the corresponding
+# `genhub-stats.py` option from a GFF3 file and a Fasta file (suffixes listed
+# here), and written to a table.
+sections = [
+    ('iloci', 'iloci.gff3', 'iloci.fa', 'iloci.tsv'),
+    ('miloci', 'miloci.gff3', 'miloci.fa', 'miloci.tsv'),
+    ('prnas', 'ilocus.mrnas.gff3', 'pre-mrnas.fa', 'pre-mrnas.tsv'),
+    ('mrnas', 'mrnas.gff3', 'mrnas.fa', 'mrnas.tsv'),
+    ('cds', 'ilocus.mrnas.gff3', 'cds.fa', 'cds.tsv'),
+    ('exons', 'ilocus.mrnas.gff3', 'exons.fa', 'exons.tsv'),
+    ('introns', 'ilocus.mrnas.gff3', 'introns.fa', 'introns.tsv'),
+]
+
+# Sections whose tables are also stored in columnar format, and the columns
+# stored as categoricals.
+columnar_sections = ['iloci', 'miloci', 'prnas']
+categorical_columns = ['Species', 'SeqID', 'LocusClass', 'FlankGeneOrient']
+
+
+def section_groups():
+    """
+    Group statistics sections by GFF3 file.
+
+    Sections that share a GFF3 file are computed together in a single pass
+    over the file, but each group is independent of the others.
+    """
+    groups = list()
+    for section in sections:
+        for group in groups:
+            if group[0][1] == section[1]:
+                group.append(section)
+                break
+        else:
+            groups.append([section])
+    return groups
+
+
+def command(db, names=None):
+    """Assemble the `genhub-stats.py` command for the specified sections."""
+    prefix = '%s/%s/%s' % (db.workdir, db.label, db.label)
+    cmd = ['genhub-stats.py', '--species', db.label]
+    for name, gff3suffix, fastasuffix, outsuffix in sections:
+        if names is not None and name not in names:
+            continue
+        cmd.append('--' + name)
+        for suffix in [gff3suffix, fastasuffix, outsuffix]:
+            cmd.append('%s.%s' % (prefix, suffix))
+    return cmd
+
+
+def outputs(db, names=None):
+    """List the table files written for the specified sections."""
+    outfiles = list()
+    for name, gff3suffix, fastasuffix, outsuffix in sections:
+        if names is not None and name not in names:
+            continue
+        outfile = db.file_path('%s.%s' % (db.label, outsuffix))
+        outfiles.append(outfile)
+        if name in columnar_sections and numpy is not None:
+            outfiles.append(table_path(outfile))
+    return outfiles
 
 
-def compute(db, logstream=sys.stderr):  # pragma: no cover
+def compute(db, names=None, logstream=sys.stderr):  # pragma: no cover
     if logstream is not None:
         logmsg = '[GenHub: %s] ' % db.config['species']
         logmsg += 'calculating feature statistics'
+        if names is not None:
+            logmsg += ' (%s)' % ', '.join(names)
         print(logmsg, file=logstream)
 
-    prefix = '%s/%s/%s' % (db.workdir, db.label, db.label)
-    prefix3 = (prefix, prefix, prefix)
-
-    command = 'genhub-stats.py --species ' + db.label
-    command += ' --iloci %s.iloci.gff3 %s.iloci.fa %s.iloci.tsv' % prefix3
-    command += ' --miloci %s.miloci.gff3 %s.miloci.fa %s.miloci.tsv' % prefix3
-    command += (' --prnas %s.ilocus.mrnas.gff3 %s.pre-mrnas.fa '
-                '%s.pre-mrnas.tsv' % prefix3)
-    command += ' --mrnas %s.mrnas.gff3 %s.mrnas.fa %s.mrnas.tsv' % prefix3
-    command += ' --cds %s.ilocus.mrnas.gff3 %s.cds.fa %s.cds.tsv' % prefix3
-    command += (' --exons %s.ilocus.mrnas.gff3 %s.exons.fa '
-                '%s.exons.tsv' % prefix3)
-    command += (' --introns %s.ilocus.mrnas.gff3 %s.introns.fa '
-                '%s.introns.tsv' % prefix3)
-
-    cmd = command.split(' ')
-    subprocess.check_call(cmd)
+    # Tasks sharing a GFF3 file (here, the four .ilocus.mrnas.gff3 tasks) are
+    # all computed in a single pass over that file.
+    subprocess.check_call(command(db, names))
+    for outfile in outputs(db, names):
+        if not outfile.endswith('.tsv'):
+            tsvfile = os.path.splitext(outfile)[0] + '.tsv'
+            write_table(tsvfile, outfile)
+
+
+# -----------------------------------------------------------------------------
+# Columnar tables
+# -----------------------------------------------------------------------------
+
+def parquet_module():
+    """Return the `pyarrow.parquet` module, or None if it is unavailable."""
+    try:
+        import pyarrow.parquet
+    except ImportError:  # pragma: no cover
+        return None
+    return pyarrow.parquet
+
+
+def table_path(tsvfile, fmt=None):
+    """
+    Name the columnar file corresponding to a tab-delimited table.
+
+    The format is `parquet` or `npz`; by default, Parquet is used if PyArrow is
+    installed.
+    """
+    assert tsvfile.endswith('.tsv'), tsvfile
+    if fmt is None:
+        fmt = 'npz' if parquet_module() is None else 'parquet'
+    assert fmt in ['parquet', 'npz'], fmt
+    return '%s.%s' % (tsvfile[:-4], fmt)
+
+
+def typed_column(values):
+    """Convert a column of strings to a bool, int, float, or string array."""
+    if len(values) > 0 and set(values) <= set(['True', 'False']):
+        return numpy.array([v == 'True' for v in values], dtype=bool)
+    for dtype in [numpy.int64, numpy.float64]:
+        try:
+            return numpy.array(values, dtype=dtype)
+        except ValueError:
+            pass
+    return numpy.array(values, dtype=str)
+
+
+def encode_categorical(values):
+    """
+    Encode an array of strings as integer codes and an array of categories.
+
+    Missing values (`NA`) are coded as -1, as in pandas.
+    """
+    categories, codes = numpy.unique(values, return_inverse=True)
+    codes = codes.astype(numpy.int32)
+    if 'NA' in categories:
+        na = numpy.searchsorted(categories, 'NA')
+        categories = numpy.delete(categories, na)
+        codes[codes > na] -= 1
+        codes[values == 'NA'] = -1
+    return codes, categories
+
+
+def read_columns(tsvfile):
+    """Parse a tab-delimited table into a list of (name, array) tuples."""
+    with open(tsvfile, 'r') as instream:
+        header = next(instream).rstrip('\n').split('\t')
+        values = [list() for _ in header]
+        for line in instream:
+            fields = line.rstrip('\n').split('\t')
+            assert len(fields) == len(header), \
+                'table row has %d fields, expected %d: %s' % (
+                    len(fields), len(header), line.rstrip())
+            for column, value in zip(values, fields):
+                column.append(value)
+    return [(name, typed_column(column))
+            for name, column in zip(header, values)]
+
+
+def write_table(tsvfile, tablefile=None):
+    """
+    Store a tab-delimited table in columnar format.
+
+    Columns listed in `categorical_columns` are stored as integer codes and a
+    sorted array of categories. The file is written to a temporary name and
+    moved into place, so that a partially written file is never loaded.
+    """
+    if tablefile is None:
+        tablefile = table_path(tsvfile)
+    columns = read_columns(tsvfile)
+    tempfile = '%s.%d.tmp' % (tablefile, os.getpid())
+    if tablefile.endswith('.parquet'):
+        import pyarrow
+        arrays = list()
+        for name, values in columns:
+            if name in categorical_columns:
+                codes, categories = encode_categorical(values)
+                codes = pyarrow.array(codes, mask=codes < 0)
+                array = pyarrow.DictionaryArray.from_arrays(codes, categories)
+            else:
+                array = pyarrow.array(values)
+            arrays.append(array)
+        table = pyarrow.Table.from_arrays(arrays,
+                                          names=[n for n, _ in columns])
+        parquet_module().write_table(table, tempfile)
+    else:
+        arrays = dict()
+        arrays['_columns'] = numpy.array([n for n, _ in columns], dtype=str)
+        for name, values in columns:
+            if name in categorical_columns:
+                values, categories = encode_categorical(values)
+                arrays[name + '.categories'] = categories
+            arrays[name] = values
+        with open(tempfile, 'wb') as outstream:
+            numpy.savez(outstream, **arrays)
+    os.rename(tempfile, tablefile)
+    return tablefile
+
+
+def columnar_file(tsvfile):
+    """Find an up-to-date columnar file for a table, if there is one."""
+    if not tsvfile.endswith('.tsv'):
+        return None
+    tsvtime = None
+    if os.path.exists(tsvfile):
+        tsvtime = os.path.getmtime(tsvfile)
+    for fmt in ['parquet', 'npz']:
+        if fmt == 'parquet' and parquet_module() is None:
+            continue
+        tablefile = table_path(tsvfile, fmt)
+        if not os.path.exists(tablefile):
+            continue
+        if tsvtime is None or os.path.getmtime(tablefile) >= tsvtime:
+            return tablefile
+    return None
+
+
+def load_table(tsvfile, columns=None):
+    """
+    Load a statistics table into a pandas DataFrame.
+
+    Only the specified `columns` are loaded (all columns by default). The
+    table is loaded from its columnar file if it is up to date, or from the
+    tab-delimited file otherwise. Categorical columns are categoricals either
+    way.
+    """
+    import pandas
+    tablefile = columnar_file(tsvfile)
+    if tablefile is None:
+        dtype = dict()
+        for name in categorical_columns:
+            if columns is None or name in columns:
+                dtype[name] = 'category'
+        return pandas.read_table(tsvfile, usecols=columns, dtype=dtype)
+    if tablefile.endswith('.parquet'):
+        return pandas.read_parquet(tablefile, columns=columns)
+
+    with numpy.load(tablefile) as data:
+        if columns is None:
+            columns = [str(name) for name in data['_columns']]
+        frame = dict()
+        for name in columns:
+            if name + '.categories' in data.files:
+                frame[name] = pandas.Categorical.from_codes(
+                    data[name], data[name + '.categories'])
+            else:
+                frame[name] = data[name]
+    return pandas.DataFrame(frame, columns=columns)
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_command():
+    """Stats: genhub-stats.py command"""
+    db = genhub.test_registry.genome('Bdis', workdir='testdata/demo-workdir')
+    prefix = 'testdata/demo-workdir/Bdis/Bdis'
+    assert command(db, ['iloci']) == [
+        'genhub-stats.py', '--species', 'Bdis', '--iloci',
+        prefix + '.iloci.gff3', prefix + '.iloci.fa', prefix + '.iloci.tsv'
+    ]
+    assert len(command(db)) == 3 + 4 * 7
+
+    groups = [[s[0] for s in group] for group in section_groups()]
+    assert groups == [['iloci'], ['miloci'], ['prnas', 'cds', 'exons',
+                      'introns'], ['mrnas']], groups
+
+
+def test_outputs():
+    """Stats: table files"""
+    db = genhub.test_registry.genome('Bdis', workdir='testdata/demo-workdir')
+    prefix = 'testdata/demo-workdir/Bdis/Bdis'
+    assert outputs(db, ['mrnas']) == [prefix + '.mrnas.tsv']
+    outfiles = outputs(db, ['prnas', 'cds'])
+    if numpy is None:  # pragma: no cover
+        assert outfiles == [prefix + '.pre-mrnas.tsv', prefix + '.cds.tsv']
+    else:
+        assert outfiles == [prefix + '.pre-mrnas.tsv',
+                            table_path(prefix + '.pre-mrnas.tsv'),
+                            prefix + '.cds.tsv']
+    assert table_path('wd/Bdis/Bdis.iloci.tsv', 'npz') == \
+        'wd/Bdis/Bdis.iloci.npz'
+
+
+def test_columnar():
+    """Stats: columnar iLocus tables"""
+    if numpy is None:  # pragma: no cover
+        return
+    import shutil
+    import tempfile
+    tempdir = tempfile.mkdtemp()
+    try:
+        tsvfile = tempdir + '/Bdis.iloci.tsv'
+        with open(tsvfile, 'w') as outstream:
+            print('Species', 'LocusId', 'Length', 'GCContent', 'LocusClass',
+                  'SeqUnannot', 'FlankGeneOrient', sep='\t', file=outstream)
+            print('Bdis', 'L1', '2842', '0.458', 'siLocus', 'False', 'NA',
+                  sep='\t', file=outstream)
+            print('Bdis', 'L2', '20724', '0.530', 'iiLocus', 'True', 'FF',
+                  sep='\t', file=outstream)
+            print('Bdis', 'L3', '6765', '0.471', 'siLocus', 'False', 'NA',
+                  sep='\t', file=outstream)
+        assert columnar_file(tsvfile) is None
+
+        tablefile = write_table(tsvfile, table_path(tsvfile, 'npz'))
+        assert columnar_file(tsvfile) == tablefile
+        with numpy.load(tablefile) as data:
+            assert list(data['Length']) == [2842, 20724, 6765]
+            assert data['GCContent'].dtype == numpy.float64
+            assert list(data['SeqUnannot']) == [False, True, False]
+            assert list(data['LocusClass.categories']) == ['iiLocus',
+                                                           'siLocus']
+            assert list(data['LocusClass']) == [1, 0, 1]
+            assert list(data['FlankGeneOrient']) == [-1, 0, -1]
+
+        try:
+            import pandas
+        except ImportError:  # pragma: no cover
+            return
+        for fmt in ['npz', 'parquet']:
+            if fmt == 'parquet' and parquet_module() is None:
+                continue  # pragma: no cover
+            write_table(tsvfile, table_path(tsvfile, fmt))
+            data = load_table(tsvfile, columns=['LocusClass', 'Length'])
+            assert list(data.columns) == ['LocusClass', 'Length']
+            assert data.LocusClass.dtype.name == 'category'
+            assert len(data.loc[data.LocusClass == 'siLocus']) == 2
+            assert data['Length'].sum() == 30331
+            data = load_table(tsvfile)
+            assert data['Species'][0] == 'Bdis'
+            assert data['FlankGeneOrient'].isnull().sum() == 2
+            os.unlink(table_path(tsvfile, fmt))
+
+        # Fall back to the tab-delimited table
+        data = load_table(tsvfile, columns=['LocusClass', 'Length'])
+        assert data.LocusClass.dtype.name == 'category'
+        assert data['Length'].sum() == 30331
+    finally:
+        shutil.rmtree(tempdir)
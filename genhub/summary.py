@@ -0,0 +1,621 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Summaries of iLocus content and genome compactness.
+
+Four summaries are available, each reported as one table with one or more rows
+per genome.
+- `ilocus`: iLocus content
+- `milocus`: merged iLocus (miLocus) content
+- `pilocus`: protein-coding iLocus (piLocus) content
+- `compact`: compactness measures (sigma and phi) of each long sequence
+
+The statistics tables of each genome (see `genhub.stats`) are loaded only
+once, with just the columns needed by the requested summaries, and all of the
+requested summaries are computed from them. Genomes are summarized in parallel
+by a pool of worker processes.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import genhub
+
+
+summaries = ['ilocus', 'milocus', 'pilocus', 'compact']
+
+# The columns of each table needed by each summary
+table_columns = {
+    'ilocus': [('iloci', ['Species', 'SeqID', 'EffectiveLength',
+                          'LocusClass'])],
+    'milocus': [('iloci', ['Species', 'LocusClass']),
+                ('miloci', ['EffectiveLength', 'LocusClass', 'GeneCount'])],
+    'pilocus': [('iloci', ['Species', 'EffectiveLength', 'LocusClass']),
+                ('prnas', ['ExonCount'])],
+    'compact': [('iloci', ['SeqID', 'Length', 'EffectiveLength',
+                           'LocusClass']),
+                ('miloci', ['SeqID', 'Length', 'LocusClass'])],
+}
+
+# The summaries computed from the shuffled tables with the `shuffled` option
+shuffled_summaries = ['milocus', 'compact']
+
+default_options = {
+    'shuffled': False,
+    'length': 1000000,
+    'iqnt': None,
+    'gqnt': None,
+    'centroid': None,
+}
+
+
+# -----------------------------------------------------------------------------
+# Command-line interface
+# -----------------------------------------------------------------------------
+
+def cli(desc, outfmt=True, compact=False):
+    """
+    Define the command-line interface shared by the summary scripts.
+
+    Set `compact` to true to include the options of the compactness summary.
+    """
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('-v', '--version', action='version',
+                        version='GenHub v%s' % genhub.__version__)
+    parser.add_argument('-c', '--cfgdir', default=None, metavar='DIR',
+                        help='directory (or comma-separated list of '
+                        'directories) from which to load user-supplied genome '
+                        'configuration files')
+    parser.add_argument('-w', '--workdir', metavar='WD', default='./species',
+                        help='working directory for data files; default is '
+                        '"./species"')
+    parser.add_argument('-p', '--numprocs', metavar='P', type=int, default=1,
+                        help='number of processors to use; the tables of '
+                        'different genomes are loaded and summarized in '
+                        'parallel; default is 1')
+    parser.add_argument('--refrbatch', default=None, metavar='LBL',
+                        help='label of a batch of reference genomes to '
+                        'summarize, in addition to any genomes specified by '
+                        'label')
+    if outfmt:
+        parser.add_argument('--outfmt', metavar='FMT', choices=['tsv', 'tex'],
+                            default='tsv', help='output format; "tsv" for '
+                            'machine readability, "tex" for typesetting')
+    if compact:
+        parser.add_argument('-l', '--length', metavar='LEN', type=int,
+                            default=default_options['length'],
+                            help='minimum length threshold; default is '
+                            '1000000 (1Mb)')
+        parser.add_argument('-i', '--iqnt', metavar='QNT', type=float,
+                            default=None, help='filter long iiLoci at the '
+                            'specified length quantile (0.0-1.0)')
+        parser.add_argument('-g', '--gqnt', metavar='QNT', type=float,
+                            default=None, help='filter short giLoci at the '
+                            'specified length quantile (0.0-1.0)')
+        parser.add_argument('-d', '--centroid', type=float, default=None,
+                            metavar='F',
+                            help='by default, phi/sigma values are reported '
+                            'for each chromosome/scaffold of at least 1 Mb in '
+                            'length; enabling this option will instead '
+                            'calculate the average (centroid) over all such '
+                            'phi/sigma values; specify a factor "F" for '
+                            'filtering outliers; if a point has a distance of '
+                            'more than "F" times the average distance from '
+                            'the centroid, it is discarded as an outlier; '
+                            'after all outliers are discarded the centroid is '
+                            'recomputed')
+        parser.add_argument('-s', '--shuffled', action='store_true',
+                            help='load input from shuffled iLocus data; '
+                            'applies to the miLocus and compactness summaries '
+                            'only')
+    parser.add_argument('species', nargs='*', help='species label(s)')
+    return parser
+
+
+def genomes(args):
+    """Retrieve the genomes specified on the command line."""
+    registry = genhub.registry.Registry()
+    if args.cfgdir:
+        for cfgdirpath in args.cfgdir.split(','):
+            registry.update(cfgdirpath)
+
+    labels = list(args.species)
+    if args.refrbatch:
+        registry.check(batches=[args.refrbatch])
+        labels.extend(registry.batch(args.refrbatch))
+    if len(labels) == 0:
+        raise ValueError('no genomes specified; provide one or more species '
+                         'labels and/or a reference batch (--refrbatch)')
+    registry.check(genomes=labels)
+    return [registry.genome(label, workdir=args.workdir) for label in labels]
+
+
+def options(args):
+    """Collect summary options from the command line."""
+    opts = dict()
+    for key, value in default_options.items():
+        opts[key] = getattr(args, key, value)
+    return opts
+
+
+# -----------------------------------------------------------------------------
+# iLocus, miLocus, and piLocus summaries
+# -----------------------------------------------------------------------------
+
+def count_seqs(data):
+    """Count the annotated sequences, i.e. those with at least one iLocus."""
+    return data['SeqID'].nunique()
+
+
+def ilocus_row(tables, fmt):
+    """Calculate the iLocus summary for a genome."""
+    assert fmt in ['tsv', 'tex']
+    data = tables['iloci']
+
+    row = [
+        data['Species'][0],
+        data['EffectiveLength'].sum() / 1000000,
+        count_seqs(data),
+        len(data.loc[data.LocusClass == 'fiLocus']),
+        len(data.loc[data.LocusClass == 'iiLocus']),
+        len(data.loc[data.LocusClass == 'niLocus']),
+        len(data.loc[data.LocusClass == 'siLocus']),
+        len(data.loc[data.LocusClass == 'ciLocus']),
+    ]
+
+    if fmt == 'tex':
+        row[1] = '{:.1f}'.format(row[1])
+        for i in range(2, len(row)):
+            row[i] = '{:,d}'.format(row[i])
+
+    return row
+
+
+def milocus_row(tables, fmt):
+    """Calculate the miLocus summary for a genome."""
+    assert fmt in ['tsv', 'tex']
+    ilocus_data = tables['iloci']
+    milocus_data = tables['miloci']
+
+    species = ilocus_data['Species'][0]
+    miloci = milocus_data.loc[milocus_data.LocusClass == 'miLocus']
+    milocus_count = len(miloci)
+    effective_genome = milocus_data.loc[milocus_data.LocusClass != 'fiLocus']
+    effective_genome_size = effective_genome['EffectiveLength'].sum()
+    milocus_occ = miloci['EffectiveLength'].sum()
+    milocus_perc = milocus_occ / effective_genome_size
+    gene_count = miloci['GeneCount'].quantile([0.25, 0.50, 0.75])
+    gilocus_types = ['siLocus', 'ciLocus', 'niLocus']
+    singletons = milocus_data.loc[milocus_data.LocusClass.isin(gilocus_types)]
+    giloci = ilocus_data.loc[ilocus_data.LocusClass.isin(gilocus_types)]
+    single_frac = len(singletons) / len(giloci)
+
+    if fmt == 'tsv':
+        genecounts = ','.join(['{:.0f}'.format(gc) for gc in gene_count])
+        row = [species, milocus_count, milocus_occ, milocus_perc,
+               genecounts, len(singletons), len(giloci)]
+    elif fmt == 'tex':
+        count = '{:,d}'.format(milocus_count)
+        occupancy = '{:,.1f} Mb ({:.1f}\\%)'.format(milocus_occ / 1000000,
+                                                    milocus_perc * 100)
+        genecounts = ', '.join(['{:.0f}'.format(gc) for gc in gene_count])
+        singles = '{:,d} ({:.1f}\\%)'.format(len(singletons),
+                                             single_frac * 100)
+        row = [species, count, occupancy, genecounts, singles]
+
+    return row
+
+
+def pilocus_row(tables, fmt):
+    """Calculate the piLocus summary for a genome."""
+    assert fmt in ['tsv', 'tex']
+    iloci = tables['iloci']
+    premrnas = tables['prnas']
+
+    species = iloci['Species'][0]
+    piloci = iloci.loc[iloci.LocusClass.isin(['siLocus', 'ciLocus'])]
+    pilocus_count = len(piloci)
+    effective_genome = iloci.loc[iloci.LocusClass != 'fiLocus']
+    effective_genome_size = effective_genome['EffectiveLength'].sum()
+    pilocus_occ = piloci['EffectiveLength'].sum()
+    pilocus_occ_perc = pilocus_occ / effective_genome_size
+    single_exon_piloci = len(premrnas[premrnas['ExonCount'] == 1])
+    single_exon_perc = single_exon_piloci / len(premrnas)
+
+    if fmt == 'tsv':
+        row = [species, pilocus_count, pilocus_occ, pilocus_occ_perc,
+               single_exon_piloci, single_exon_perc]
+    elif fmt == 'tex':
+        count = '{:,d}'.format(pilocus_count)
+        occupancy = '{:,.1f} Mb ({:.1f}\\%)'.format(pilocus_occ / 1000000,
+                                                    pilocus_occ_perc * 100)
+        sepiloci = '{:,d} ({:.1f}\\%)'.format(single_exon_piloci,
+                                              single_exon_perc * 100)
+        row = [species, count, occupancy, sepiloci]
+
+    return row
+
+
+# -----------------------------------------------------------------------------
+# Compactness
+# -----------------------------------------------------------------------------
+
+def longseqs(db, minlength=1000000, seqids=None):
+    """
+    Retrieve the sequences at least `minlength` bp long.
+
+    Lengths are taken from the sequence length index of the genome (see
+    `GenomeDB.sequence_lengths`). If `seqids` is declared, only the sequences
+    therein are considered.
+    """
+    for seqid, length in db.sequence_lengths():
+        if seqids is not None and seqid not in seqids:
+            continue
+        if length >= minlength:
+            yield seqid, length
+
+
+def thresholds(iloci, iqnt=0.95, gqnt=0.05):
+    ithresh = None
+    if iqnt:
+        iiloci = iloci.loc[iloci.LocusClass == 'iiLocus']
+        ithresh = int(iiloci['Length'].quantile(iqnt))
+    gthresh = None
+    if gqnt:
+        gilocus_types = ['siLocus', 'ciLocus', 'niLocus']
+        giloci = iloci.loc[iloci.LocusClass.isin(gilocus_types)]
+        gthresh = int(giloci['Length'].quantile(gqnt))
+    return ithresh, gthresh
+
+
+def per_sequence(values, seqids):
+    """Align per-sequence values (from a group-by) to the given sequences."""
+    values.index = values.index.astype(str)
+    return values.reindex(seqids, fill_value=0)
+
+
+def compactness(iloci, miloci, seqids, ithresh=None, gthresh=None):
+    """
+    Compute sigma and phi for each of the specified sequences.
+
+    The loci are filtered once, and each quantity is then computed for all
+    sequences at once with a group-by on sequence ID. Returns a data frame with
+    `Sigma` and `Phi` columns, indexed by sequence ID.
+    """
+    import pandas
+    gilocus_types = ['siLocus', 'ciLocus', 'niLocus']
+    iloci = iloci.loc[iloci.SeqID.isin(seqids)]
+    miloci = miloci.loc[miloci.SeqID.isin(seqids)]
+
+    # Effective length of each sequence, less the length of filtered iLoci
+    seqloci = iloci.loc[iloci.LocusClass != 'fiLocus']
+    exclude = pandas.Series(False, index=seqloci.index)
+    if ithresh:
+        exclude |= ((seqloci.LocusClass == 'iiLocus') &
+                    (seqloci.Length > ithresh))
+    if gthresh:
+        exclude |= (seqloci.LocusClass.isin(gilocus_types) &
+                    (seqloci.Length < gthresh))
+    effsize = seqloci.EffectiveLength - seqloci.Length.where(exclude, 0)
+    length = effsize.groupby(seqloci.SeqID, observed=True).sum()
+
+    # Proportion of giLoci merged into miLoci
+    giloci = iloci.loc[iloci.LocusClass.isin(gilocus_types)]
+    singletons = miloci.loc[miloci.LocusClass.isin(gilocus_types)]
+    if gthresh:
+        giloci = giloci.loc[giloci.Length >= gthresh]
+        singletons = singletons.loc[singletons.Length >= gthresh]
+    gcount = giloci.groupby('SeqID', observed=True).size()
+    scount = singletons.groupby('SeqID', observed=True).size()
+
+    # Proportion of the effective length occupied by miLoci
+    milocus_occ = miloci.loc[miloci.LocusClass == 'miLocus'].groupby(
+        'SeqID', observed=True)['Length'].sum()
+
+    length = per_sequence(length, seqids)
+    gcount = per_sequence(gcount, seqids)
+    scount = per_sequence(scount, seqids)
+    milocus_occ = per_sequence(milocus_occ, seqids)
+    return pandas.DataFrame({'Sigma': milocus_occ / length,
+                             'Phi': (gcount - scount) / gcount},
+                            columns=['Sigma', 'Phi'])
+
+
+def calc_centroid(x, y, outlierfactor=2.25):
+    cent_x = sum(x) / len(x)
+    cent_y = sum(y) / len(y)
+
+    distances = list()
+    for xi, yi in zip(x, y):
+        distance = math.sqrt((xi - cent_x)**2 + (yi - cent_y)**2)
+        distances.append(distance)
+    avg_distance = sum(distances) / len(distances)
+
+    keep_x = list()
+    keep_y = list()
+    for xi, yi, di in zip(x, y, distances):
+        if di > avg_distance * outlierfactor:
+            continue
+        keep_x.append(xi)
+        keep_y.append(yi)
+
+    final_cent_x = sum(keep_x) / len(keep_x)
+    final_cent_y = sum(keep_y) / len(keep_y)
+    return final_cent_x, final_cent_y
+
+
+def compact_rows(db, tables, opts):
+    """Calculate the compactness of each long sequence of a genome."""
+    iloci = tables['iloci']
+    miloci = tables['miloci']
+    ithresh, gthresh = thresholds(iloci, opts['iqnt'], opts['gqnt'])
+    annotated = set(iloci['SeqID'].astype(str))
+    seqids = [seqid for seqid, length in longseqs(db, opts['length'],
+                                                  annotated)]
+    measures = compactness(iloci, miloci, seqids, ithresh, gthresh)
+    sigmas = measures['Sigma'].tolist()
+    phis = measures['Phi'].tolist()
+
+    if opts['centroid']:
+        phi, sigma = calc_centroid(phis, sigmas, opts['centroid'])
+        return [[db.label, 'Centroid', sigma, phi]]
+    return [[db.label, seqid, sigma, phi]
+            for seqid, sigma, phi in zip(seqids, sigmas, phis)]
+
+
+# -----------------------------------------------------------------------------
+# Driver
+# -----------------------------------------------------------------------------
+
+def load_tables(db, names, shuffled=False):
+    """
+    Load the statistics tables needed for the specified summaries.
+
+    Each table is loaded once, with the union of the columns needed by all of
+    the summaries. If `shuffled` is true, the shuffled iLocus and merged iLocus
+    tables are used for the summaries in `shuffled_summaries`, and the
+    unshuffled tables for all others. Returns a dictionary of tables for each
+    summary.
+    """
+    tablefiles = dict()
+    for name in names:
+        tablefiles[name] = {
+            'iloci': db.ilocustable,
+            'miloci': db.milocustable,
+            'prnas': db.premrnatable,
+        }
+        if shuffled and name in shuffled_summaries:
+            tablefiles[name]['iloci'] = db.ilocustableshuf
+            tablefiles[name]['miloci'] = db.milocustableshuf
+
+    columns = dict()
+    for name in names:
+        for table, tablecolumns in table_columns[name]:
+            tablefile = tablefiles[name][table]
+            if tablefile not in columns:
+                columns[tablefile] = list()
+            for column in tablecolumns:
+                if column not in columns[tablefile]:
+                    columns[tablefile].append(column)
+
+    data = dict()
+    for tablefile in columns:
+        data[tablefile] = genhub.stats.load_table(tablefile,
+                                                  columns[tablefile])
+    tables = dict()
+    for name in names:
+        tables[name] = dict()
+        for table, tablecolumns in table_columns[name]:
+            tables[name][table] = data[tablefiles[name][table]]
+    return tables
+
+
+def summarize(task):
+    """
+    Compute the specified summaries for one genome.
+
+    The task is a `(db, names, fmt, opts)` tuple. Returns a dictionary of rows
+    for each summary.
+    """
+    db, names, fmt, opts = task
+    tables = load_tables(db, names, opts['shuffled'])
+    rows = dict()
+    for name in names:
+        if name == 'ilocus':
+            rows[name] = [ilocus_row(tables[name], fmt)]
+        elif name == 'milocus':
+            rows[name] = [milocus_row(tables[name], fmt)]
+        elif name == 'pilocus':
+            rows[name] = [pilocus_row(tables[name], fmt)]
+        elif name == 'compact':
+            rows[name] = compact_rows(db, tables[name], opts)
+        else:
+            raise ValueError('unsupported summary "%s"' % name)
+    return rows
+
+
+def run(dbs, names, fmt='tsv', opts=None, numprocs=1):
+    """
+    Summarize the specified genomes.
+
+    Genomes are summarized in parallel by up to `numprocs` processes. Returns
+    a list of rows for each summary, in the order of the genomes.
+    """
+    if opts is None:
+        opts = default_options
+    tasks = [(db, names, fmt, opts) for db in dbs]
+    if numprocs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=min(numprocs, len(tasks)))
+        try:
+            results = pool.map(summarize, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [summarize(task) for task in tasks]
+
+    rows = dict()
+    for name in names:
+        rows[name] = list()
+        for result in results:
+            rows[name].extend(result[name])
+    return rows
+
+
+def header(name, fmt='tsv'):
+    if name == 'ilocus':
+        return ['Species', 'Mb', '#Seq', 'fiLoci', 'iiLoci', 'niLoci',
+                'siLoci', 'ciLoci']
+    elif name == 'milocus':
+        if fmt == 'tex':
+            return ['Species', 'miLoci', 'Occupancy', 'Gene Count',
+                    'Singletons']
+        return ['Species', 'miLoci', 'Occupancy', 'GenomeFraction',
+                'GeneCountQuartiles', 'Singletons', 'SingletonFraction']
+    elif name == 'pilocus':
+        if fmt == 'tex':
+            return ['Species', 'piLoci', 'Occupancy', 'Single Exon piLoci']
+        return ['Species', 'piLoci', 'Occupancy', 'GenomeFraction',
+                'SingleExon_piLoci', 'SingleExonFraction']
+    elif name == 'compact':
+        return ['Species', 'SeqID', 'Sigma', 'Phi']
+    raise ValueError('unsupported summary "%s"' % name)
+
+
+def format_row(name, values, fmt='tsv'):
+    """Format a row of a summary table as a line of text."""
+    assert fmt in ['tsv', 'tex']
+    if fmt == 'tsv' or name == 'compact':
+        return '\t'.join([str(v) for v in values])
+    if name == 'ilocus':
+        vals = ['{:>12}'.format(v) for v in values] + [' \\\\']
+    else:
+        vals = ['{:>20}'.format(v) for v in values]
+        vals[-1] += '  \\\\'
+    return ' & '.join(vals)
+
+
+def write(name, rows, fmt='tsv', outstream=sys.stdout):
+    """Write a summary table, with a header."""
+    print(format_row(name, header(name, fmt), fmt), file=outstream)
+    for row in rows:
+        print(format_row(name, row, fmt), file=outstream)
+
+
+# -----------------------------------------------------------------------------
+# Unit tests
+# -----------------------------------------------------------------------------
+
+def test_format():
+    """Summary: table formatting"""
+    assert format_row('ilocus', ['Bdis', 0.5, 2]) == 'Bdis\t0.5\t2'
+    assert format_row('ilocus', ['Bdis', '0.5'], 'tex') == \
+        '        Bdis &          0.5 &  \\\\'
+    assert format_row('pilocus', ['Bdis', '3'], 'tex') == \
+        '                Bdis &                    3  \\\\'
+    assert format_row('compact', ['Bdis', 'chr1', 0.5, 1.0], 'tex') == \
+        'Bdis\tchr1\t0.5\t1.0'
+
+
+def test_cli():
+    """Summary: command-line interface"""
+    args = cli('compact', compact=True).parse_args(['-l', '5000', 'Bdis'])
+    assert options(args)['length'] == 5000
+    assert options(args)['centroid'] is None
+    args = cli('summary').parse_args(['Bdis'])
+    assert not hasattr(args, 'length')
+    assert options(args) == default_options
+
+    args = cli('summary').parse_args([])
+    checkfailed = False
+    try:
+        genomes(args)
+    except ValueError as e:
+        checkfailed = 'no genomes specified' in str(e)
+    assert checkfailed
+
+
+def test_summaries():
+    """Summary: all summaries from one load of each table"""
+    try:
+        import pandas
+    except ImportError:  # pragma: no cover
+        return
+    workdir = tempfile.mkdtemp()
+    try:
+        dbs = [genhub.test_registry.genome(label, workdir=workdir)
+               for label in ['Bdis', 'Atha']]
+        for db in dbs:
+            os.mkdir(db.dbdir)
+            with open(db.gdnafile, 'w') as outstream:
+                for seqid, length in [('chr1', 25000), ('chr2', 800),
+                                      ('chr3', 5000)]:
+                    print('>' + seqid, file=outstream)
+                    genhub.fasta.format('N' * length, outstream=outstream)
+            columns = ['Species', 'LocusId', 'SeqID', 'LocusPos', 'Length',
+                       'EffectiveLength', 'LocusClass', 'GeneCount']
+            loci = [('chr1', 1, 2000, 'siLocus', 1),
+                    ('chr1', 2001, 4000, 'iiLocus', 0),
+                    ('chr1', 4001, 9000, 'ciLocus', 2),
+                    ('chr1', 9001, 25000, 'niLocus', 1),
+                    ('chr2', 1, 800, 'fiLocus', 0)]
+            for table, merged in [(db.ilocustable, False),
+                                  (db.milocustable, True)]:
+                with open(table, 'w') as outstream:
+                    print(*columns, sep='\t', file=outstream)
+                    for i, locus in enumerate(loci):
+                        seqid, start, end, locusclass, genes = locus
+                        if merged and i == 2:
+                            continue
+                        if merged and i == 3:
+                            start, locusclass, genes = 4001, 'miLocus', 3
+                        length = end - start + 1
+                        locuspos = '%s_%d-%d' % (seqid, start, end)
+                        print(db.label, 'L%d' % i, seqid, locuspos, length,
+                              length, locusclass, genes, sep='\t',
+                              file=outstream)
+            with open(db.premrnatable, 'w') as outstream:
+                print('Species', 'Accession', 'ExonCount', sep='\t',
+                      file=outstream)
+                for i, exons in enumerate([1, 4, 2, 1]):
+                    print(db.label, 'mRNA%d' % i, exons, sep='\t',
+                          file=outstream)
+
+        opts = dict(default_options)
+        opts['length'] = 1000
+        rows = run(dbs, summaries, opts=opts)
+        assert rows['ilocus'] == [['Bdis', 0.0258, 2, 1, 1, 1, 1, 1],
+                                  ['Atha', 0.0258, 2, 1, 1, 1, 1, 1]]
+        assert rows['milocus'][0] == ['Bdis', 1, 21000, 21000 / 25000,
+                                      '3,3,3', 1, 3]
+        assert rows['pilocus'][1] == ['Atha', 2, 7000, 7000 / 25000, 2, 0.5]
+        assert rows['compact'] == [['Bdis', 'chr1', 21000 / 25000, 2 / 3],
+                                   ['Atha', 'chr1', 21000 / 25000, 2 / 3]]
+        assert run(dbs, summaries, opts=opts, numprocs=2) == rows
+
+        # Shuffled tables are used for the miLocus and compactness summaries
+        opts['shuffled'] = True
+        for db in dbs:
+            shutil.copy(db.ilocustable, db.ilocustableshuf)
+            os.rename(db.milocustable, db.milocustableshuf)
+        assert run(dbs, summaries, opts=opts) == rows
+        for db in dbs:
+            os.unlink(db.ilocustableshuf)
+        assert run(dbs, ['ilocus', 'pilocus'], opts=opts) == \
+            dict((name, rows[name]) for name in ['ilocus', 'pilocus'])
+    finally:
+        shutil.rmtree(workdir)
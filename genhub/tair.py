@@ -19,9 +19,7 @@ template.
 from __future__ import print_function
 import filecmp
 import gzip
-import os
 import re
-import subprocess
 import sys
 import genhub
 
@@ -79,32 +77,15 @@ class TairDB(genhub.genomedb.GenomeDB):
             print(line, end='', file=outstream)
 
     def format_gff3(self, logstream=sys.stderr, debug=False):
-        cmds = list()
-        cmds.append('gunzip -c %s' % self.gff3path)
+        pipeline = genhub.gff3.Pipeline()
         if 'annotfilter' in self.config:  # pragma: no cover
-            excludefile = self.filter_file()
-            cmds.append('grep -vf %s' % excludefile.name)
-        cmds.append('sed "s/Index=/index=/"')
-        cmds.append('tidygff3')
-        cmds.append('genhub-format-gff3.py --source tair -')
-        cmds.append('gt gff3 -sort -tidy -o %s -force' % self.gff3file)
-
-        commands = ' | '.join(cmds)
-        if debug:  # pragma: no cover
-            print('DEBUG: running command: %s' % commands, file=logstream)
-        proc = subprocess.Popen(commands, shell=True, universal_newlines=True,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
-        for line in stderr.split('\n'):  # pragma: no cover
-            if 'has not been previously introduced' not in line and \
-               'does not begin with "##gff-version"' not in line and \
-               'more than one pseudogene attribute' not in line and \
-               line != '':
-                print(line, file=logstream)
-        assert proc.returncode == 0, \
-            'annot cleanup command failed: %s' % commands
-        if 'annotfilter' in self.config:  # pragma: no cover
-            os.unlink(excludefile.name)
+            pipeline.add('annotfilter', genhub.gff3.exclude,
+                         self.config['annotfilter'])
+        pipeline.add('index', genhub.gff3.substitute, 'Index=', 'index=')
+        pipeline.add_command('tidygff3', ['tidygff3'])
+        pipeline.add('format', genhub.gff3.format_features, 'tair', True)
+        ignore = ['more than one pseudogene attribute']
+        self.run_gff3_pipeline(pipeline, ignore, logstream)
 
     def gff3_protids(self, instream):
         protids = dict()
@@ -118,41 +99,6 @@ class TairDB(genhub.genomedb.GenomeDB):
             protids[protid] = True
             yield protid
 
-    def protein_mapping(self, instream):
-        locusid2name = dict()
-        gene2loci = dict()
-        for line in instream:
-            fields = line.split('\t')
-            if len(fields) != 9:
-                continue
-            feattype = fields[2]
-            attrs = fields[8]
-
-            if feattype == 'locus':
-                idmatch = re.search('ID=([^;\n]+);.*Name=([^;\n]+)', attrs)
-                if idmatch:
-                    locusid = idmatch.group(1)
-                    locusname = idmatch.group(2)
-                    locusid2name[locusid] = locusname
-            elif feattype == 'gene':
-                idmatch = re.search('ID=([^;\n]+);Parent=([^;\n]+)', attrs)
-                if idmatch:
-                    geneid = idmatch.group(1)
-                    ilocusid = idmatch.group(2)
-                    gene2loci[geneid] = ilocusid
-                else:  # pragma: no cover
-                    print('Unable to parse gene and iLocus IDs: %s' % attrs,
-                          file=sys.stderr)
-            elif feattype == 'mRNA':
-                idmatch = re.search('Parent=([^;\n]+);Name=([^;\n]+)', attrs)
-                assert idmatch, \
-                    'Unable to parse mRNA and gene IDs: %s' % attrs.rstrip()
-                geneid = idmatch.group(1)
-                mrnaid = idmatch.group(2)
-                ilocusid = gene2loci[geneid]
-                ilocusname = locusid2name[ilocusid]
-                yield mrnaid, ilocusname
-
 
 # -----------------------------------------------------------------------------
 # Unit tests
@@ -15,214 +15,6 @@ import sys
 import genhub
 
 
-class FeatureFormatter(object):
-    """Load features from GFF3, parse and (re-)attach accession numbers."""
-
-    def __init__(self, instream, source):
-        self.instream = instream
-        self.source = source
-
-        self.id2type = dict()
-        self.id2acc = dict()
-        self.filters = ['\tregion\t', '\tmatch\t', '\tcDNA_match\t',
-                        '##species']
-
-    def __iter__(self):
-        for line in self.instream:
-            line = line.rstrip()
-            if self.match_filter(line):
-                continue
-            if self.pseudogenic_cds(line):
-                continue
-
-            self.parse_type(line)
-            line = self.parse_gene(line)
-            line = self.parse_transcript(line)
-            line = self.parse_vdj(line)
-            line = self.parse_feature(line)
-
-            yield line
-
-    def parse_type(self, line):
-        fields = line.split('\t')
-        if len(fields) != 9:
-            return False
-
-        ftype = fields[2]
-        attributes = fields[8]
-        idmatch = re.search(r'ID=([^;\n]+)', attributes)
-        if idmatch:
-            featureid = idmatch.group(1)
-            self.id2type[featureid] = ftype
-
-    def match_filter(self, line):
-        for filt in self.filters:
-            if filt in line:
-                return True
-        return False
-
-    def pseudogenic_cds(self, line):
-        """
-        Test whether the given entry is a pseudogene-associated CDS.
-
-        We want to ignore these!
-        """
-        if self.source == 'tair':
-            return False
-
-        fields = line.split('\t')
-        if len(fields) != 9:
-            return False
-
-        ftype = fields[2]
-        attributes = fields[8]
-        if ftype != 'CDS':
-            return False
-
-        parentmatch = re.search(r'Parent=([^;\n]+)', attributes)
-        assert parentmatch, attributes
-        parentid = parentmatch.group(1)
-        if self.id2type[parentid] == 'pseudogene':
-            return True
-        return False
-
-    def parse_gene(self, line):
-        """Parse accession for gene features."""
-        fields = line.split('\t')
-        if len(fields) != 9:
-            return line
-
-        ftype = fields[2]
-        attributes = fields[8]
-        if ftype != 'gene' or '\tAEGeAn::tidygff3\t' in line:
-            return line
-
-        accmatch = None
-        if self.source == 'refseq':
-            accmatch = re.search(r'GeneID:([^;,\n]+)', line)
-        elif self.source == 'crg':
-            accmatch = re.search(r'ID=([^;\n]+)', line)
-        elif self.source in ['genbank', 'pdom', 'tair', 'beebase']:
-            accmatch = re.search(r'Name=([^;\n]+)', line)
-        elif self.source == 'local':
-            accmatch = re.search(r'accession=([^;\n]+)', attributes)
-            if not accmatch:
-                accmatch = re.search(r'Name=([^;\n]+)', attributes)
-        else:
-            pass
-        assert accmatch, 'unable to parse gene accession: %s' % line
-        accession = accmatch.group(1)
-
-        idmatch = re.search(r'ID=([^;\n]+)', attributes)
-        if idmatch:
-            geneid = idmatch.group(1)
-            self.id2acc[geneid] = accession
-        else:
-            print('Warning: gene has no ID: %s' % attributes, file=sys.stderr)
-
-        if 'accession=' in line:
-            return line
-        return line + ';accession=' + accession
-
-    def parse_transcript(self, line):
-        """Parse accession for transcript features."""
-        fields = line.split('\t')
-        if len(fields) != 9:
-            return line
-
-        ftype = fields[2]
-        attributes = fields[8]
-        ttypes = [
-            'mRNA', 'tRNA', 'rRNA', 'transcript', 'primary_transcript',
-            'ncRNA', 'miRNA', 'snRNA', 'snoRNA', 'lnc_RNA', 'scRNA', 'SRP_RNA',
-            'antisense_RNA', 'RNase_P_RNA', 'telomerase_RNA', 'piRNA',
-            'RNase_MRP_RNA', 'guide_RNA',
-        ]
-        if ftype not in ttypes:
-            return line
-
-        accmatch = None
-        idmatch = None
-        parentaccession = None
-        if self.source == 'refseq':
-            accmatch = re.search(r'transcript_id=([^;\n]+)', attributes)
-            idmatch = re.search(r'GeneID:([^;,\n]+)', attributes)
-        elif self.source == 'genbank':
-            parentid = re.search(r'Parent=([^;\n]+)', attributes).group(1)
-            parentaccession = self.id2acc[parentid]
-        elif self.source in ['crg', 'pdom']:
-            accmatch = re.search(r'ID=([^;\n]+)', attributes)
-        elif self.source in ['beebase', 'tair', 'am10']:
-            accmatch = re.search(r'Name=([^;\n]+)', attributes)
-        elif self.source == 'local':
-            accmatch = re.search(r'protein_id=([^;\n]+)', attributes)
-            if not accmatch:
-                accmatch = re.search(r'accession=([^;\n]+)', attributes)
-            if not accmatch:
-                accmatch = re.search(r'Name=([^;\n]+)', attributes)
-        else:
-            pass
-        assert accmatch or idmatch or parentaccession, \
-            'unable to parse transcript accession: %s' % line
-        if accmatch:
-            accession = accmatch.group(1)
-        elif parentaccession:
-            accession = '{}.{}'.format(parentaccession, ftype)
-        else:
-            accession = '%s:%s' % (idmatch.group(1), ftype)
-
-        rnaidmatch = re.search(r'ID=([^;\n]+)', attributes)
-        if rnaidmatch:
-            rnaid = rnaidmatch.group(1)
-            self.id2acc[rnaid] = accession
-        else:
-            print('Warning: RNA has no ID: %s' % attributes, file=sys.stderr)
-
-        if 'accession=' in line:
-            return line
-        return line + ';accession=' + accession
-
-    def parse_vdj(self, line):
-        """Parse accessions for features of V(D)J genes."""
-        fields = line.split('\t')
-        if len(fields) != 9:
-            return line
-
-        ftype = fields[2]
-        if ftype not in ['V_gene_segment', 'D_gene_segment', 'J_gene_segment',
-                         'C_gene_segment']:
-            return line
-
-        vdjid = re.search(r'ID=([^;\n]+)', line).group(1)
-        accession = re.search(r'GeneID:([^;,\n]+)', line).group(1)
-        self.id2acc[vdjid] = accession
-
-        return line + ';accession=' + accession
-
-    def parse_feature(self, line):
-        """Parse accession for exons, introns, and coding sequences"""
-        if 'accession=' in line:
-            return line
-
-        fields = line.split('\t')
-        if len(fields) != 9:
-            return line
-
-        ftype = fields[2]
-        if ftype not in ['exon', 'intron', 'CDS']:
-            return line
-
-        parentid = re.search(r'Parent=([^;\n]+)', line).group(1)
-        if self.source == 'tair':
-            for pid in parentid.split(','):
-                if 'RNA' in pid:
-                    parentid = pid
-        assert ',' not in parentid, parentid
-        assert parentid in self.id2acc, parentid
-        accession = self.id2acc[parentid]
-        return line + ';accession=' + accession
-
-
 def parse_args():
     """Define the command-line interface."""
     desc = 'Filter features and parse accession values'
@@ -235,6 +27,10 @@ def parse_args():
                         help='attach the given prefix to each sequence ID')
     parser.add_argument('--source', default='refseq', choices=genhub.sources,
                         help='data source; default is "refseq"')
+    parser.add_argument('--evict', action='store_true',
+                        help='discard feature IDs at each "###" directive, '
+                        'reducing memory usage; the input must not include '
+                        'references to features preceding a "###"')
     parser.add_argument('gff3', type=argparse.FileType('r'))
     return parser.parse_args()
 
@@ -250,7 +46,8 @@ def format_prefix(line, prefix):
 
 def main():
     args = parse_args()
-    formatter = FeatureFormatter(args.gff3, args.source)
+    formatter = genhub.gff3.FeatureFormatter(args.gff3, args.source,
+                                             evict=args.evict)
     for line in formatter:
         if args.prefix:
             line = format_prefix(line, args.prefix)
@@ -9,28 +9,8 @@
 # -----------------------------------------------------------------------------
 
 from __future__ import print_function
-import re
 import sys
+import genhub
 
-for line in sys.stdin:
-    fields = line.split('\t')
-    assert len(fields) == 9
-    ftype = fields[2]
-    assert ftype in ['mRNA', 'CDS']
-
-    attrstring = fields[8]
-    protmatch = re.search(r'GenePrediction (\S+)', attrstring)
-    assert protmatch, line
-    protid = protmatch.group(1)
-    featid = protid
-    if ftype == 'CDS':
-        featid += '-CDS'
-    attrs = list()
-    attrs.append('ID=%s' % featid)
-    if ftype == 'CDS':
-        attrs.append('Parent=%s' % protid)
-    attrs.append('Name=%s' % protid)
-    fields[8] = ';'.join(attrs)
-
-    newentry = '\t'.join(fields)
-    print(newentry)
+for line in genhub.gff3.glean_to_gff3(sys.stdin):
+    print(line)
@@ -49,13 +49,21 @@ class GenomeDBCache(object):
         newdir = os.path.dirname(newfile)
         subprocess.call(['mkdir', '-p', newdir])
         shutil.copy2(existingfile, newfile)
+        sha1 = self.db.file_sha1(existingfile)
+        genhub.checksum.write_manifest(newfile, sha1)
 
     def file_test(self, cachefile, testfile, newfile):
-        """If test file is different from cache, copy to new file."""
+        """
+        If test file is different from cache, copy to new file.
+
+        Checksums are taken from the manifests written when the files were
+        downloaded or cached, so the files themselves are only read if a
+        manifest is missing.
+        """
         assert os.path.isfile(testfile)
-        testsha1 = self.db.file_sha1(testfile)
+        testsha1 = self.db.file_sha1(testfile, record=True)
         assert os.path.isfile(cachefile)
-        cachesha1 = self.db.file_sha1(cachefile)
+        cachesha1 = self.db.file_sha1(cachefile, record=True)
         if testsha1 == cachesha1:
             message = (
                 'Testfile "{tf}" and cachefile "{cf}" match ({sha}); cache is '
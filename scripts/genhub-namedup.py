@@ -13,13 +13,8 @@ attribute, copy the ID attribute to the Name attribute.
 """
 
 from __future__ import print_function
-import re
 import sys
+import genhub
 
-for line in sys.stdin:
-    line = line.rstrip()
-    idmatch = re.search("ID=([^;\n]+)", line)
-    namematch = re.search("Name=([^;\n]+)", line)
-    if idmatch and not namematch:
-        line += ";Name=%s" % idmatch.group(1)
+for line in genhub.gff3.namedup(sys.stdin):
     print(line)
@@ -10,59 +10,60 @@
 
 from __future__ import print_function
 import argparse
+import functools
 import re
 import sys
 import genhub
 
 
-def gc_content(dna):
-    """Calculate the %GC content of a nucleotide sequence."""
-    seqlength = len(dna)
+def defline_position(defline):
+    """Retrieve the feature position from a `>accession position` defline."""
+    return defline.split(' ')[1]
 
-    # Count A and T nucleotides, including the W ambiguity base representing
-    # either A or T
-    atcount = dna.count('A') + dna.count('a') + \
-        dna.count('T') + dna.count('t') + \
-        dna.count('W') + dna.count('w')
 
-    # Count C and G nucleotides, including the S ambiguity base representing
-    # either C or G
-    gccount = dna.count('C') + dna.count('c') + \
-        dna.count('G') + dna.count('g') + \
-        dna.count('S') + dna.count('s')
+def sequence_map(fasta, keyfunc=None, unique=False):
+    """
+    Provide lookup of feature sequences by ID (or other defline key).
 
-    # Count all other ambiguous nucleotides; most will be Ns, but occasionally
-    # there will be other IUPAC ambiguity symbols
-    ncount = seqlength - atcount - gccount
+    If `fasta` is an `IndexedFasta` object it is used directly, and sequences
+    are read from disk only as they are needed. Otherwise `fasta` is treated as
+    a stream of Fasta data and all of its sequences are loaded into memory.
+    Unless `unique` is set, the first of any duplicated keys takes precedence;
+    an `IndexedFasta` object must then have been created with `unique` set.
+    """
+    if isinstance(fasta, genhub.fasta.IndexedFasta):
+        assert fasta.unique or not unique, \
+            'duplicate seqids not checked: ' + fasta.filename
+        return fasta
 
-    if atcount + gccount == 0:
-        assert ncount == seqlength
-        gccontent = 0.0
-    else:
-        gccontent = float(gccount) / float(gccount + atcount)
-    return gccontent
+    seqs = {}
+    for defline, seq in genhub.fasta.parse(fasta):
+        if keyfunc:
+            seqid = keyfunc(defline[1:])
+        else:
+            seqid = defline[1:].split(' ')[0]
+        if unique:
+            assert seqid not in seqs, 'duplicate seqid: ' + seqid
+        if seqid not in seqs:
+            seqs[seqid] = seq
+    return seqs
 
 
-def gc_skew(dna):
+def gff3_blocks(gff3):
     """
-    Calculate the GC skew of a nucleotide sequence.
+    Group the entries of a GFF3 stream into `###`-delimited blocks.
 
-    s = (G - C) / (G + C)
+    Each block includes its terminating `###` directive. Any entries following
+    the final `###` directive are yielded as a block of their own.
     """
-    gcount = dna.count('G') + dna.count('g')
-    ccount = dna.count('C') + dna.count('c')
-    if gcount + ccount == 0:
-        return 0.0
-    return float(gcount - ccount) / float(gcount + ccount)
-
-
-def n_content(dna):
-    """Calculate the proportion of ambigious nucleotides in a DNA sequence."""
-    ncount = dna.count('N') + dna.count('n') + \
-        dna.count('X') + dna.count('x')
-    if ncount == 0:
-        return 0.0
-    return float(ncount) / float(len(dna))
+    block = list()
+    for entry in gff3:
+        block.append(entry)
+        if entry.startswith('###'):
+            yield block
+            block = list()
+    if len(block) > 0:
+        yield block
 
 
 def ilocus_desc(gff3, fasta, miloci=False):
@@ -72,13 +73,15 @@ def ilocus_desc(gff3, fasta, miloci=False):
     - gff3: file handle to a GFF3 file containing iLocus annotations
     - fasta: file handle to a Fasta file containing iLocus sequences
     """
-    seqs = {}
-    for defline, seq in genhub.fasta.parse(fasta):
-        seqid = defline[1:].split(' ')[0]
-        assert seqid not in seqs, 'duplicate seqid: ' + seqid
-        seqs[seqid] = seq
+    seqs = sequence_map(fasta, unique=True)
+    for block in gff3_blocks(gff3):
+        for values in ilocus_block(block, seqs, miloci=miloci):
+            yield values
 
-    for entry in gff3:
+
+def ilocus_block(block, seqs, miloci=False):
+    """Generate a tabular record for each iLocus in a block of GFF3 entries."""
+    for entry in block:
         if '\tlocus\t' not in entry:
             continue
         fields = entry.rstrip().split('\t')
@@ -95,9 +98,8 @@ def ilocus_desc(gff3, fasta, miloci=False):
         assert len(locusseq) == locuslen, \
             'Locus "%s": length mismatch; gff=%d, fa=%d' % (
             locusid, locuslen, len(locusseq))
-        gccontent = gc_content(locusseq)
-        gcskew = gc_skew(locusseq)
-        ncontent = n_content(locusseq)
+        gccontent, gcskew, ncontent = \
+            genhub.composition.composition(locusseq)
 
         classmatch = re.search(r'iLocus_type=([^;\n]+)', fields[8])
         assert(classmatch), fields[8]
@@ -129,12 +131,14 @@ def premrna_desc(gff3, fasta):
     Given pre-mRNA sequences and corresponding annotations, generate a tabular
     record for each.
     """
-    seqs = {}
-    for defline, seq in genhub.fasta.parse(fasta):
-        seqid = defline[1:].split(' ')[0]
-        if seqid not in seqs:
-            seqs[seqid] = seq
+    seqs = sequence_map(fasta)
+    for block in gff3_blocks(gff3):
+        for values in premrna_block(block, seqs):
+            yield values
 
+
+def premrna_block(block, seqs):
+    """Generate a tabular record for the pre-mRNA in a block of entries."""
     mrnaacc = ''
     mrnalen = 0
     gccontent = 0.0
@@ -144,7 +148,7 @@ def premrna_desc(gff3, fasta):
     introncount = 0
     utr5plen = 0
     utr3plen = 0
-    for entry in gff3:
+    for entry in block:
         if '\tmRNA\t' in entry:
             fields = entry.rstrip().split('\t')
             assert len(fields) == 9
@@ -157,9 +161,8 @@ def premrna_desc(gff3, fasta):
                 message += '; most likely a duplicated accession, discarding'
                 print(message, file=sys.stderr)
                 mrnaacc = ''
-            gccontent = gc_content(mrnaseq)
-            gcskew = gc_skew(mrnaseq)
-            ncontent = n_content(mrnaseq)
+            gccontent, gcskew, ncontent = \
+                genhub.composition.composition(mrnaseq)
         elif '\texon\t' in entry:
             exoncount += 1
         elif '\tintron\t' in entry:
@@ -178,16 +181,6 @@ def premrna_desc(gff3, fasta):
                     mrnaacc, mrnalen, gccontent, gcskew, ncontent,
                     exoncount, introncount, utr5plen, utr3plen)
                 yield values.split(' ')
-            mrnaacc = ''
-            mrnalen = 0
-            gccontent = 0.0
-            gcskew = 0.0
-            ncontent = 0.0
-            exoncount = 0
-            exonlen = 0
-            introncount = 0
-            utr5plen = 0
-            utr3plen = 0
 
 
 def mrna_desc(gff3, fasta):
@@ -195,15 +188,17 @@ def mrna_desc(gff3, fasta):
     Given mature (sans introns) mRNA sequences and their corresponding
     annotations, generate a tabular record for each mRNA.
     """
-    seqs = {}
-    for defline, seq in genhub.fasta.parse(fasta):
-        seqid = defline[1:].split(' ')[0]
-        if seqid not in seqs:
-            seqs[seqid] = seq
+    seqs = sequence_map(fasta)
+    for block in gff3_blocks(gff3):
+        for values in mrna_block(block, seqs):
+            yield values
 
+
+def mrna_block(block, seqs):
+    """Generate a tabular record for the mRNA in a block of GFF3 entries."""
     mrnaacc = ''
     mrnalen = 0
-    for entry in gff3:
+    for entry in block:
         if '\tmRNA\t' in entry:
             fields = entry.rstrip().split('\t')
             assert len(fields) == 9
@@ -219,14 +214,11 @@ def mrna_desc(gff3, fasta):
                 message += '; most likely a duplicated accession, discarding'
                 print(message, file=sys.stderr)
             else:
-                gccontent = gc_content(mrnaseq)
-                gcskew = gc_skew(mrnaseq)
-                ncontent = n_content(mrnaseq)
+                gccontent, gcskew, ncontent = \
+                    genhub.composition.composition(mrnaseq)
                 values = '%s %d %.3f %.3f %.3f' % (
                     mrnaacc, mrnalen, gccontent, gcskew, ncontent)
                 yield values.split(' ')
-            mrnaacc = ''
-            mrnalen = 0
 
 
 def cds_desc(gff3, fasta):
@@ -234,15 +226,17 @@ def cds_desc(gff3, fasta):
     Given CDS sequences and their corresponding annotations, generate a tabular
     record for each CDS.
     """
-    seqs = {}
-    for defline, seq in genhub.fasta.parse(fasta):
-        seqid = defline[1:].split(' ')[0]
-        if seqid not in seqs:
-            seqs[seqid] = seq
+    seqs = sequence_map(fasta)
+    for block in gff3_blocks(gff3):
+        for values in cds_block(block, seqs):
+            yield values
 
+
+def cds_block(block, seqs):
+    """Generate a tabular record for the CDS in a block of GFF3 entries."""
     accession = ''
     cdslen = 0
-    for entry in gff3:
+    for entry in block:
         if '\tCDS\t' in entry:
             fields = entry.rstrip().split('\t')
             assert len(fields) == 9
@@ -258,14 +252,11 @@ def cds_desc(gff3, fasta):
                     message += ', discarding'
                     print(message, file=sys.stderr)
                 else:
-                    gccontent = gc_content(cdsseq)
-                    gcskew = gc_skew(cdsseq)
-                    ncontent = n_content(cdsseq)
+                    gccontent, gcskew, ncontent = \
+                        genhub.composition.composition(cdsseq)
                     values = '%s %d %.3f %.3f %.3f' % (
                         accession, cdslen, gccontent, gcskew, ncontent)
                     yield values.split(' ')
-            accession = ''
-            cdslen = 0
 
 
 def feat_overlap(f1, f2):
@@ -337,19 +328,28 @@ def exon_desc(gff3, fasta):
     Given exon sequences and their corresponding annotations, generate a
     tabular record for each exon.
     """
-    seqs = {}
-    for defline, seq in genhub.fasta.parse(fasta):
-        exonpos = defline[1:].split(' ')[1]
-        seqs[exonpos] = seq
-
+    seqs = sequence_map(fasta, keyfunc=defline_position)
     rnaid_to_accession = dict()
-    reported_exons = {}
+    reported_exons = dict()
+    for block in gff3_blocks(gff3):
+        for values in exon_block(block, seqs, rnaid_to_accession,
+                                 reported_exons):
+            yield values
+
+
+def exon_block(block, seqs, rnaid_to_accession, reported_exons):
+    """
+    Generate a tabular record for each exon in a block of GFF3 entries.
+
+    The `rnaid_to_accession` and `reported_exons` dictionaries are updated as
+    exons are processed, and must be shared between consecutive blocks.
+    """
     exons, cdss = [], {}
     start, stop = None, None
     moltypes = ['mRNA', 'tRNA', 'ncRNA', 'transcript', 'primary_transcript',
                 'V_gene_segment', 'D_gene_segment', 'J_gene_segment',
                 'C_gene_segment']
-    for entry in gff3:
+    for entry in block:
         for moltype in moltypes:
             if ('\t%s\t' % moltype) in entry:
                 accession = re.search(r'accession=([^;\n]+)', entry).group(1)
@@ -374,16 +374,14 @@ def exon_desc(gff3, fasta):
                 if ';exception=ribosomal slippage' in cdss[exonpos]:
                     xcept = True
             if xcept:
-                exons, cdss = [], {}
-                start, stop = None, None
                 continue
             assert start, 'No start codon for exon(s): %s' % exons[0]
             assert stop,  'No stop codon for exon(s): %s' % exons[0]
+            newexons = list()
             for exon in exons:
                 fields = exon.split('\t')
                 assert len(
                     fields) == 9, 'entry does not have 9 fields: %s' % exon
-                mrnaid = re.search(r'Parent=([^;\n]+)', fields[8]).group(1)
                 exonpos = '%s_%s-%s%s' % (fields[0],
                                           fields[3], fields[4], fields[6])
                 if exonpos in reported_exons:
@@ -393,9 +391,15 @@ def exon_desc(gff3, fasta):
                 assert len(exonseq) == exonlength, \
                     'exon "%s": length mismatch; gff=%d, fa=%d' % (
                     exonpos, exonlength, len(exonseq))
-                gccontent = gc_content(exonseq)
-                gcskew = gc_skew(exonseq)
-                ncontent = n_content(exonseq)
+                reported_exons[exonpos] = 1
+                newexons.append((exon, fields, exonpos, exonlength, exonseq))
+
+            compositions = genhub.composition.batch_composition(
+                [exonseq for _, _, _, _, exonseq in newexons])
+            for exondata, comp in zip(newexons, compositions):
+                exon, fields, exonpos, exonlength, _ = exondata
+                gccontent, gcskew, ncontent = comp
+                mrnaid = re.search(r'Parent=([^;\n]+)', fields[8]).group(1)
                 context = exon_context(exon, start, stop)
                 phase = None
                 remainder = None
@@ -406,10 +410,7 @@ def exon_desc(gff3, fasta):
                 values = '%s %s %d %.3f %.3f %.3f %s %r %r' % (
                     exonpos, rnaid_to_accession[mrnaid], exonlength, gccontent,
                     gcskew, ncontent, context, phase, remainder)
-                reported_exons[exonpos] = 1
                 yield values.split(' ')
-            exons, cdss = [], {}
-            start, stop = None, None
 
 
 def intron_context(intron, start, stop):
@@ -455,16 +456,24 @@ def intron_desc(gff3, fasta):
     Given intron sequences and their corresponding annotations, generate a
     tabular record for each intron.
     """
-    seqs = {}
-    for defline, seq in genhub.fasta.parse(fasta):
-        intronpos = defline[1:].split(' ')[1]
-        seqs[intronpos] = seq
+    seqs = sequence_map(fasta, keyfunc=defline_position)
+    reported_introns = dict()
+    for block in gff3_blocks(gff3):
+        for values in intron_block(block, seqs, reported_introns):
+            yield values
+
 
-    reported_introns = {}
+def intron_block(block, seqs, reported_introns):
+    """
+    Generate a tabular record for each intron in a block of GFF3 entries.
+
+    The `reported_introns` dictionary is updated as introns are processed, and
+    must be shared between consecutive blocks.
+    """
     introns = []
     mrnaid = None
     start, stop = None, None
-    for entry in gff3:
+    for entry in block:
         if '\tmRNA\t' in entry:
             mrnaid = re.search(r'accession=([^;\n]+)', entry).group(1)
         elif '\tintron\t' in entry:
@@ -478,32 +487,76 @@ def intron_desc(gff3, fasta):
                 continue
             assert start, 'No start codon for introns(s): %s' % introns[0]
             assert stop,  'No stop codon for introns(s): %s' % introns[0]
-            if len(introns) > 0:
-                for intron in introns:
-                    fields = intron.split('\t')
-                    assert len(fields) == 9, \
-                        'entry does not have 9 fields: %s' % intron
-                    intronpos = '%s_%s-%s%s' % (fields[0], fields[3],
-                                                fields[4], fields[6])
-                    if intronpos in reported_introns:
-                        continue
-                    intronlength = int(fields[4]) - int(fields[3]) + 1
-                    intronseq = seqs[intronpos]
-                    assert len(intronseq) == intronlength, \
-                        'intron "%s": length mismatch; gff=%d, fa=%d' % (
-                            intronpos, intronlength, len(intronseq))
-                    gccontent = gc_content(intronseq)
-                    gcskew = gc_skew(intronseq)
-                    ncontent = n_content(intronseq)
-                    context = intron_context(intron, start, stop)
-                    values = '%s %s %d %.3f %.3f %.3f %s' % (
-                        intronpos, mrnaid, intronlength, gccontent, gcskew,
-                        ncontent, context)
-                    reported_introns[intronpos] = 1
-                    yield values.split(' ')
-            mrnaid = None
-            introns = []
-            start, stop = None, None
+            newintrons = list()
+            for intron in introns:
+                fields = intron.split('\t')
+                assert len(fields) == 9, \
+                    'entry does not have 9 fields: %s' % intron
+                intronpos = '%s_%s-%s%s' % (fields[0], fields[3],
+                                            fields[4], fields[6])
+                if intronpos in reported_introns:
+                    continue
+                intronlength = int(fields[4]) - int(fields[3]) + 1
+                intronseq = seqs[intronpos]
+                assert len(intronseq) == intronlength, \
+                    'intron "%s": length mismatch; gff=%d, fa=%d' % (
+                        intronpos, intronlength, len(intronseq))
+                reported_introns[intronpos] = 1
+                newintrons.append((intron, intronpos, intronlength,
+                                   intronseq))
+
+            compositions = genhub.composition.batch_composition(
+                [intronseq for _, _, _, intronseq in newintrons])
+            for introndata, comp in zip(newintrons, compositions):
+                intron, intronpos, intronlength, _ = introndata
+                gccontent, gcskew, ncontent = comp
+                context = intron_context(intron, start, stop)
+                values = '%s %s %d %.3f %.3f %.3f %s' % (
+                    intronpos, mrnaid, intronlength, gccontent, gcskew,
+                    ncontent, context)
+                yield values.split(' ')
+
+
+def block_descriptor(feattype, seqs):
+    """
+    Select the block-level descriptor for the given feature type.
+
+    The descriptor returned is a function that takes a block of GFF3 entries
+    as its only argument, with feature sequences and any state shared between
+    blocks already bound.
+    """
+    if feattype == 'iloci':
+        return functools.partial(ilocus_block, seqs=seqs)
+    elif feattype == 'miloci':
+        return functools.partial(ilocus_block, seqs=seqs, miloci=True)
+    elif feattype == 'prnas':
+        return functools.partial(premrna_block, seqs=seqs)
+    elif feattype == 'mrnas':
+        return functools.partial(mrna_block, seqs=seqs)
+    elif feattype == 'cds':
+        return functools.partial(cds_block, seqs=seqs)
+    elif feattype == 'exons':
+        return functools.partial(exon_block, seqs=seqs,
+                                 rnaid_to_accession=dict(),
+                                 reported_exons=dict())
+    elif feattype == 'introns':
+        return functools.partial(intron_block, seqs=seqs,
+                                 reported_introns=dict())
+    raise ValueError('unsupported feature type "%s"' % feattype)
+
+
+def describe(gff3, descriptors):
+    """
+    Compute statistics for several feature types in a single pass.
+
+    Each block of the GFF3 input is passed to every descriptor in turn. The
+    `descriptors` argument is a list of `(blockfunc, outstream)` tuples, and
+    each tabular record is yielded along with the stream to which it belongs.
+    """
+    for block in gff3_blocks(gff3):
+        for blockfunc, outstream in descriptors:
+            for fields in blockfunc(block):
+                yield outstream, fields
 
 
 if __name__ == '__main__':
@@ -534,98 +587,62 @@ if __name__ == '__main__':
                         help='compute intron statistics')
     args = parser.parse_args()
 
-    # Process iLoci
-    if args.iloci:
-        a = args.iloci
-        with open(a[0], 'r') as gff, \
-                open(a[1], 'r') as fa,  \
-                open(a[2], 'w') as out:
-            header = ['Species', 'LocusId', 'SeqID', 'LocusPos', 'Length',
-                      'EffectiveLength', 'GCContent', 'GCSkew', 'NContent',
-                      'LocusClass', 'GeneCount', 'SeqUnannot',
-                      'FlankGeneOrient']
-            print('\t'.join(header), file=out)
-            for fields in ilocus_desc(gff, fa):
-                fields = [args.species] + fields
-                print('\t'.join(fields), file=out)
-
-    # Process miLoci
-    if args.miloci:
-        a = args.miloci
-        with open(a[0], 'r') as gff, \
-                open(a[1], 'r') as fa,  \
-                open(a[2], 'w') as out:
-            header = ['Species', 'LocusId', 'SeqID', 'LocusPos', 'Length',
-                      'EffectiveLength', 'GCContent', 'GCSkew', 'NContent',
-                      'LocusClass', 'GeneCount', 'SeqUnannot',
-                      'FlankGeneOrient']
-            print('\t'.join(header), file=out)
-            for fields in ilocus_desc(gff, fa, miloci=True):
-                fields = [args.species] + fields
-                print('\t'.join(fields), file=out)
-
-    # Process pre-mRNAs
-    if args.prnas:
-        a = args.prnas
-        with open(a[0], 'r') as gff, \
-                open(a[1], 'r') as fa,  \
-                open(a[2], 'w') as out:
-            header = ['Species', 'Accession', 'Length', 'GCContent',
-                      'GCSkew', 'NContent', 'ExonCount', 'IntronCount',
-                      '5pUTRlen', '3pUTRlen']
-            print('\t'.join(header), file=out)
-            for fields in premrna_desc(gff, fa):
-                fields = [args.species] + fields
-                print('\t'.join(fields), file=out)
-
-    # Process mature mRNAs
-    if args.mrnas:
-        a = args.mrnas
-        with open(a[0], 'r') as gff, \
-                open(a[1], 'r') as fa, \
-                open(a[2], 'w') as out:
-            header = ['Species', 'Accession', 'Length', 'GCContent',
-                      'GCSkew', 'NContent']
-            print('\t'.join(header), file=out)
-            for fields in mrna_desc(gff, fa):
-                fields = [args.species] + fields
-                print('\t'.join(fields), file=out)
-
-    # Process coding sequences
-    if args.cds:
-        a = args.cds
-        with open(a[0], 'r') as gff, \
-                open(a[1], 'r') as fa, \
-                open(a[2], 'w') as out:
-            header = ['Species', 'MrnaAcc', 'Length', 'GCContent',
-                      'GCSkew', 'NContent']
-            print('\t'.join(header), file=out)
-            for fields in cds_desc(gff, fa):
-                fields = [args.species] + fields
-                print('\t'.join(fields), file=out)
-
-    # Process exons
-    if args.exons:
-        a = args.exons
-        with open(a[0], 'r') as gff, \
-                open(a[1], 'r') as fa, \
-                open(a[2], 'w') as out:
-            header = ['Species', 'ExonPos', 'MrnaAcc', 'Length', 'GCContent',
-                      'GCSkew', 'NContent', 'Context', 'Phase', 'Remainder']
-            print('\t'.join(header), file=out)
-            for fields in exon_desc(gff, fa):
-                fields = [args.species] + fields
-                print('\t'.join(fields), file=out)
-
-    # Process introns
-    if args.introns:
-        a = args.introns
-        with open(a[0], 'r') as gff, \
-                open(a[1], 'r') as fa, \
-                open(a[2], 'w') as out:
-            header = ['Species', 'IntronPos', 'MrnaAcc', 'Length', 'GCContent',
-                      'GCSkew', 'NContent', 'Context']
-            print('\t'.join(header), file=out)
-            for fields in intron_desc(gff, fa):
-                fields = [args.species] + fields
-                print('\t'.join(fields), file=out)
+    headers = {
+        'iloci': ['Species', 'LocusId', 'SeqID', 'LocusPos', 'Length',
+                  'EffectiveLength', 'GCContent', 'GCSkew', 'NContent',
+                  'LocusClass', 'GeneCount', 'SeqUnannot', 'FlankGeneOrient'],
+        'prnas': ['Species', 'Accession', 'Length', 'GCContent', 'GCSkew',
+                  'NContent', 'ExonCount', 'IntronCount', '5pUTRlen',
+                  '3pUTRlen'],
+        'mrnas': ['Species', 'Accession', 'Length', 'GCContent', 'GCSkew',
+                  'NContent'],
+        'cds': ['Species', 'MrnaAcc', 'Length', 'GCContent', 'GCSkew',
+                'NContent'],
+        'exons': ['Species', 'ExonPos', 'MrnaAcc', 'Length', 'GCContent',
+                  'GCSkew', 'NContent', 'Context', 'Phase', 'Remainder'],
+        'introns': ['Species', 'IntronPos', 'MrnaAcc', 'Length', 'GCContent',
+                    'GCSkew', 'NContent', 'Context'],
+    }
+    headers['miloci'] = headers['iloci']
+
+    # Group tasks by GFF3 file, so that each file is read only once
+    gff3files = list()
+    tasks = dict()
+    for feattype in ['iloci', 'miloci', 'prnas', 'mrnas', 'cds', 'exons',
+                     'introns']:
+        taskargs = getattr(args, feattype)
+        if taskargs is None:
+            continue
+        gff3file, fastafile, outfile = taskargs
+        if gff3file not in tasks:
+            gff3files.append(gff3file)
+            tasks[gff3file] = list()
+        tasks[gff3file].append((feattype, fastafile, outfile))
+
+    for gff3file in gff3files:
+        fastas = list()
+        outstreams = list()
+        descriptors = list()
+        try:
+            for feattype, fastafile, outfile in tasks[gff3file]:
+                keyfunc = None
+                if feattype in ['exons', 'introns']:
+                    keyfunc = defline_position
+                unique = feattype in ['iloci', 'miloci']
+                fasta = genhub.fasta.IndexedFasta(fastafile, keyfunc,
+                                                  unique=unique)
+                fastas.append(fasta)
+                outstream = open(outfile, 'w')
+                outstreams.append(outstream)
+                print('\t'.join(headers[feattype]), file=outstream)
+                blockfunc = block_descriptor(feattype, fasta)
+                descriptors.append((blockfunc, outstream))
+            with open(gff3file, 'r') as gff3:
+                for outstream, fields in describe(gff3, descriptors):
+                    fields = [args.species] + fields
+                    print('\t'.join(fields), file=outstream)
+        finally:
+            for fasta in fastas:
+                fasta.close()
+            for outstream in outstreams:
+                outstream.close()
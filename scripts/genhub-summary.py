@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#
+# -----------------------------------------------------------------------------
+# Copyright (c) 2016   Daniel Standage <daniel.standage@gmail.com>
+# Copyright (c) 2016   Indiana University
+#
+# This file is part of genhub (http://github.com/standage/genhub) and is
+# licensed under the BSD 3-clause license: see LICENSE.txt.
+# -----------------------------------------------------------------------------
+
+"""
+Compute several summaries of the specified genomes in a single run.
+
+The statistics tables of each genome are loaded only once for all summaries,
+and genomes are processed in parallel. Each summary is written to its own file:
+for example, with the default prefix and output format, the iLocus summary is
+written to `GenHub.ilocus.tsv`.
+"""
+
+from __future__ import print_function
+import genhub
+
+
+def cli():
+    """Define the command-line interface of the program."""
+    desc = 'Summarize iLocus content and compactness of the specified genomes'
+    parser = genhub.summary.cli(desc, compact=True)
+    parser.add_argument('-o', '--outprefix', metavar='PFX', default='GenHub',
+                        help='prefix for output files; default is "GenHub"')
+    parser.add_argument('--summary', metavar='S', nargs='+',
+                        choices=genhub.summary.summaries,
+                        default=genhub.summary.summaries,
+                        help='summaries to compute; by default, all of "%s"; '
+                        'the compactness summary is always written in "tsv" '
+                        'format' % '", "'.join(genhub.summary.summaries))
+    return parser
+
+
+def main(args):
+    dbs = genhub.summary.genomes(args)
+    opts = genhub.summary.options(args)
+    rows = genhub.summary.run(dbs, args.summary, args.outfmt, opts,
+                              numprocs=args.numprocs)
+    for name in args.summary:
+        fmt = 'tsv' if name == 'compact' else args.outfmt
+        outfile = '%s.%s.%s' % (args.outprefix, name, fmt)
+        with open(outfile, 'w') as outstream:
+            genhub.summary.write(name, rows[name], args.outfmt, outstream)
+
+
+if __name__ == '__main__':
+    main(args=cli().parse_args())
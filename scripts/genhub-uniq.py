@@ -10,9 +10,7 @@
 
 from __future__ import print_function
 import sys
-lines = set()
-for line in sys.stdin:
-    if line in lines:
-        continue
-    lines.add(line)
-    print(line, end='')
+import genhub
+
+for line in genhub.gff3.uniq(line.rstrip('\n') for line in sys.stdin):
+    print(line)
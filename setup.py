@@ -35,6 +35,7 @@ setuptools.setup(name='genhub',
                           'scripts/genhub-milocus-summary.py',
                           'scripts/genhub-stats.py',
                           'scripts/genhub-compact.py',
+                          'scripts/genhub-summary.py',
                           'scripts/genhub-monitor-refseq.py',
                           'scripts/genhub-uniq.py'],
                  install_requires=['pyyaml', 'pycurl'],